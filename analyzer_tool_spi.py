@@ -20,12 +20,14 @@ This file is part of pyLogicSniffer.
 
 import wx
 import numpy as np
-import itertools, time
+import time
 import analyzer_tools
 
 tool_menu_string = '&SPI'	# recommended menu string
 tool_title_string = 'SPI'	# recommended title string
 
+SPI_ENABLE, SPI_DATA, SPI_DISABLE, SPI_END = range (4)	# event kinds, in the order they're logged within a sample
+
 class AnalyzerDialog (wx.Dialog):
 	'''Edit settings for SPI tool.'''
 	def __init__ (self, parent, settings=None):
@@ -106,25 +108,21 @@ class SpiPinValidator (analyzer_tools.SimpleValidator):
 class AnalyzerPanel (wx.ScrolledWindow):
 	'''Display SPI tool analysis.'''
 	spi_settings = None
+	column_labels = ('#', 'μSeconds', 'Status', 'MOSI', 'MISO')
+	status_labels = {SPI_ENABLE:'Enable', SPI_DATA:'', SPI_DISABLE:'Disable', SPI_END:'End'}
 	def __init__ (self, parent, settings, tracedata):
 		wx.ScrolledWindow.__init__ (self, parent, wx.ID_ANY)
 		self.settings = settings
 		self.tracedata = tracedata
+		self.annotations = []	# (start, end, label, channel) for the trace display
 		
+		self.Analyze()
 		dg = self.display_grid = wx.grid.Grid (self, -1)
-		dg.CreateGrid (0, 5)
+		self.table = analyzer_tools.show_events (dg, self.events, self.column_labels, self._cell)
 		dg.SetRowLabelSize (0)
-		dg.SetColLabelValue (0, '#')
-		dg.SetColLabelValue (1, 'μSeconds')
-		dg.SetColLabelValue (2, 'Status')
-		dg.SetColLabelValue (3, 'MOSI')
-		dg.SetColLabelValue (4, 'MISO')
 		dg.SetColFormatNumber (0)
 		dg.SetColFormatFloat (1)
 		
-		self.Analyze()
-		dg.AutoSize()
-		
 		ts = wx.BoxSizer (wx.VERTICAL)
 		ts.Add (dg, 1, wx.EXPAND)
 		self.SetAutoLayout (True)
@@ -133,93 +131,34 @@ class AnalyzerPanel (wx.ScrolledWindow):
 		
 	def Analyze (self):
 		settings = self.settings
-		pol = (settings['mode'] >> 1) & 1	# clock polarity
-		pha = settings['mode'] & 1			# sample/setup phase
 		channel_data = self.tracedata.channel_data
-		spi_data = itertools.izip (
-			itertools.count(),
-			channel_data (settings['nss']), 
-			channel_data (settings['sck']), 
-			channel_data (settings['miso']),
-			channel_data (settings['mosi'])
-			)
-		stime, oldnss, oldsck, oldmiso, oldmosi = spi_data.next()
-		mosi_data = miso_data = 0
-		miso_bitcount = mosi_bitcount = 0
-		for stime, nss, sck, miso, mosi in spi_data:
-			if oldnss > nss:	# SPI just became active
-				self._log_nss_enable (stime)
-				mosi_data = miso_data = 0
-				miso_bitcount = mosi_bitcount = 0
-			elif oldnss < nss:	# SPI just became inactive
-				self._log_nss_disable (stime, mosi_bitcount, mosi_data, miso_bitcount,miso_data)
-			if not nss:	# SPI is active
-				if oldsck^pol < sck^pol :	# leading clock edge
-					if pha:	# setup output level
-						mosi_data = (mosi_data << 1) | bool (mosi)
-						mosi_bitcount += 1
-					else:	# sample input level
-						miso_data = (miso_data << 1) | bool (miso)
-						miso_bitcount += 1
-				elif oldsck^pol > sck^pol:	# trailing clock edge
-					if pha:	# sample input level
-						miso_data = (miso_data << 1) | bool (miso)
-						miso_bitcount += 1
-					else:	# setup output level
-						mosi_data = (mosi_data << 1) | bool (mosi)
-						mosi_bitcount += 1
-				if miso_bitcount > 7:
-					self._log_data_byte (stime, None, miso_data)
-					miso_data = 0
-					miso_bitcount = 0
-				if mosi_bitcount > 7:
-					self._log_data_byte (stime, mosi_data, None)
-					mosi_data = 0
-					mosi_bitcount = 0
-				
-			oldnss, oldsck, oldmiso, oldmosi = nss, sck, miso, mosi
-			
-		# finished examining the trace data ..	
-		if miso_bitcount > 0 or mosi_bitcount > 0:
-			dg, r = self._new_row()
-			self._log_header (dg, r, stime)
-			dg.SetCellValue (r, 2, 'End')
-			if mosi_bitcount > 0:
-				dg.SetCellValue (r, 3, partial_bits (mosi_bitcount, mosi_data))
-			if miso_bitcount > 0:
-				dg.SetCellValue (r, 4, partial_bits (miso_bitcount, miso_data))
+		self.events = decode_spi (channel_data (settings['nss']), channel_data (settings['sck'])
+				, channel_data (settings['mosi']), channel_data (settings['miso']), settings['mode'])
+		nss, mosi_pin, miso_pin = settings['nss'], settings['mosi'], settings['miso']
+		annotations = self.annotations
+		for sample, start, kind, mosi, miso, mosi_bits, miso_bits in self.events.tolist():
+			if kind == SPI_DATA:
+				if mosi_bits:
+					annotations.append ((start, sample, '0x%02x' % (mosi,), mosi_pin))
+				if miso_bits:
+					annotations.append ((start, sample, '0x%02x' % (miso,), miso_pin))
+			elif kind != SPI_END:
+				annotations.append ((sample, sample, self.status_labels[kind], nss))
 			
-	def _log_header (self, dg, r, sample):
-		dg.SetCellValue (r, 0, str (sample))
-		dg.SetCellValue (r, 1, str (self._sample_time (sample)*1e6))
-		
-	def _new_row (self):
-		dg = self.display_grid
-		r = dg.GetNumberRows()
-		dg.AppendRows (1)
-		return dg, r
-			
-	def _log_nss_disable (self, sample, mosi_bitcount, mosi_data, miso_bitcount, miso_data):
-		dg, r = self._new_row ()
-		self._log_header (dg, r, sample)
-		dg.SetCellValue (r, 2, 'Disable')
-		if mosi_bitcount > 0:
-			dg.SetCellValue (r, 3, partial_bits (mosi_bitcount, mosi_data))
-		if miso_bitcount > 0:
-			dg.SetCellValue (r, 4, partial_bits (miso_bitcount, miso_data))
-			
-	def _log_nss_enable (self, sample):
-		dg, r = self._new_row ()
-		self._log_header (dg, r, sample)
-		dg.SetCellValue (r, 2, 'Enable')
-		
-	def _log_data_byte (self, sample, mosi, miso):
-		dg, r = self._new_row ()
-		self._log_header (dg, r, sample)
-		if mosi is not None:
-			dg.SetCellValue (r, 3, '0x%02x' %  (mosi,))
-		if miso is not None:
-			dg.SetCellValue (r, 4, '0x%02x' % (miso,))
+	def _cell (self, event, col):
+		'''Return the text for one column of an event's row in the grid.'''
+		if col == 0:
+			return str (event['sample'])
+		if col == 1:
+			return str (self._sample_time (event['sample'])*1e6)
+		if col == 2:
+			return self.status_labels[event['kind']]
+		value, bits = (event['mosi'], event['mosi_bits']) if col == 3 else (event['miso'], event['miso_bits'])
+		if not bits:
+			return ''
+		if event['kind'] == SPI_DATA:
+			return '0x%02x' % (value,)
+		return partial_bits (bits, value)
 		
 	def _sample_time (self, sample):
 		d = self.tracedata
@@ -252,6 +191,101 @@ def partial_bits (bitcount, data, msbfirst=True):
 	else:
 		return 'x'*(8-bitcount) + ''.join(s)
 
+
+#===========================================================	
+# Decoding works on whole arrays at once: the samples where /SS falls and
+# rises and the clock edges inside the active windows are found with numpy,
+# the data lines are read at all those edges in one step, and each run of
+# 8 bits is packed into a byte with a dot product.  Bit counts start over
+# at every /SS enable, as they do in a slave.
+
+spi_event_dtype = np.dtype ([('sample', np.int64), ('start', np.int64), ('kind', np.uint8)
+		, ('mosi', np.int32), ('miso', np.int32), ('mosi_bits', np.uint8), ('miso_bits', np.uint8)])
+BYTE_WEIGHTS = 1 << np.arange (7, -1, -1)
+
+def _shifted_bits (edges, line, enables):
+	'''Return (segment, position, bits) for the bits a data line shifts at the given clock edges.
+
+	segment counts the /SS enables at or before each edge; position is the
+	bit's place in its segment.'''
+	segment = np.searchsorted (enables, edges, 'right')
+	position = np.arange (len (edges)) - np.searchsorted (segment, segment, 'left')
+	return segment, position, line[edges]
+
+def _whole_bytes (edges, position, bits):
+	'''Return (start, end, value) arrays for the bytes completed by the 8th bit of each group.'''
+	last = np.flatnonzero (position % 8 == 7)
+	value = bits[(last - 7)[:,np.newaxis] + np.arange (8)].dot (BYTE_WEIGHTS)
+	return edges[last - 7], edges[last], value
+
+def _partial_bytes (samples, edges, segment, position, bits, enables):
+	'''Return (bitcount, value) arrays for the bits shifted, but not yet logged as a byte, by each of samples.'''
+	count = np.zeros (len (samples), dtype=np.int64)
+	if len (edges) == 0:
+		return count, count.copy()
+	last = np.searchsorted (edges, samples, 'right') - 1	# latest edge at or before each sample
+	current = last >= 0
+	current[current] = segment[last[current]] == np.searchsorted (enables, samples[current], 'right')
+	count[current] = (position[last[current]] + 1) % 8
+	recent = bits[np.clip (last[:,np.newaxis] - np.arange (8), 0, None)]	# latest bit first
+	value = (recent & (np.arange (8) < count[:,np.newaxis])).dot (1 << np.arange (8))
+	return count, value
+
+def decode_spi (nss, sck, mosi, miso, mode):
+	'''Decode SPI traffic from boolean sample arrays, returning events as an array of spi_event_dtype.
+
+	Events are SPI_ENABLE and SPI_DISABLE where /SS falls and rises,
+	SPI_DATA at the edge shifting the 8th bit of a byte in either
+	direction, with start at the edge of its 1st bit, and SPI_END at the
+	last sample if bits are left over.  Disable and end events carry the
+	bits shifted since the last whole byte, with their counts.'''
+	nss = np.asarray (nss, dtype=bool)
+	n = len (nss)
+	if n < 2:
+		return np.zeros (0, dtype=spi_event_dtype)
+	mosi = np.asarray (mosi, dtype=bool)
+	miso = np.asarray (miso, dtype=bool)
+	pol = (mode >> 1) & 1	# clock polarity
+	pha = mode & 1			# sample/setup phase
+	enables = np.flatnonzero (nss[:-1] & ~nss[1:]) + 1
+	disables = np.flatnonzero (~nss[:-1] & nss[1:]) + 1
+	clock = np.asarray (sck, dtype=bool) ^ bool (pol ^ pha)	# rises where MISO is sampled, falls where MOSI is set up
+	miso_edges = np.flatnonzero (~clock[:-1] & clock[1:]) + 1
+	mosi_edges = np.flatnonzero (clock[:-1] & ~clock[1:]) + 1
+	miso_edges = miso_edges[~nss[miso_edges]]	# only while SPI is active
+	mosi_edges = mosi_edges[~nss[mosi_edges]]
+	
+	mosi_segment, mosi_position, mosi_bits = _shifted_bits (mosi_edges, mosi, enables)
+	miso_segment, miso_position, miso_bits = _shifted_bits (miso_edges, miso, enables)
+	mosi_start, mosi_end, mosi_bytes = _whole_bytes (mosi_edges, mosi_position, mosi_bits)
+	miso_start, miso_end, miso_bytes = _whole_bytes (miso_edges, miso_position, miso_bits)
+	partial_at = np.append (disables, n - 1)
+	mosi_count, mosi_partial = _partial_bytes (partial_at, mosi_edges, mosi_segment, mosi_position, mosi_bits, enables)
+	miso_count, miso_partial = _partial_bytes (partial_at, miso_edges, miso_segment, miso_position, miso_bits, enables)
+	ended = (mosi_count[-1] > 0) or (miso_count[-1] > 0)
+	
+	nd = len (disables)
+	sizes = (len (enables), len (mosi_bytes), len (miso_bytes), nd, int (ended))
+	events = np.zeros (sum (sizes), dtype=spi_event_dtype)
+	parts = np.split (events, np.cumsum (sizes)[:-1])
+	parts[0]['sample'] = enables
+	parts[0]['kind'] = SPI_ENABLE
+	for part, start, end, value, field in ((parts[1], mosi_start, mosi_end, mosi_bytes, 'mosi'), (parts[2], miso_start, miso_end, miso_bytes, 'miso')):
+		part['sample'] = end
+		part['start'] = start
+		part['kind'] = SPI_DATA
+		part[field] = value
+		part[field + '_bits'] = 8
+	for part, kind, rows in ((parts[3], SPI_DISABLE, slice (0, nd)), (parts[4], SPI_END, slice (nd, nd + int (ended)))):
+		part['sample'] = partial_at[rows]
+		part['start'] = partial_at[rows]
+		part['kind'] = kind
+		part['mosi'] = mosi_partial[rows]
+		part['miso'] = miso_partial[rows]
+		part['mosi_bits'] = mosi_count[rows]
+		part['miso_bits'] = miso_count[rows]
+	return events[np.lexsort ((events['kind'], events['sample']))]
+	
 		
 # Test jig ...
 if __name__ == '__main__':
@@ -0,0 +1,71 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer SPI analysis tool.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import unittest
+import numpy as np
+import analyzer_tool_spi as M
+
+def spi_frame (mosi_bytes, miso_bytes, extra_bits=0, idle=4):
+	'''Return (nss, sck, mosi, miso) for a mode 0 transfer, 4 samples per clock cycle.'''
+	nss, sck, mosi, miso = [], [], [], []
+	def add (s, c, o, i):
+		nss.append (s); sck.append (c); mosi.append (o); miso.append (i)
+	for k in xrange (idle):
+		add (1, 0, 0, 0)
+	bits = [((o >> b) & 1, (i >> b) & 1) for o, i in zip (mosi_bytes, miso_bytes) for b in xrange (7, -1, -1)]
+	bits += [(1, 0)] * extra_bits
+	for o, i in bits:
+		for c in (0, 1, 1, 0):	# both edges inside the bit
+			add (0, c, o, i)
+	for k in xrange (idle):
+		add (1, 0, 0, 0)
+	return [np.array (x, dtype=bool) for x in (nss, sck, mosi, miso)]
+
+
+class TestDecodeSpi (unittest.TestCase):
+	def test0 (self):
+		'''Test whole bytes between enable and disable.'''
+		nss, sck, mosi, miso = spi_frame ([0xA5, 0x3C], [0x0F, 0xF0])
+		events = M.decode_spi (nss, sck, mosi, miso, 0)
+		self.assertEqual (list (events['kind']), [M.SPI_ENABLE, M.SPI_DATA, M.SPI_DATA, M.SPI_DATA, M.SPI_DATA, M.SPI_DISABLE])
+		data = events[events['kind'] == M.SPI_DATA]
+		self.assertEqual ([v for v, b in zip (data['mosi'], data['mosi_bits']) if b], [0xA5, 0x3C])
+		self.assertEqual ([v for v, b in zip (data['miso'], data['miso_bits']) if b], [0x0F, 0xF0])
+		self.assertEqual (events['sample'][0], 4)
+		self.assertEqual (events['sample'][-1], 4 + 16*4)
+
+	def test1 (self):
+		'''Test bits left over at disable and at the end.'''
+		nss, sck, mosi, miso = spi_frame ([0x81], [0x00], extra_bits=3)
+		events = M.decode_spi (nss, sck, mosi, miso, 0)
+		self.assertEqual (list (events['kind']), [M.SPI_ENABLE, M.SPI_DATA, M.SPI_DATA, M.SPI_DISABLE, M.SPI_END])
+		for e in events[-2:]:
+			self.assertEqual ((e['mosi_bits'], e['mosi']), (3, 7))
+			self.assertEqual ((e['miso_bits'], e['miso']), (3, 0))
+		self.assertEqual (events['sample'][-1], len (nss) - 1)
+		self.assertEqual (M.partial_bits (3, 5), '101xxxxx')
+
+	def test2 (self):
+		'''Test that an idle bus gives no events.'''
+		quiet = np.ones (1000, dtype=bool)
+		self.assertEqual (len (M.decode_spi (quiet, ~quiet, quiet, quiet, 0)), 0)
+		self.assertEqual (len (M.decode_spi (quiet[:1], quiet[:1], quiet[:1], quiet[:1], 0)), 0)
+
+
+unittest.main()
@@ -19,12 +19,13 @@ This file is part of pyLogicSniffer.
 '''
 import wx
 import numpy as np
-import itertools
 import analyzer_tools
 
 tool_menu_string = '&TWI'	# recommended menu string
 tool_title_string = 'TWI'	# recommended title string
 
+TWI_START, TWI_STOP, TWI_ADDR, TWI_DATA, TWI_ACK, TWI_NAK, TWI_GLITCH, TWI_END = range (8)	# event kinds
+
 
 class AnalyzerDialog (wx.Dialog):
 	'''Edit settings for TWI tool.'''
@@ -69,24 +70,22 @@ class SpiPinValidator (analyzer_tools.SimpleValidator):
 class AnalyzerPanel (wx.ScrolledWindow):
 	'''Display TWI tool analysis.'''
 	spi_settings = None
+	column_labels = ('#', 'μSeconds', 'Status', 'Data')
+	status_labels = {TWI_START:'Start', TWI_STOP:'Stop', TWI_ADDR:'Addr', TWI_DATA:''
+			, TWI_ACK:'ACK', TWI_NAK:'NAK', TWI_GLITCH:'Glitch', TWI_END:'End'}
 	def __init__ (self, parent, settings, tracedata):
 		wx.ScrolledWindow.__init__ (self, parent, wx.ID_ANY)
 		self.settings = settings
 		self.tracedata = tracedata
+		self.annotations = []	# (start, end, label, channel) for the trace display
 		
+		self.Analyze()
 		dg = self.display_grid = wx.grid.Grid (self, -1)
-		dg.CreateGrid (0, 4)
+		self.table = analyzer_tools.show_events (dg, self.events, self.column_labels, self._cell)
 		dg.SetRowLabelSize (0)
-		dg.SetColLabelValue (0, '#')
-		dg.SetColLabelValue (1, 'μSeconds')
-		dg.SetColLabelValue (2, 'Status')
-		dg.SetColLabelValue (3, 'Data')
 		dg.SetColFormatNumber (0)
 		dg.SetColFormatFloat (1)
 		
-		self.Analyze()
-		dg.AutoSize()
-		
 		ts = wx.BoxSizer (wx.VERTICAL)
 		ts.Add (dg, 1, wx.EXPAND)
 		self.SetSizer (ts)
@@ -95,112 +94,34 @@ class AnalyzerPanel (wx.ScrolledWindow):
 	def Analyze (self):
 		settings = self.settings
 		channel_data = self.tracedata.channel_data
-		twi_bitstream = itertools.izip (
-			itertools.count(),
-			channel_data (settings['scl']), 
-			channel_data (settings['sda'])
-			)
-		stime, old_scl, old_sda = twi_bitstream.next()
-		data = 0
-		bitcount = 0
-		byte_count = 0
-		for stime, scl, sda in twi_bitstream:
-			if scl == old_scl and sda == old_sda:	# nothing happens
-				continue
-
-			if old_scl == scl == 1 and old_sda > sda:	# START condition
-				self._log_start (stime)
-				bitcount = byte_count = data = 0
-			elif old_scl == scl == 1 and old_sda < sda:	# STOP condition
-				if bitcount:	# data bits have been left hanging
-					c = analyzer_tools.partial_bits (bitcount, data)
-				else:
-					c = ''
-				self._log_stop (stime, c)
-				bitcount = byte_count = data = 0
-				
-			elif old_scl == scl == 0:
-				pass	# data line can change while clock is low
-				
-			elif sda == old_sda and old_scl < scl:	# data bit
-				data = (data << 1) | sda
-				bitcount += 1
-				if bitcount == 8:	# complete character
-					if byte_count == 0:
-						self._log_addr_byte (stime, data)
-					else:
-						self._log_data_byte (stime, data, bitcount)
-					byte_count += 1
-				elif bitcount == 9:	# ACK/NAK following character
-					if sda:
-						self._log_nak (stime)
-					else:
-						self._log_ack (stime)
-					data = bitcount = 0
-			elif sda == old_sda and old_scl > scl:	# falling databyte clock (between bits)
-				pass
-				
-			else:	# none of the above
-				self._log_glitch (stime)
-				
-			old_scl, old_sda = scl, sda
-			
-		# finished examining the trace data ..	
-		if bitcount > 0:	# sample ended with data transfer hanging
-			dg, r = self._new_row()
-			self._log_header (dg, r, stime)
-			dg.SetCellValue (r, 2, 'End')
-			if bitcount > 0:
-				dg.SetCellValue (r, 3, analyzer_tools.partial_bits (bitcount, data))
-			
-	def _log_header (self, dg, r, sample):
-		dg.SetCellValue (r, 0, str (sample))
-		dg.SetCellValue (r, 1, str (self._sample_time (sample)*1e6))
-		
-	def _new_header (self, sample):
-		dg = self.display_grid
-		r = dg.GetNumberRows()
-		dg.AppendRows (1)
-		dg.SetCellValue (r, 0, str (sample))
-		dg.SetCellValue (r, 1, str (self._sample_time (sample)*1e6))
-		return dg, r
-		
-	def _new_row (self):
-		dg = self.display_grid
-		r = dg.GetNumberRows()
-		dg.AppendRows (1)
-		return dg, r
-			
-	def _log_ack (self, sample):
-		dg, r = self._new_row()
-		self._log_header (dg, r, sample)
-		dg.SetCellValue (r, 2, 'ACK')
-			
-	def _log_addr_byte (self, sample, data):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 2, 'Addr')
-		dg.SetCellValue (r, 3, '0x%2x  %s' % (data>>1, 'WR'[data & 1],))
-			
-	def _log_data_byte (self, sample, data, bitcount):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 3, '0x%2x' % (data,))
-			
-	def _log_glitch (self, sample):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 2, 'Glitch')
+		self.events = decode_twi (channel_data (settings['scl']), channel_data (settings['sda']))
+		sda = settings['sda']
+		annotations = self.annotations
+		for sample, start, kind, data, bitcount in self.events.tolist():
+			if kind == TWI_ADDR:
+				annotations.append ((start, sample, 'Addr 0x%02x %s' % (data>>1, 'WR'[data & 1],), sda))
+			elif kind == TWI_DATA:
+				annotations.append ((start, sample, '0x%02x' % (data,), sda))
+			elif kind != TWI_END:
+				annotations.append ((sample, sample, self.status_labels[kind], sda))
 			
-	def _log_nak (self, sample):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 2, 'NAK')
-			
-	def _log_start (self, sample):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 2, 'Start')
-			
-	def _log_stop (self, sample, databyte):
-		dg, r = self._new_header (sample)
-		dg.SetCellValue (r, 2, 'Stop')
-		dg.SetCellValue (r, 3, databyte)
+	def _cell (self, event, col):
+		'''Return the text for one column of an event's row in the grid.'''
+		if col == 0:
+			return str (event['sample'])
+		if col == 1:
+			return str (self._sample_time (event['sample'])*1e6)
+		kind = event['kind']
+		if col == 2:
+			return self.status_labels[kind]
+		data = event['data']
+		if kind == TWI_ADDR:
+			return '0x%2x  %s' % (data>>1, 'WR'[data & 1],)
+		if kind == TWI_DATA:
+			return '0x%2x' % (data,)
+		if kind in (TWI_STOP, TWI_END) and event['bits']:	# data bits left hanging
+			return analyzer_tools.partial_bits (event['bits'], data)
+		return ''
 		
 	def _sample_time (self, sample):
 		d = self.tracedata
@@ -224,6 +145,101 @@ class AnalyzerFrame (analyzer_tools.AnalyzerFrame):
 		analyzer_tools.AnalyzerFrame.SetTitle (self, '%s - %s' % (title, tool_title_string))
 		
 		
+#===========================================================	
+# Decoding looks only at the samples where SCL or SDA changes.  Each change
+# is classified at once: SDA changing while SCL stays high is a START or
+# STOP, SCL rising with SDA steady clocks in a bit, and both changing
+# together is a glitch.  The bits between STARTs and STOPs fall into 9-bit
+# frames, 8 data bits and the ACK/NAK, so the work grows with the number of
+# edges, not the number of samples.
+
+twi_event_dtype = np.dtype ([('sample', np.int64), ('start', np.int64), ('kind', np.uint8)
+		, ('data', np.int32), ('bits', np.uint8)])
+BYTE_WEIGHTS = 1 << np.arange (7, -1, -1)
+
+def _pending_bits (position, bits, segment, last, current_segment):
+	'''Return (bitcount, data) arrays for the bits of unfinished frames.
+
+	last is the index of the latest bit before each point of interest
+	(-1 for none), and current_segment the segment each point is in;
+	bits clocked in an earlier segment don't count.'''
+	count = np.zeros (len (last), dtype=np.int64)
+	data = np.zeros (len (last), dtype=np.int64)
+	if len (bits) == 0:
+		return count, data
+	current = last >= 0
+	current[current] = segment[last[current]] == current_segment[current]
+	count[current] = (position[last[current]] + 1) % 9
+	recent = bits[np.clip (last[:,np.newaxis] - np.arange (8), 0, None)]	# latest bit first
+	data = (recent & (np.arange (8) < count[:,np.newaxis])).dot (1 << np.arange (8))
+	return count, data
+
+def decode_twi (scl, sda):
+	'''Decode TWI (I2C) traffic from boolean sample arrays, returning events as an array of twi_event_dtype.
+
+	TWI_ADDR and TWI_DATA events come at the 8th bit of a frame, with
+	start at its 1st; the first frame after a START or STOP is the
+	address.  TWI_STOP and TWI_END events carry the bits of an unfinished
+	frame, if any; there is a TWI_END at the last sample only if bits
+	were left hanging.'''
+	scl = np.asarray (scl, dtype=bool)
+	sda = np.asarray (sda, dtype=bool)
+	n = len (scl)
+	if n < 2:
+		return np.zeros (0, dtype=twi_event_dtype)
+	changes = np.flatnonzero ((scl[1:] != scl[:-1]) | (sda[1:] != sda[:-1])) + 1
+	old_scl, new_scl = scl[changes - 1], scl[changes]
+	old_sda, new_sda = sda[changes - 1], sda[changes]
+	held_high = old_scl & new_scl
+	is_start = held_high & old_sda & ~new_sda
+	is_stop = held_high & ~old_sda & new_sda
+	is_bit = ~old_scl & new_scl & (old_sda == new_sda)
+	is_glitch = (old_scl != new_scl) & (old_sda != new_sda)
+	
+	resets = np.cumsum (is_start | is_stop)	# STARTs and STOPs so far; each begins a new segment of frames
+	bit_at = np.flatnonzero (is_bit)
+	bits = new_sda[bit_at]
+	segment = resets[bit_at]
+	position = np.arange (len (bit_at)) - np.searchsorted (segment, segment, 'left')
+	bit_samples = changes[bit_at]
+	
+	last_bit = np.flatnonzero (position % 9 == 7)
+	byte_data = bits[(last_bit - 7)[:,np.newaxis] + np.arange (8)].dot (BYTE_WEIGHTS)
+	ack_bit = np.flatnonzero (position % 9 == 8)
+	stop_at = np.flatnonzero (is_stop)
+	pending_at = np.append (stop_at, len (changes))	# each STOP, then the end of the capture
+	pending_segment = np.append (resets[stop_at] - 1, resets[-1] if len (resets) else 0)
+	pending_count, pending_data = _pending_bits (position, bits, segment
+			, np.searchsorted (bit_at, pending_at) - 1, pending_segment)
+	
+	ended = int (pending_count[-1] > 0)
+	start_at = np.flatnonzero (is_start)
+	glitch_at = np.flatnonzero (is_glitch)
+	sizes = (len (start_at), len (stop_at), len (last_bit), len (ack_bit), len (glitch_at), ended)
+	events = np.zeros (sum (sizes), dtype=twi_event_dtype)
+	starts, stops, data, acks, glitches, end = np.split (events, np.cumsum (sizes)[:-1])
+	starts['sample'] = starts['start'] = changes[start_at]
+	starts['kind'] = TWI_START
+	stops['sample'] = stops['start'] = changes[stop_at]
+	stops['kind'] = TWI_STOP
+	stops['data'] = pending_data[:-1]
+	stops['bits'] = pending_count[:-1]
+	data['sample'] = bit_samples[last_bit]
+	data['start'] = bit_samples[last_bit - 7]
+	data['kind'] = np.where (position[last_bit] < 9, TWI_ADDR, TWI_DATA)
+	data['data'] = byte_data
+	data['bits'] = 8
+	acks['sample'] = acks['start'] = bit_samples[ack_bit]
+	acks['kind'] = np.where (bits[ack_bit], TWI_NAK, TWI_ACK)
+	glitches['sample'] = glitches['start'] = changes[glitch_at]
+	glitches['kind'] = TWI_GLITCH
+	end['sample'] = end['start'] = n - 1
+	end['kind'] = TWI_END
+	end['data'] = pending_data[-1:][:ended]
+	end['bits'] = pending_count[-1:][:ended]
+	return events[np.lexsort ((events['kind'], events['sample']))]
+	
+	
 #===========================================================	
 # Test jig ...
 if __name__ == '__main__':
@@ -0,0 +1,68 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer TWI analysis tool.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import unittest
+import numpy as np
+import analyzer_tool_twi as M
+
+def twi_transfer (frames, extra_bits=(), stop=True):
+	'''Return (scl, sda) for a START, 9-bit frames given as (byte, ack), any extra bits, then a STOP.
+
+	Each bit takes 4 samples: SCL falls, SDA changes, SCL rises and stays high.'''
+	scl, sda = [1, 1, 1], [1, 1, 0]	# idle, then START
+	def clock (bit):
+		scl.extend ((0, 0, 1, 1)); sda.extend ((sda[-1], bit, bit, bit))
+	for byte, ack in frames:
+		for b in xrange (7, -1, -1):
+			clock ((byte >> b) & 1)
+		clock (0 if ack else 1)
+	for bit in extra_bits:
+		clock (bit)
+	if stop:
+		scl.extend ((0, 0, 1, 1)); sda.extend ((sda[-1], 0, 0, 1))
+	return np.array (scl, dtype=bool), np.array (sda, dtype=bool)
+
+
+class TestDecodeTwi (unittest.TestCase):
+	def test0 (self):
+		'''Test an address and a data byte between START and STOP.'''
+		scl, sda = twi_transfer ([(0xA0, True), (0x5A, False)])
+		events = M.decode_twi (scl, sda)
+		self.assertEqual (list (events['kind']), [M.TWI_START, M.TWI_ADDR, M.TWI_ACK, M.TWI_DATA, M.TWI_NAK, M.TWI_STOP])
+		self.assertEqual (list (events['data'][[1, 3]]), [0xA0, 0x5A])
+		self.assertEqual (events['sample'][0], 2)
+		self.assertEqual (events['start'][1], 5)
+
+	def test1 (self):
+		'''Test bits left hanging at the end of the capture.'''
+		scl, sda = twi_transfer ([(0xA1, True)], (1, 0), stop=False)
+		events = M.decode_twi (scl, sda)
+		self.assertEqual (list (events['kind']), [M.TWI_START, M.TWI_ADDR, M.TWI_ACK, M.TWI_END])
+		self.assertEqual ((events['bits'][-1], events['data'][-1]), (2, 2))
+		self.assertEqual (events['sample'][-1], len (scl) - 1)
+
+	def test2 (self):
+		'''Test that SCL and SDA changing together is a glitch, and a quiet bus gives nothing.'''
+		events = M.decode_twi (np.array ([0, 1, 1], dtype=bool), np.array ([0, 1, 1], dtype=bool))
+		self.assertEqual (list (events['kind']), [M.TWI_GLITCH])
+		quiet = np.ones (1000, dtype=bool)
+		self.assertEqual (len (M.decode_twi (quiet, quiet)), 0)
+
+
+unittest.main()
@@ -81,6 +81,15 @@ nibble_parity = (
 	)
 def byte_parity (b):	return nibble_parity[(b>>4) & 0xF] ^ nibble_parity [b & 0xF]
 
+def ascii_text (byte):
+	'''Return a character code as UTF-8 text to show, or None if it isn't one.'''
+	try:
+		text = ASCII_ctl_chars.get (byte, chr (byte))
+		text.decode ('utf-8')
+	except (UnicodeDecodeError, ValueError):
+		return None
+	return text
+
 def GCD (n1, n2):
 	if n1 < n2:
 		n1, n2 = n2, n1
@@ -98,6 +107,83 @@ def nearest_baud (estimate):
 			baud, diff = b, d
 	return baud
 
+def run_lengths (samples):
+	'''Return (levels, lengths) arrays for the runs of equal samples in a boolean array.'''
+	samples = np.asarray (samples, dtype=bool)
+	if len (samples) == 0:
+		return np.zeros (0, dtype=bool), np.zeros (0, dtype=np.int64)
+	bounds = np.concatenate (([0], np.flatnonzero (np.diff (samples)) + 1, [len (samples)]))
+	return samples[bounds[:-1]], np.diff (bounds)
+
+BIT_TOLERANCE = 0.25	# how far, in bits, a pulse may be from a whole number of bits and still fit
+SAMPLE_TOLERANCE = 1.0	# how far, in samples, a pulse may be from a whole number of refined bit times
+LONGEST_PULSE = 12	# bits; idle stretches longer than a character say nothing about the bit time
+FIT_MARGIN = 0.15	# how much better a shorter bit time must fit to be chosen over a longer one
+RESIDUAL_MARGIN = 0.5	# samples; how much worse a longer bit time may match the pulse widths and still be chosen
+	
+def _bit_fit (widths, counts, bitwidth):
+	'''Return (share of pulses that fit, chance-corrected share, RMS error in samples, bitwidth) for a bit time.
+	
+	bitwidth is first refined over the pulses within BIT_TOLERANCE of a
+	whole number of bits; a pulse then fits if it's within
+	SAMPLE_TOLERANCE samples of a whole number of refined bits.  A short
+	bit time fits many pulses by chance, and the corrected share allows
+	for that.'''
+	bits = np.maximum (np.round (widths / bitwidth), 1)
+	near = np.abs (widths / bitwidth - bits) <= BIT_TOLERANCE
+	if near.any():
+		bitwidth = np.dot (widths[near], counts[near]) / np.dot (bits[near], counts[near])
+		bits = np.maximum (np.round (widths / bitwidth), 1)
+	tolerance = min (SAMPLE_TOLERANCE, BIT_TOLERANCE * bitwidth)
+	error = np.minimum (np.abs (widths - bits * bitwidth), tolerance)
+	total = float (counts.sum())
+	share = counts[error < tolerance].sum() / total
+	chance = min (0.99, 2 * tolerance / bitwidth)
+	return share, (share - chance) / (1 - chance), np.sqrt (np.dot (error * error, counts) / total), bitwidth
+	
+def estimate_bitwidth (samples):
+	'''Estimate the samples per bit of a serial line, returning (bitwidth, confidence).
+	
+	Pulses on the line are whole numbers of bits long, so the bit time
+	is a common divisor of the pulse widths.  Each width that is common
+	on the line, or covers a fair share of its time, is tried as up to
+	LONGEST_PULSE bits.  Of the bit times that fit nearly as many pulses
+	as the best, allowing for chance fits, and match the widths nearly
+	as closely, the longest is taken: its fractions fit as well, and
+	glitch fragments too.  High pulses more than LONGEST_PULSE times the
+	shortest common low pulse are idle time, and left out.  confidence
+	is the share of the other pulses, glitches included, that fit the
+	bit time returned: 0 to 1.  bitwidth is None if the line never went
+	low between the ends of the capture.'''
+	levels, lengths = run_lengths (samples)
+	levels, pulses = levels[1:-1], lengths[1:-1]	# the first and last runs are cut off by the capture
+	if levels.all():
+		return None, 0.0
+	low = np.bincount (pulses[~levels], minlength=pulses.max() + 1)
+	high = np.bincount (pulses[levels], minlength=pulses.max() + 1)
+	low_time = low * np.arange (len (low))
+	shortest_low = np.argmax (low_time >= 0.1 * low_time.max())	# glitches are short, so they cover little time
+	high[LONGEST_PULSE * shortest_low + 1:] = 0
+	counts = low + high
+	widths = np.flatnonzero (counts)
+	counts = counts[widths]
+	widths = widths.astype (np.float64)
+	time_share = widths * counts
+	tried = []
+	for common in widths[(counts >= 0.1 * counts.max()) | (time_share >= 0.1 * time_share.max())]:
+		near = np.abs (widths - common) <= max (1.0, common / 8)
+		base = np.dot (widths[near], counts[near]) / counts[near].sum()
+		for d in xrange (1, LONGEST_PULSE + 1):
+			if base / d < 2:
+				break
+			tried.append (_bit_fit (widths, counts, base / d))
+	best = max (score for share, score, error, bitwidth in tried)
+	tried = [(error, bitwidth) for share, score, error, bitwidth in tried if score >= best - FIT_MARGIN]
+	least_error = min (tried)[0]
+	bitwidth = max (bitwidth for error, bitwidth in tried if error <= least_error + RESIDUAL_MARGIN)
+	confidence, score, error, bitwidth = _bit_fit (widths, counts, bitwidth)
+	return bitwidth, confidence
+
 def baud_difference (estimate, official=None):
 	'''Return string describing the difference between estimated and official baud.'''
 	if official is None:
@@ -150,6 +236,101 @@ def character_score (samples, mask, val, (parity, length, stops), bitwidth):
 	result = sum (matches * mask)		# score only significant sample bits
 	return result
 
+def _candidate_starts (samples, width, resume):
+	'''Return the falling edges a template width wide is tried at, each search resuming resume samples after the last.'''
+	n = len (samples)
+	falling = np.flatnonzero (samples[:-1] & ~samples[1:]) + 1
+	falling = falling[falling < n - width]
+	following = np.searchsorted (falling, falling + resume)
+	chosen = []
+	i = 0
+	while i < len (falling):
+		chosen.append (i)
+		i = following[i]
+	return falling[chosen]
+	
+def template_scores (samples, bitwidth, templates=character_templates):
+	'''Return a dict relating character formats to their mean character_score, per significant sample.
+	
+	For each format, characters are tried at falling edges, resuming the
+	search from the middle of the last stop bit, as character_score would
+	be applied one at a time.  Formats sharing a width share their
+	candidates, and all the candidates are scored against every format
+	at once.  Formats with no candidates are left out.'''
+	data = np.asarray (samples, dtype=bool)
+	by_width = collections.defaultdict (list)
+	for k, v in templates.items():
+		mask, val = expand_mask_val (bitwidth, v)
+		by_width[len (mask)].append ((k, mask, val))
+	scores = {}
+	for width, formats in by_width.items():
+		if width >= len (data):
+			continue
+		starts = _candidate_starts (data, width, width - bitwidth/2)
+		if len (starts) == 0:
+			continue
+		windows = np.lib.stride_tricks.as_strided (data, shape=(len (data) - width + 1, width)
+				, strides=(data.strides[0], data.strides[0]))[starts]	# a row of samples for each candidate
+		for (parity, length, stop), mask, val in formats:
+			significant = np.flatnonzero (mask)	# start, parity and stop samples; data samples count only toward parity
+			expected = np.repeat (val[significant][np.newaxis].astype (bool), len (starts), axis=0)
+			if parity:	# the parity bit expected follows from the data bits received
+				parx = (length + 1)*bitwidth
+				folded = windows[:, bitwidth:parx].reshape ((len (starts), length, bitwidth)).sum (axis=1) & 1
+				expected[:, bitwidth:2*bitwidth] ^= folded.astype (bool)	# the parity bit follows the start bit among the significant samples
+			char_scores = ((windows[:, significant] == expected) * 2 - 1).sum (axis=1)
+			sig_bits = float (len (significant))
+			scores[(parity, length, stop)] = np.cumsum (char_scores / sig_bits)[-1] / len (starts)	# summed in order, as one at a time
+	return scores
+	
+uart_event_dtype = np.dtype ([('sample', np.int64), ('end', np.int64), ('data', np.int32), ('parity_error', bool)])
+
+def _window_all (cumulative, first, length):
+	'''Tell, for each offset in first, whether a window of length samples has none counted by cumulative.'''
+	if length <= 0:
+		return np.ones (len (first), dtype=bool)
+	return cumulative[first + length] == cumulative[first]
+
+def decode_uart (samples, bitwidth, parity, length, stop):
+	'''Decode UART characters from a boolean sample array, returning them as an array of uart_event_dtype.
+
+	bitwidth is the number of samples per bit.  A character can start at
+	any sample where the start bit is low and the stop bits are high, 2
+	samples in from each edge; the scan takes the first such place, then
+	carries on after that character's stop bits.  Data bits are read at
+	their centres, least significant first.'''
+	data = np.asarray (samples, dtype=bool)
+	w = int (bitwidth)
+	plength = length + (parity != 0)
+	char_width = (1 + plength + stop) * w
+	offsets = np.arange (max (0, len (data) - char_width))	# every place a whole character fits
+	if len (offsets) == 0:
+		return np.zeros (0, dtype=uart_event_dtype)
+	highs = np.concatenate (([0], np.cumsum (data)))
+	lows = np.arange (len (data) + 1) - highs
+	first_stop = (1 + plength) * w
+	valid = offsets[_window_all (highs, offsets, w - 2)]	# a low start bit
+	valid = valid[_window_all (lows, valid + first_stop + 2, stop*w - 4)]	# and high stop bits
+	
+	# Characters can't overlap, so follow the chain from each one to the next valid place after it.
+	following = np.searchsorted (valid, valid + char_width)
+	chosen = []
+	i = 0
+	while i < len (valid):
+		chosen.append (i)
+		i = following[i]
+	starts = valid[chosen]
+	
+	bits = data[starts[:,np.newaxis] + (int ((w*3) / 2) + w * np.arange (length))]	# every bit centre of every character
+	events = np.zeros (len (starts), dtype=uart_event_dtype)
+	events['sample'] = starts
+	events['end'] = starts + char_width - 1
+	events['data'] = bits.dot (1 << np.arange (length))
+	if parity:
+		received = data[starts + (1 + length)*w + w/2]
+		events['parity_error'] = (bits.sum (axis=1) & 1).astype (bool) != (received ^ (parity == 2))
+	return events
+
 #===========================================================
 class AnalyzerDialog (wx.Dialog):
 	'''Edit settings for UART tool.'''
@@ -249,24 +430,22 @@ class PinValidator (analyzer_tools.SimpleValidator):
 #===========================================================	
 class AnalyzerPanel (wx.ScrolledWindow):
 	'''Display UART analysis.'''
+	column_labels = ('#', 'μSeconds', 'Status', 'hex', 'ASCII')
 	def __init__ (self, parent, settings, tracedata):
 		wx.ScrolledWindow.__init__ (self, parent, wx.ID_ANY)
 		self.settings = settings
 		self.tracedata = tracedata
+		self.annotations = []	# (start, end, label, channel) for the trace display
 		channel = self.settings['pin']
 		self.serial_data = self.tracedata.channel_data (channel)
 		
+		self.Analyze()
 		dg = self.display_grid = wx.grid.Grid (self, -1)
-		dg.CreateGrid (0, 5)
+		self.table = analyzer_tools.show_events (dg, self.events, self.column_labels, self._cell)
 		dg.SetRowLabelSize (0)
-		for i, label in enumerate (('#', 'μSeconds', 'Status', 'hex', 'ASCII')):
-			dg.SetColLabelValue (i, label)
 		dg.SetColFormatNumber (0)
 		dg.SetColFormatFloat (1)
 		
-		self.Analyze()
-		dg.AutoSize()
-		
 		ts = wx.BoxSizer (wx.VERTICAL)
 		ts.Add (dg, 1, wx.EXPAND)
 		self.SetSizer (ts)
@@ -284,135 +463,53 @@ class AnalyzerPanel (wx.ScrolledWindow):
 		character_length = self.settings['length']
 		stop_bits = self.settings['stop']
 		samples_per_bit = self.tracedata.frequency / self.settings['baud']
-		samples_per_char = (1 + character_length + (parity!= 0) + stop_bits) * samples_per_bit
 		
-		data = self.serial_data
-		offset = 0
-		while offset+samples_per_char < len (data):
-			c_p = self._match_character (data[offset:], parity, character_length, stop_bits)
-			if c_p is not None:
-				c, p = c_p
-				if p is not None and parity== 2:
-					p ^= 1
-				self._log_data_byte (offset, c, p)
-				offset += samples_per_char
-			else:
-				offset += 1
+		self.events = decode_uart (self.serial_data, samples_per_bit, parity, character_length, stop_bits)
+		pin = self.settings['pin']
+		for sample, end, byte, parity_error in self.events.tolist():
+			label = '0x%02x' % (byte,)
+			text = ascii_text (byte)
+			if text is not None:
+				label += ' ' + text
+			if parity_error:
+				label += ' PAR'
+			self.annotations.append ((sample, end, label, pin))
 				
 		self.GetParent().Refresh()
 		
 	def _auto_analyze_baud (self):
 		# Find most probable samples-per-bit value ..
-		self._pulse_histogram()
-		zeros = [(c, d) for (d, c) in self.hist[0].items()]
-		zeros.sort()
-		ones = [(c, d) for (d, c) in self.hist[1].items()]
-		ones.sort()
-		self.auto_bitsize = zeros[-1][1]
-		auto_baud = self.tracedata.frequency / self.auto_bitsize
+		bitwidth, confidence = estimate_bitwidth (self.serial_data)
+		if bitwidth is None:
+			bitwidth = self.tracedata.frequency / self.settings['baud']	# nothing to go on
+		self.auto_bitsize = max (1, int (round (bitwidth)))
+		auto_baud = int (round (self.tracedata.frequency / bitwidth))
 		self.settings['truebaud'] = auto_baud
 		self.settings['baud'] = nearest_baud (auto_baud)
-		print 'Auto baud:\t%s %s\n' % (auto_baud, baud_difference (auto_baud))
+		self.settings['baud_confidence'] = confidence
+		print 'Auto baud:\t%s %s, %d%% of pulses fit\n' % (auto_baud, baud_difference (auto_baud), int (confidence * 100))
 		
 	def _auto_analyze_format (self):
 		# Automatic format detection ..
-		bit_templates = dict ( (k, expand_mask_val (self.auto_bitsize, v))
-				for k, v in character_templates.items() 
-			)
-		format_scores = dict ((k, 0) for k in bit_templates)
-		data = np.array (self.serial_data, np.int16)
-		data_length = len (data)
-		for k, (bitmask, bitval) in bit_templates.items():
-			width = len (bitmask)
-			sig_bits = float (sum (bitmask))
-			offset = 1
-			char_count = 0
-			total_score = 0.0
-			while offset < data_length-width:
-				if data[offset-1] == 1 and data[offset] == 0:	# possible start_bit here
-					score = character_score (data[offset:offset+width]
-							, bitmask, bitval
-							, k, self.auto_bitsize
-						)
-					total_score += score / sig_bits
-					char_count += 1
-					offset += width - self.auto_bitsize/2	# resume search from the middle of the stop bit
-				else:
-					offset += 1
-			format_scores[k] = total_score / char_count
+		format_scores = template_scores (self.serial_data, self.auto_bitsize)
+		if not format_scores:
+			return	# no characters to judge by; keep the format set
 		scores = [(v, k) for k, v in format_scores.items()]
 		scores.sort()
 		print 'Auto Format:', scores[-1]
 		self.settings['parity'], self.settings['length'], self.settings['stop'] = scores[-1][1]
 		
-	def _harmonic_histogram (self, ph):
-		hist = collections.defaultdict (int)
-		pulses = sorted (ph, cmp=lambda x, y: cmp(x[1], y[1]))	# sort by frequency
-		harmonic = []
-		while pulses:
-			i, f = pulses[0]
-			pulses = pulses[1:]
-			harmonic.append ( (i + sum ([j for j, g in pulses if GCD (f, g) == f]), f) )
-		harmonic.sort()
-		return harmonic
-		
-	def _log_data_byte (self, sample, byte, parity):
-		dg, r = self._new_row ()
-		self._log_header (dg, r, sample)
-		dg.SetCellValue (r, 3, '0x%02x' % (byte,))
-		try:
-			dg.SetCellValue (r, 4, ASCII_ctl_chars.get (byte, chr (byte)))
-		except UnicodeDecodeError:
-			dg.SetCellValue (r, 4, '')
-		if parity is not None and parity != byte_parity (byte):
-			dg.SetCellValue (r, 2, ' PAR')
-			
-	def _log_header (self, dg, r, sample):
-		dg.SetCellValue (r, 0, str (sample))
-		dg.SetCellValue (r, 1, str (self._sample_time (sample)*1e6))
-		
-	def _match_character (self, data, parity, length, stop):
-		'''Return a data character and its parity from the serial stream.'''
-		w = self.tracedata.frequency / self.settings['baud']
-		try:
-			if (data[:w-2] != 0).any():
-				return None	# invalid start bit
-			plength = length + (parity != 0)
-			first_stop = (1+plength)*w
-			last_stop = first_stop + stop*w
-			if (data[first_stop+2 : last_stop-2] !=1).any():
-				return None	# invalid stop bit
-			bits = [data[bx] for bx in xrange (int ((w*3) / 2), plength*w, w)]
-			v = 0
-			for b in bits[::-1]:	# accumulate character from bits
-				v = v * 2 + b
-			if parity:
-				p = data[(1+length)*w + w/2]
-			else:
-				p = None
-			return v, p	# character value and parity
-		except IndexError:
-			return None	# no valid character here
-
-	def _new_row (self):
-		dg = self.display_grid
-		r = dg.GetNumberRows()
-		dg.AppendRows (1)
-		return dg, r
-		
-	def _pulse_histogram (self):
-		'''dict giving Histograms of pulse durations in the sample.'''
-		hist = [collections.defaultdict (int), collections.defaultdict (int)]
-		samples = self.serial_data
-		v, c = samples[0], 1
-		for b in samples[1:]:
-			if b == v:
-				c += 1
-			else:
-				hist[v][c] += 1	# account for the run that just ended
-				v, c = b, 1
-		hist[v][c] += 1	# account for the last run
-		self.hist = hist
+	def _cell (self, event, col):
+		'''Return the text for one column of a character's row in the grid.'''
+		if col == 0:
+			return str (event['sample'])
+		if col == 1:
+			return str (self._sample_time (event['sample'])*1e6)
+		if col == 2:
+			return ' PAR' if event['parity_error'] else ''
+		if col == 3:
+			return '0x%02x' % (event['data'],)
+		return ascii_text (int (event['data'])) or ''
 		
 	def _sample_time (self, sample):
 		'''The real-world time at which a sample was taken.'''
@@ -433,6 +530,8 @@ class AnalyzerFrame (analyzer_tools.AnalyzerFrame):
 		if 'truebaud' in settings:
 			true_baud = settings['truebaud']
 			baud_string = '%s %s' % (str (true_baud), baud_difference (true_baud))
+			if 'baud_confidence' in settings:
+				baud_string += ' %d%% fit' % (int (settings['baud_confidence'] * 100),)
 		else:
 			baud_string = str (settings['baud'])
 		d = '%s%s%s' % ('neo'[settings['parity']], settings['length'], settings['stop'])
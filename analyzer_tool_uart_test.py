@@ -122,5 +122,113 @@ class TestCharacterScore (unittest.TestCase):
 	def test0 (self):
 		pass
 		
+
+def serial_line (characters, bitwidth, parity=0, length=8, stop=1, idle=5):
+	'''Return a boolean sample array sending characters, with idle bits before and between them.'''
+	bits = [1] * idle
+	for c in characters:
+		data = [(c >> i) & 1 for i in xrange (length)]
+		bits += [0] + data
+		if parity:
+			bits.append ((sum (data) & 1) ^ (parity == 2))
+		bits += [1] * (stop + idle)
+	return np.repeat (np.array (bits, dtype=bool), bitwidth)
+	
+class TestDecodeUart (unittest.TestCase):
+	def test0 (self):
+		'''Test characters without parity.'''
+		events = M.decode_uart (serial_line ([0x55, 0x80, 0x01], 10), 10, 0, 8, 1)
+		self.assertEqual (list (events['data']), [0x55, 0x80, 0x01])
+		self.assertEqual (list (events['sample']), [50, 200, 350])
+		self.assertEqual (list (events['end']), [149, 299, 449])
+		self.assertFalse (events['parity_error'].any())
+		
+	def test1 (self):
+		'''Test parity checks.'''
+		line = serial_line ([0x31, 0x32], 8, parity=2, length=7, stop=2)
+		events = M.decode_uart (line, 8, 2, 7, 2)
+		self.assertEqual (list (events['data']), [0x31, 0x32])
+		self.assertFalse (events['parity_error'].any())
+		line[(5 + 8)*8 + 4] ^= True	# spoil the parity bit of the first character
+		self.assertEqual (list (M.decode_uart (line, 8, 2, 7, 2)['parity_error']), [True, False])
+		
+	def test2 (self):
+		'''Test that an idle line gives nothing.'''
+		self.assertEqual (len (M.decode_uart (np.ones (10000, dtype=bool), 10, 0, 8, 1)), 0)
+		self.assertEqual (len (M.decode_uart (np.ones (5, dtype=bool), 10, 0, 8, 1)), 0)
+		
+
+class TestEstimateBitwidth (unittest.TestCase):
+	def test0 (self):
+		'''Test run lengths.'''
+		levels, lengths = M.run_lengths (np.array ([1,1,0,0,0,1,0], dtype=bool))
+		self.assertEqual (list (levels), [True, False, True, False])
+		self.assertEqual (list (lengths), [2, 3, 1, 1])
+		levels, lengths = M.run_lengths (np.array ([], dtype=bool))
+		self.assertEqual (len (lengths), 0)
+		
+	def test1 (self):
+		'''Test bit widths, including a fractional one, and one where no pulse is a single bit.'''
+		bitwidth, confidence = M.estimate_bitwidth (serial_line (range (0, 256, 7), 13))
+		self.assertAlmostEqual (bitwidth, 13.0, 1)
+		self.assertTrue (confidence > 0.95)
+		line = serial_line (range (0, 256, 7), 1)
+		line = line[(np.arange (int (len (line) * 8.68)) / 8.68).astype (int)]	# 115200 baud at 1MHz
+		bitwidth, confidence = M.estimate_bitwidth (line)
+		self.assertAlmostEqual (bitwidth, 8.68, 1)
+		bitwidth, confidence = M.estimate_bitwidth (serial_line ([0x33, 0xCC] * 20, 10, idle=2))
+		self.assertAlmostEqual (bitwidth, 10.0, 1)
+		
+	def test2 (self):
+		'''Test that glitches lower the confidence but don't throw the estimate.'''
+		line = serial_line (range (0, 256, 3), 50)
+		line[::997] ^= True
+		bitwidth, confidence = M.estimate_bitwidth (line)
+		self.assertAlmostEqual (bitwidth, 50.0, 0)
+		self.assertTrue (0.5 < confidence < 0.99)
+		self.assertEqual (M.estimate_bitwidth (np.ones (100, dtype=bool)), (None, 0.0))
+		
+	def test3 (self):
+		'''Test that glitches splitting single bits don't halve the estimate.'''
+		rng = np.random.RandomState (5)
+		for bitwidth in (9.3, 17.0, 24.96, 41.85, 48.65, 65.47):
+			for trial in xrange (5):
+				line = serial_line (rng.randint (0, 256, 20), 1, idle=2)
+				line = line[(np.arange (int (len (line) * bitwidth)) / bitwidth).astype (int)]
+				for p in rng.randint (0, len (line) - 2, 8):
+					line[p:p + rng.randint (1, 3)] ^= True
+				estimate, confidence = M.estimate_bitwidth (line)
+				self.assertAlmostEqual (estimate / bitwidth, 1.0, 1)
+		
+	def test4 (self):
+		'''Test lines repeating one character, where multiples of the bit time fit too.'''
+		for character, idle in ((0x41, 5), (0x41, 0), (0x78, 0), (0x30, 1), (0xFF, 5)):
+			bitwidth, confidence = M.estimate_bitwidth (serial_line ([character] * 40, 10, idle=idle))
+			self.assertAlmostEqual (bitwidth, 10.0, 1)
+			self.assertTrue (confidence > 0.95)
+		
+
+class TestTemplateScores (unittest.TestCase):
+	def test0 (self):
+		'''Test that each format's score is the mean character_score of the characters tried.'''
+		line = serial_line ([0x41, 0x7E, 0x00], 6, parity=1, length=7, stop=1, idle=1)
+		for k in ((0, 8, 1), (1, 7, 1), (2, 5, 2)):
+			scores = M.template_scores (line, 6, {k: M.character_template (*k)})
+			mask, val = M.expand_mask_val (6, M.character_template (*k))
+			data = line.astype (np.int16)
+			starts = [6, 6 + 11*6, 6 + 22*6]	# the start bits; no character overlaps the next here
+			expected = [M.character_score (data[o:o+len (mask)], mask, val, k, 6) / float (mask.sum()) for o in starts]
+			self.assertAlmostEqual (scores[k], sum (expected) / len (expected))
+		
+	def test1 (self):
+		'''Test that the format sent scores best.'''
+		for k in ((0, 8, 1), (1, 7, 1), (2, 8, 2), (0, 6, 1)):
+			parity, length, stop = k
+			line = serial_line ([(i * 37) & ((1 << length) - 1) for i in xrange (40)], 5, parity, length, stop, idle=1)
+			scores = M.template_scores (line, 5)
+			self.assertEqual (max ((v, f) for f, v in scores.items())[0], 1.0)
+			self.assertEqual (scores[k], 1.0)
+		self.assertEqual (M.template_scores (np.ones (1000, dtype=bool), 5), {})
+		
 		
 unittest.main()
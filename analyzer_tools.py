@@ -18,7 +18,7 @@ This file is part of pyLogicSniffer.
     along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import time
-import wx
+import wx, wx.grid
 		
 def partial_bits (bitcount, data, msbfirst=True, bytelength=8, fillchar='x'):
 	'''String representing the bits in a partially-filled byte.'''
@@ -68,6 +68,52 @@ class AnalyzerFrame (wx.Dialog):
 		raise NotImplementedError
 		
 		
+#===========================================================	
+class EventTable (wx.grid.PyGridTableBase):
+	'''Read-only grid table over a numpy structured array of events.
+	
+	Cells are formatted by format_cell (event, col) only when the grid
+	draws them, so a table of any length is ready at once.'''
+	def __init__ (self, events, labels, format_cell):
+		wx.grid.PyGridTableBase.__init__ (self)
+		self.events = events
+		self.labels = labels
+		self.format_cell = format_cell
+		
+	def GetColLabelValue (self, col):
+		return self.labels[col]
+		
+	def GetNumberCols (self):
+		return len (self.labels)
+		
+	def GetNumberRows (self):
+		return len (self.events)
+		
+	def GetValue (self, row, col):
+		return self.format_cell (self.events[row], col)
+		
+	def IsEmptyCell (self, row, col):
+		return self.GetValue (row, col) == ''
+		
+	def SetValue (self, row, col, value):
+		pass	# results can't be edited
+		
+		
+def show_events (grid, events, labels, format_cell, sample_rows=50):
+	'''Show events in grid through an EventTable, and return the table.
+	
+	Columns are sized to fit the first and last few rows; grid.AutoSize
+	would format every cell to measure it.'''
+	table = EventTable (events, labels, format_cell)
+	grid.SetTable (table, True)
+	n = table.GetNumberRows()
+	rows = sorted (set (range (min (sample_rows, n)) + range (max (0, n - sample_rows), n)))
+	for col in xrange (table.GetNumberCols()):
+		texts = [labels[col]] + [table.GetValue (r, col) for r in rows]
+		grid.SetColSize (col, max (grid.GetTextExtent (t)[0] for t in texts) + 12)
+	return table
+		
+		
 #===========================================================	
 
 class SimpleValidator (wx.PyValidator):
@@ -15,14 +15,18 @@ You should have received a copy of the GNU General Public License along with pyL
 
 import wx, wx.grid
 import numpy as np
-import os, sys, traceback
+import os, sqlite3, sys, traceback
 from serial import SerialException
 import sump
 import sump_config_file
 from sump_settings import SumpDialog, ID_CAPTURE
-from logic_sniffer_dialogs import BookLabelDialog, LabelDialog, MetadataDialog, TimeScaleDialog, TracePropertiesDialog, ZoomDialog
-from logic_sniffer_lib import TraceData, frequency_with_units, time_with_units
+from logic_sniffer_dialogs import BookLabelDialog, BusDialog, CatalogDialog, DerivedTraceDialog, LabelDialog, MetadataDialog, TimeScaleDialog, TracePropertiesDialog, VcdImportDialog, ZoomDialog
+from logic_sniffer_lib import BUS_CHANNELS, CAPTURE_CHANNELS, AnnotationIndex, LruCache, TraceData, frequency_with_units, time_with_units
+import logic_sniffer_catalog
+import logic_sniffer_export
+import logic_sniffer_render
 import logic_sniffer_save
+import logic_sniffer_vcd
 
 # File dialog wildcard string for SUMP saved settings ..
 sump_ini_wildcards = 'SUMP INI files|*.sump.ini|INI files (*.ini)|*.ini|all files (*)|*'
@@ -30,21 +34,79 @@ sump_ini_wildcards = 'SUMP INI files|*.sump.ini|INI files (*.ini)|*.ini|all file
 csv_wildcards = 'CSV files (*.csv)|*.csv|all files (*)|*'
 # same again for Python ..
 python_wildcards = 'Python files (*.py;*.pyc)|*.py;*.pyc|all files (*)|*'
+# same again for sessions of several captures ..
+session_wildcards = 'Session files (*.lss)|*.lss|all files (*)|*'
+# same again for sigrok sessions ..
+sigrok_wildcards = 'sigrok session files (*.sr)|*.sr|all files (*)|*'
+# same again for waveform images ..
+image_wildcards = 'PNG images (*.png)|*.png|SVG images (*.svg)|*.svg'
+# same again for simulator Value Change Dumps ..
+vcd_wildcards = 'VCD files (*.vcd)|*.vcd|all files (*)|*'
 		
 
 #===========================================================
 def log_error (msg):
 	sys.stderr.write ('\n\n' + msg + '\n')
 	sys.stderr.flush()
+	
+TILE_WIDTH = 256	# pixel width of the cached strips that displays are pieced together from
+TILE_CACHE_SIZE = 32 << 20	# bytes of cached strips kept for each display
+
+RESIZE_DELAY = 100	# milliseconds a display waits for resizing to stop before redrawing
+STATUS_INTERVAL = 16	# milliseconds between status bar updates, about one screen refresh
+OVERVIEW_BINS = 4096	# slices of the capture whose edges are counted for the overview strip
+
+def compose_tiles (cache, key, offset, width, height, render, background, previous=None, preview=None):
+	'''Return a width x height bitmap of a display scrolled offset pixels, pieced together from tiles.
+	
+	Tiles come from cache under (key, tile index); render ((key, tile index), height)
+	returns a bitmap for a missing one, or None if it isn't ready yet.
+	previous is the (bitmap, key, offset) of the display as it was; if it
+	was only scrolled sideways, the pixels still in view are shifted across
+	and only the newly exposed strip is pieced together.  preview, a
+	(bitmap, offset) drawn at the same scale, shows through where tiles
+	aren't ready.'''
+	bitmap = wx.EmptyBitmap (max (1, width), max (1, height))
+	dc = wx.MemoryDC (bitmap)
+	offset = int (offset)
+	left, right = 0, width	# the strip to piece together
+	if previous is not None:
+		old_bitmap, old_key, old_offset = previous
+		delta = offset - old_offset
+		if old_key == key and old_bitmap.GetSize() == bitmap.GetSize() and abs (delta) < width:
+			odc = wx.MemoryDC (old_bitmap)
+			dc.Blit (-delta, 0, width, height, odc, 0, 0)
+			del odc
+			if delta >= 0:
+				left = width - delta
+			else:
+				right = -delta
+	dc.SetBrush (wx.Brush (background))
+	dc.SetPen (wx.TRANSPARENT_PEN)
+	dc.DrawRectangle (left, 0, right - left, height)
+	if preview is not None:
+		preview_bitmap, preview_offset = preview
+		pdc = wx.MemoryDC (preview_bitmap)
+		px = preview_offset - offset	# where the preview's left edge falls
+		x0, x1 = max (px, left), min (px + preview_bitmap.GetWidth(), right)
+		if x0 < x1:
+			dc.Blit (x0, 0, x1 - x0, min (height, preview_bitmap.GetHeight()), pdc, x0 - px, 0)
+		del pdc
+	for tile in xrange ((offset + left) // TILE_WIDTH, (offset + right - 1) // TILE_WIDTH + 1):
+		tile_bitmap = cache.get ((key, tile))
+		if tile_bitmap is None:
+			tile_bitmap = render ((key, tile), height)
+			if tile_bitmap is None:
+				continue
+			cache.put ((key, tile), tile_bitmap, TILE_WIDTH * height * 4)
+		tx = tile*TILE_WIDTH - offset	# where the tile's left edge falls
+		x0, x1 = max (tx, left), min (tx + TILE_WIDTH, right)
+		tdc = wx.MemoryDC (tile_bitmap)
+		dc.Blit (x0, 0, x1 - x0, min (height, tile_bitmap.GetHeight()), tdc, x0 - tx, 0)
+		del tdc
+	del dc
+	return bitmap
 
-#===========================================================
-class PluginTool (object):
-	'''Collect info for a loaded plugin.'''
-	def __init__ (self, tool_id, tool_module, tool_settings):
-		self.idval = tool_id
-		self.module = tool_module
-		self.settings = tool_settings
-		
 #===========================================================
 class TimeLegend (wx.Panel):
 	'''Display a time scale above the trace display.'''
@@ -55,27 +117,37 @@ class TimeLegend (wx.Panel):
 		self.scale = None
 		self.zoom = 1
 		self._bitmap = None
+		self._composed = None	# (key, offset) the bitmap was pieced together for
+		self.tiles = LruCache (TILE_CACHE_SIZE)
 		self.sample_scroll = self.sample_offset = 0
+		self.resize_timer = wx.Timer (self)
 		self.Bind (wx.EVT_PAINT, self.OnPaint)
 		self.Bind (wx.EVT_SIZE, self.OnSize)
+		self.Bind (wx.EVT_TIMER, self.OnResizeTimer, self.resize_timer)
+		
+	def Invalidate (self):
+		'''Forget the cached tiles, after a change in data or appearance.'''
+		self.tiles.clear()
 		
 	def OnPaint (self,evt):
 		pdc = wx.PaintDC (self)
 		if self._bitmap is not None:
-			dc = wx.ClientDC (self)
 			mdc = wx.MemoryDC (self._bitmap)
-			w, h = self.GetClientSizeTuple ()
-			dc.Blit (0, 0, w, h, mdc, self.sample_offset, 0)
+			x, y, w, h = self.GetUpdateRegion().GetBox()
+			pdc.Blit (x, y, w, h, mdc, x, y)
 			
-	def OnSize (self, evt):
+	def OnResizeTimer (self, evt):
 		if self.data is not None:
-			width, height = evt.GetSize ()
+			width, height = self.GetClientSizeTuple ()
 			self.scale = float (width) / self.data.read_count
 			self._set_sample_offset()
-			wx.CallAfter (self.ReDraw)
+			self.ReDraw()
+			
+	def OnSize (self, evt):
+		self.resize_timer.Start (RESIZE_DELAY, wx.TIMER_ONE_SHOT)	# redraw once the resizing stops
 		evt.Skip()
 			
-	def _draw_legend (self, dc, width, height):
+	def _draw_legend (self, dc, left, width, height):
 		if self.data is not None:
 			dc.SetBackground (wx.Brush (self.GetBackgroundColour()))
 			dc.SetTextBackground (self.GetBackgroundColour())
@@ -86,6 +158,8 @@ class TimeLegend (wx.Panel):
 			data = self.data
 			zoom = self.zoom
 			scalezoom = scale * zoom
+			full_width = int (data.read_count * scalezoom)	# width of the whole capture at this zoom
+			offset = int (left)
 			
 			def sample_time (sample):
 				'''Return time of occurence of sample #sample.'''
@@ -93,25 +167,41 @@ class TimeLegend (wx.Panel):
 				
 			def place_text (text, sample):
 				tw, th = dc.GetTextExtent (text)
-				tx = min (width-tw, max (0, int (sample * scalezoom) - tw/2))
-				dc.DrawText (text, tx, 0)
+				tx = min (full_width-tw, max (0, int (sample * scalezoom) - tw/2)) - offset
+				if -tw < tx < width:
+					dc.DrawText (text, tx, 0)
 				
 			place_text (time_with_units (sample_time (data.delay_count-data.read_count)), 0)
 			place_text (time_with_units (sample_time (data.delay_count)), data.read_count-1)
 			if 0 < data.delay_count < data.read_count:
 				place_text ('0', data.read_count - data.delay_count)
 		
-	def ReDraw (self):
-		w, h = self.GetClientSizeTuple()
-		w *= self.zoom
-		self._bitmap = wx.EmptyBitmap (w, h)
-		dc = wx.MemoryDC (self._bitmap)
-		self._draw_legend (dc, w, h)
+	def _legend_tile (self, tile_key, height):
+		key, tile = tile_key
+		bitmap = wx.EmptyBitmap (TILE_WIDTH, max (1, height))
+		dc = wx.MemoryDC (bitmap)
+		self._draw_legend (dc, tile*TILE_WIDTH, TILE_WIDTH, height)
 		del dc
-		self.Refresh()
+		return bitmap
+		
+	def ReDraw (self, shift=False):
+		'''Piece the visible part of the time scale into a window-sized bitmap.
+		
+		With shift, the bitmap is only scrolled, and just the newly exposed strip is drawn.'''
+		if self.data is not None:
+			w, h = self.GetClientSizeTuple()
+			key = (self.scale * self.zoom, h)
+			previous = None
+			if shift and self._composed is not None:
+				previous = (self._bitmap,) + self._composed
+			self._bitmap = compose_tiles (self.tiles, key, self.sample_offset, w, h
+					, self._legend_tile, self.GetBackgroundColour(), previous)
+			self._composed = (key, int (self.sample_offset))
+			self.Refresh (False)
 		
 	def SetData (self, data):
 		self.data = data
+		self.Invalidate()
 		width, height = self.GetClientSizeTuple ()
 		self.scale = float (width) / self.data.read_count
 		self.zoom = 1
@@ -123,65 +213,172 @@ class TimeLegend (wx.Panel):
 	def ScrollToSample (self, sample):
 		self.sample_scroll = sample
 		self._set_sample_offset()
-		self.Refresh()
+		self.ReDraw (shift=True)
 		
 	def _set_sample_offset (self):
 		self.sample_offset = self.sample_scroll * self.scale * self.zoom
 		
-	def SetZoom (self, zoom):
+	def SetZoom (self, zoom, sample=None):
 		self.zoom = zoom
+		if sample is not None:
+			self.sample_scroll = sample
 		self._set_sample_offset()
 		self.ReDraw()
 		
 class TraceLegend (wx.Panel):
-	'''Display channel numbers and legends beside the trace display.'''
-	def __init__ (self, parent, trace_max, trace_height):
-		wx.Panel.__init__ (self, parent, -1)
-		self.trace_max = trace_max
+	'''Display channel numbers and legends beside the trace display.
+	
+	Only the captions of the rows in view are painted.'''
+	def __init__ (self, parent, trace_height):
+		wx.Panel.__init__ (self, parent, -1, style=wx.FULL_REPAINT_ON_RESIZE)
 		self.trace_height = trace_height
 		self.SetForegroundColour (wx.RED)
-		self.captions = []
-		for i in xrange (trace_max):
-			self.captions.append (wx.StaticText (self, -1, str (i), pos=(0, 5+i*trace_height)))
-		w = max (c.GetSizeTuple()[0] for c in self.captions)
+		self.data = None
+		self.legends = {}
+		self.rows = []		# channel shown in each row
+		self.trace_scroll = 0
+		self.Bind (wx.EVT_PAINT, self.OnPaint)
+		self._fit_width()
+		
+	def _caption (self, channel):
+		if channel >= BUS_CHANNELS and self.data is not None:
+			return self.data.channel_name (channel)
+		if channel >= CAPTURE_CHANNELS and self.data is not None:
+			return '%d %s' % (channel, self.data.channel_name (channel))
+		return '%d %s' % (channel, self.legends.get (channel, ''))
+		
+	def _fit_width (self):
+		dc = wx.ClientDC (self)
+		dc.SetFont (self.GetFont())
+		w = max ([dc.GetTextExtent (self._caption (c))[0] for c in self.rows] + [dc.GetTextExtent ('00')[0]])
 		self.SetMinSize ((w, -1))
 		
+	def OnPaint (self, evt):
+		dc = wx.PaintDC (self)
+		dc.SetFont (self.GetFont())
+		dc.SetTextForeground (self.GetForegroundColour())
+		w, h = self.GetClientSizeTuple()
+		first = self.trace_scroll
+		for i, channel in enumerate (self.rows[first : first + h // self.trace_height + 1]):
+			dc.DrawText (self._caption (channel), 0, 5 + i*self.trace_height)
+		
 	def ScrollToTrace (self, trace):
-		pass
+		self.trace_scroll = trace
+		self.Refresh()
 		
 	def SetData (self, data):
+		self.data = data
 		self.legends = data.legends
-		for channel, legend in self.legends.items():
-			self.ShowLegend (channel, legend)
+		self._fit_width()
+		self.Refresh()
 		
 	def SetLegend (self, trace, legend):
 		self.legends[trace] = legend
 		self.ShowLegend (trace, legend)
 		
+	def SetRows (self, rows):
+		self.rows = list (rows)
+		self._fit_width()
+		self.Refresh()
+		
 	def ShowLegend (self, trace, legend):
-		self.captions[trace].SetLabel ('%d %s' % (trace, legend))
-		w = max (c.GetSizeTuple()[0] for c in self.captions)
-		self.SetMinSize ((w, -1))
+		self._fit_width()
+		self.Refresh()
 
+class OverviewStrip (wx.Panel):
+	'''Map of channel activity across the whole capture, with the part in view outlined.
+	
+	Edge counts are taken once per capture in OVERVIEW_BINS slices, so
+	redrawing at any size only sums and shades them.'''
+	def __init__ (self, parent):
+		wx.Panel.__init__ (self, parent, -1, size=(-1,32), style=wx.FULL_REPAINT_ON_RESIZE)
+		self.data = None
+		self.rows = []
+		self.view = (0, 0)		# first sample and number of samples in view
+		self.activity = {}		# channel -> edge counts in each bin
+		self._bitmap = None
+		self._drawn = None		# (size, rows) the bitmap was drawn for
+		self.Bind (wx.EVT_PAINT, self.OnPaint)
+		
+	def CalcXSample (self, x):
+		'''Return the sample number at mouse position x.'''
+		width = max (1, self.GetClientSizeTuple()[0])
+		return int (x * self.data.read_count / width)
+		
+	def OnPaint (self, evt):
+		pdc = wx.PaintDC (self)
+		if self.data is None:
+			return
+		width, height = size = self.GetClientSizeTuple()
+		if width <= 0 or height <= 0:
+			return
+		if self._drawn != (size, tuple (self.rows)):
+			counts = np.array ([self._activity (c) for c in self.rows]).reshape ((len (self.rows), OVERVIEW_BINS))
+			image = logic_sniffer_render.density_image (counts, width, height)
+			self._bitmap = wx.BitmapFromBufferRGBA (width, height, image)
+			self._drawn = (size, tuple (self.rows))
+		pdc.DrawBitmap (self._bitmap, 0, 0)
+		first, count = self.view
+		scale = float (width) / self.data.read_count
+		pdc.SetPen (wx.Pen ('RED', 2))
+		pdc.SetBrush (wx.TRANSPARENT_BRUSH)
+		pdc.DrawRectangle (int (first * scale), 1, max (3, int (count * scale)), height - 1)
+		
+	def _activity (self, channel):
+		if channel not in self.activity:
+			self.activity[channel] = logic_sniffer_render.activity_counts (self.data, channel, OVERVIEW_BINS)
+		return self.activity[channel]
+		
+	def SetData (self, data):
+		self.data = data
+		self.activity = {}
+		self._drawn = None
+		self.Refresh()
+		
+	def SetRows (self, rows):
+		self.rows = list (rows)
+		self.Refresh()
+		
+	def SetView (self, first, count):
+		'''Outline samples first to first+count as the part in view.'''
+		if (first, count) != self.view:
+			self.view = (first, count)
+			self.Refresh (False)
+		
+		
 class TraceGraphs (wx.Window):
 	'''Actual data graphs.'''
 	TRACE_HEIGHT = 20
-	TRACE_MAX = 16
+	CURSOR_COLOURS = ('BLUE', 'RED', 'MAGENTA', 'DARK GREEN')
+	ANNOTATION_COLOUR = 'ORANGE'
 	def __init__ (self, parent):
 		wx.Window.__init__ (self, parent, wx.ID_ANY)
 		self._bitmap = None
 		self.data = None
-		self.tracedata = [None]*self.TRACE_MAX
 		self.scale = None
 		self.zoom = 1
+		self.tiles = LruCache (TILE_CACHE_SIZE)
+		self.tile_generation = 0	# bumped to tell stale tiles from the worker
+		self.wanted_tiles = set()	# tiles the worker is still to render
+		self.requested_tiles = set()	# tiles already queued for the worker
 		self.sample_scroll = self.sample_offset = 0
-		self.trace_scroll = self.trace_offset = 0
+		self.rows = []		# channel shown in each row
+		self.trace_scroll = 0	# first row in view
+		self._composed = None	# (key, offset) the bitmap was pieced together for
+		self._preview = None	# (key, bitmap, offset) shown while the worker catches up after a zoom
+		self.cursors = []		# sample numbers of the measurement cursors
+		self.annotations = []	# AnnotationIndex of decoded events from each analyzer
+		self.persistence = None	# PersistenceMap shown in place of the traces
 		
 		self.SetBackgroundColour ("WHITE")
 		self.text_font = wx.Font (10, wx.FONTFAMILY_SWISS, wx.FONTSTYLE_NORMAL
 				, wx.FONTWEIGHT_NORMAL)
+		self.annotation_font = wx.Font (7, wx.FONTFAMILY_SWISS, wx.FONTSTYLE_NORMAL
+				, wx.FONTWEIGHT_NORMAL)
+		self.resize_timer = wx.Timer (self)
 		self.Bind (wx.EVT_PAINT, self.OnPaint)
 		self.Bind (wx.EVT_SIZE, self.OnSize)
+		self.Bind (wx.EVT_TIMER, self.OnResizeTimer, self.resize_timer)
 		
 		self.SetMinSize ((400, 300))
 		
@@ -200,91 +397,275 @@ class TraceGraphs (wx.Window):
 		sample_time = float (sample - self.data.read_count + self.data.delay_count) / self.data.frequency
 		return sample_time
 			
+	def Invalidate (self):
+		'''Forget the cached tiles, after a change in data or appearance.'''
+		self.tiles.clear()
+		self.wanted_tiles = set()
+		self.requested_tiles = set()
+		self.tile_generation += 1
+		
 	def OnPaint (self, evt):
 		pdc = wx.PaintDC (self)
 		if self._bitmap is not None:
-			dc = wx.ClientDC (self)
 			mdc = wx.MemoryDC (self._bitmap)
-			w, h = self.GetClientSizeTuple ()
-			dc.Blit (0, 0, w, h, mdc, self.sample_offset, self.trace_offset)
+			x, y, w, h = self.GetUpdateRegion().GetBox()
+			pdc.Blit (x, y, w, h, mdc, x, y)
+			self._draw_bus_values (pdc)
+			self._draw_annotations (pdc)
+			self._draw_cursors (pdc)
 			
-	def OnSize (self, evt):
+	def OnResizeTimer (self, evt):
 		if self.data is not None:
-			width, height = evt.GetSize ()
+			width, height = self.GetClientSizeTuple ()
 			self.scale = float (width) / self.data.read_count
 			self._set_sample_offset()
-			wx.CallAfter (self.ReDraw)
+			self.ReDraw()
+			
+	def OnSize (self, evt):
+		self.resize_timer.Start (RESIZE_DELAY, wx.TIMER_ONE_SHOT)	# redraw once the resizing stops
 		evt.Skip()
 		
-	def _draw_traces (self, dc):
+	def CalcSampleX (self, sample):
+		'''Return the mouse position x of sample number sample.'''
+		return int (sample * self.scale * self.zoom - self.sample_offset)
+		
+	def _draw_annotations (self, dc):
+		'''Draw the decoded events in view as labelled bands over their channels.'''
+		if self.data is None or not self.annotations:
+			return
+		w, h = self.GetClientSizeTuple()
+		row_of = dict ((channel, i) for i, channel in enumerate (self._visible_channels()))
+		first, last = self.CalcXSample (0), self.CalcXSample (w)
+		factor = self.scale * self.zoom
+		dc.SetFont (self.annotation_font)
+		dc.SetTextForeground (self.ANNOTATION_COLOUR)
+		dc.SetPen (wx.Pen (self.ANNOTATION_COLOUR))
+		dc.SetBrush (wx.TRANSPARENT_BRUSH)
+		for index in self.annotations:
+			shown = index.overlapping (first, last)
+			xs = np.clip (index.starts[shown] * factor - self.sample_offset, -2, w + 2).astype (int)
+			xe = np.clip (index.ends[shown] * factor - self.sample_offset, -2, w + 2).astype (int)
+			drawn_to = {}	# row -> rightmost pixel already covered, so crowded spans draw once per pixel
+			for i, x0, x1 in zip (shown, xs, xe):
+				row = row_of.get (index.channels[i])
+				if row is None or x1 <= drawn_to.get (row, -1):
+					continue
+				drawn_to[row] = max (x1, x0 + 1)
+				y = row * self.TRACE_HEIGHT
+				dc.DrawRectangle (x0, y + 1, max (x1 - x0, 1) + 1, self.TRACE_HEIGHT - 2)
+				label = index.labels[i]
+				tw, th = dc.GetTextExtent (label)
+				if tw + 4 <= x1 - x0:
+					dc.DrawText (label, x0 + 2, y + 1)
+		
+	def _draw_bus_values (self, dc):
+		'''Write the value of each bus in view inside its lane, where there's room for it.'''
+		if self.data is None:
+			return
+		data = self.data
+		w, h = self.GetClientSizeTuple()
+		first, last = self.CalcXSample (0), self.CalcXSample (w)
+		factor = self.scale * self.zoom
+		dc.SetFont (self.annotation_font)
+		dc.SetTextForeground ('BLACK')
+		digit_width, text_height = dc.GetTextExtent ('0')
+		for row, channel in enumerate (self._visible_channels()):
+			if channel < BUS_CHANNELS:
+				continue
+			starts, values = data.bus_changes (channel)
+			lo = max (0, np.searchsorted (starts, first, 'right') - 1)
+			hi = np.searchsorted (starts, last, 'right')
+			ends = np.append (starts[lo+1:hi], starts[hi] if hi < len (starts) else data.read_count)
+			x0 = np.maximum (starts[lo:hi] * factor - self.sample_offset, 0)
+			x1 = np.minimum (ends * factor - self.sample_offset, w)
+			digits = (data.bus_width (channel) + 3) // 4
+			roomy = np.flatnonzero (x1 - x0 >= digits * digit_width + 4)	# only boxes wide enough to read
+			y = row * self.TRACE_HEIGHT + (self.TRACE_HEIGHT + 6 - text_height) // 2
+			for i in roomy:
+				text = '%0*X' % (digits, values[lo + i])
+				tw = dc.GetTextExtent (text)[0]
+				dc.DrawText (text, int ((x0[i] + x1[i] - tw) / 2), y)
+		
+	def _draw_cursors (self, dc):
+		'''Draw the measurement cursors over the traces.'''
+		if self.data is None:
+			return
+		w, h = self.GetClientSizeTuple()
+		dc.SetFont (self.text_font)
+		for i, sample in enumerate (self.cursors):
+			x = self.CalcSampleX (sample)
+			if 0 <= x < w:
+				colour = self.CURSOR_COLOURS[i % len (self.CURSOR_COLOURS)]
+				dc.SetPen (wx.Pen (colour, 1, wx.SHORT_DASH))
+				dc.DrawLine (x, 0, x, h)
+				dc.SetTextForeground (colour)
+				dc.DrawText ('C%d' % (i+1,), x + 2, 0)
+		
+	def _draw_persistence (self):
+		'''Draw the persistence map's columns for the samples in view into the bitmap.'''
 		data = self.data
+		persistence = self.persistence
+		width, height = self.GetClientSizeTuple()
+		samples = (np.arange (width) + self.sample_offset) / (self.scale * self.zoom)
+		aligned = samples - (data.read_count - data.delay_count) + persistence.trigger	# the same times in the first capture
+		image = persistence.image (self._visible_channels(), np.floor (aligned * persistence.scale)
+				, self.TRACE_HEIGHT, tuple (self.GetBackgroundColour().Get()[:3]) + (255,))
+		self._bitmap = wx.EmptyBitmap (max (1, width), max (1, height))
+		dc = wx.MemoryDC (self._bitmap)
+		dc.SetBackground (wx.Brush (self.GetBackgroundColour()))
 		dc.Clear()
+		if width > 0:
+			dc.DrawBitmap (wx.BitmapFromBufferRGBA (width, image.shape[0], image), 0, 0)
+		dc.SelectObject (wx.NullBitmap)
+		self._composed = None	# nothing here for a shift or a zoom preview to reuse
+		self.Refresh (False)
+		
+	def _request_tile (self, tile_key, height):
+		'''Have the raster worker draw a missing tile; it's added to the cache when ready.'''
+		self.wanted_tiles.add (tile_key)
+		if tile_key not in self.requested_tiles:
+			self.requested_tiles.add (tile_key)
+			(scale, channels, generation), tile = tile_key
+			background = tuple (self.GetBackgroundColour().Get()[:3]) + (255,)
+			logic_sniffer_render.shared_worker().request (tile_key
+					, lambda key: key in self.wanted_tiles
+					, lambda key, image: wx.CallAfter (self._tile_ready, key, image)
+					, logic_sniffer_render.rasterize_traces, self.data, channels, tile*TILE_WIDTH, TILE_WIDTH, scale
+					, self.TRACE_HEIGHT, background)
+		return None
 		
-		# Mark Time 0
-		dc.SetPen (wx.GREEN_PEN)
-		xz = int ((data.read_count-data.delay_count) * self.scale * self.zoom)	# x-ordinate of time 0
-		y1 = self.TRACE_MAX*self.TRACE_HEIGHT
-		dc.DrawLine (xz,0, xz,y1)
-		
-		dc.SetPen (wx.BLACK_PEN)
-		scale = self.scale * self.zoom
-		traceheight = self.TRACE_HEIGHT
-		thm1 = traceheight-1
-		thm6 = traceheight-6	# Y-axis height from 0-bit to 1-bit
-		
-		def draw_single_trace (dc, tracedata, ybase):
-			dc.DrawLines (tracedata, 0, ybase)
-			
-		for channel in xrange (self.TRACE_MAX):
-			if self.tracedata [channel] is None:
-				tl = data.channel_data (channel)	# logical 0..1 trace values for the channel
-				tl = traceheight - tl * thm6			# Y-axis position for each trace point
-				self.tracedata[channel] = np.column_stack ( (np.arange (len (tl)), tl) )
-			draw_single_trace (dc, self.tracedata[channel]*(scale,1), channel*traceheight)
-			
-	def ReDraw (self):
-		if self.data is not None:
-			width = self.data.read_count * self.scale * self.zoom
-			height = self.TRACE_HEIGHT * self.TRACE_MAX
-			self._bitmap = wx.EmptyBitmap (width, height)
-			dc = wx.MemoryDC (self._bitmap)
-			self._draw_traces (dc)
-			del dc
-			self.Refresh()
+	def _tile_ready (self, tile_key, image):
+		'''Take a tile rendered by the raster worker.'''
+		if not self:	# window closed
+			return
+		self.requested_tiles.discard (tile_key)
+		if tile_key not in self.wanted_tiles:
+			return
+		self.wanted_tiles.discard (tile_key)
+		if image is not None:
+			height, width = image.shape[:2]
+			self.tiles.put (tile_key, wx.BitmapFromBufferRGBA (width, height, image), image.nbytes)
+			self.ReDraw()
+		
+	def _visible_channels (self):
+		'''Return the channels of the rows in view; only these are drawn.'''
+		w, h = self.GetClientSizeTuple()
+		return tuple (self.rows[self.trace_scroll : self.trace_scroll + h // self.TRACE_HEIGHT + 1])
+		
+	def ReDraw (self, shift=False):
+		'''Piece the visible samples into a window-sized bitmap.
+		
+		Tiles that aren't cached are left blank until the raster worker has
+		drawn them, so the window stays responsive during a heavy redraw.
+		With shift, the bitmap is only scrolled, and just the newly exposed
+		strip is pieced together.'''
+		if self.data is not None and self.persistence is not None:
+			self._draw_persistence()
+		elif self.data is not None:
+			width, height = self.GetClientSizeTuple()
+			key = (self.scale * self.zoom, self._visible_channels(), self.tile_generation)
+			previous = preview = None
+			if shift and self._composed is not None:
+				previous = (self._bitmap,) + self._composed
+			else:
+				self.wanted_tiles = set()	# only tiles still missing from this view get rendered
+			if self._preview is not None and self._preview[0] == key:
+				preview = self._preview[1:]
+			self._bitmap = compose_tiles (self.tiles, key, self.sample_offset, width, height
+					, self._request_tile, self.GetBackgroundColour(), previous, preview)
+			self._composed = (key, int (self.sample_offset))
+			self.requested_tiles &= self.wanted_tiles	# the worker will skip the others
+			if not self.wanted_tiles:
+				self._preview = None	# every tile in view is exact now
+			self.Refresh (False)
 		
 	def ScrollToSample (self, sample):
 		self.sample_scroll = sample
 		self._set_sample_offset()
-		self.Refresh()
+		self.ReDraw (shift=True)
 		
 	def ScrollToTrace (self, trace):
-		pass
+		self.trace_scroll = trace
+		self.ReDraw()
 		
 	def _set_sample_offset (self):
 		self.sample_offset = self.sample_scroll * self.scale * self.zoom
 		
+	def SetBackgroundColour (self, colour):
+		self.Invalidate()
+		return wx.Window.SetBackgroundColour (self, colour)
+		
+	def SetAnnotations (self, annotations):
+		'''Set the AnnotationIndex objects whose events are drawn over the traces.'''
+		self.annotations = list (annotations)
+		self.Refresh (False)
+		
+	def SetCursors (self, cursors):
+		self.cursors = list (cursors)
+		self.Refresh (False)
+		
+	def SetPersistence (self, persistence):
+		'''Show a PersistenceMap in place of the traces, or the traces again if it's None.'''
+		self.persistence = persistence
+		self._preview = None
+		self.ReDraw()
+		
 	def SetData (self, data):
 		self.data = data
+		self.rows = list (data.channel_set())	# until SetRows says otherwise
+		self.Invalidate()
 		self.zoom =1
 		width, height = self.GetClientSizeTuple ()
 		self.scale = float (width) / self.data.read_count
 		self._set_sample_offset()
-		self.tracedata = [None]*self.TRACE_MAX
 		self.ReDraw()
 		
 		sys.stderr.write ('TraceGraphs.SetData scale: %f\n' % (self.scale,)); sys.stderr.flush()
 		sys.stderr.write ('TraceGraphs.SetData Zero at %d\n' % (data.read_count - data.delay_count,)); sys.stderr.flush()
 		
-	def SetZoom (self, zoom):
+	def SetRows (self, rows):
+		'''Set the channels to show, one per row.'''
+		self.rows = list (rows)
+		self.ReDraw()
+		
+	def _make_preview (self, factor):
+		'''Stretch what's on screen by factor, to stand in for the tiles of a new zoom level.'''
+		if self._bitmap is None or self._composed is None:
+			return None
+		width, height = self._bitmap.GetSize()
+		old_offset = self._composed[1]
+		new_offset = int (self.sample_offset)
+		x0 = max (0, int (new_offset / factor) - old_offset)	# old pixels that will still be in view
+		x1 = min (width, int ((new_offset + width) / factor) - old_offset + 1)
+		if x1 <= x0:
+			return None
+		image = self._bitmap.ConvertToImage().GetSubImage (wx.Rect (x0, 0, x1 - x0, height))
+		image = image.Scale (max (1, int ((x1 - x0) * factor)), height)
+		return wx.BitmapFromImage (image), int ((old_offset + x0) * factor)
+		
+	def SetZoom (self, zoom, sample=None):
+		'''Set the zoom factor, and optionally the sample to show at the left.
+		
+		Until the worker has drawn the new zoom level, a stretched copy of
+		the current display is shown.'''
 		old_zoom = self.zoom
 		self.zoom = zoom
+		if sample is not None:
+			self.sample_scroll = sample
 		self._set_sample_offset()
+		if self.data is not None:
+			preview = self._make_preview (float (zoom) / old_zoom)
+			if preview is not None:
+				key = (self.scale * self.zoom, self._visible_channels(), self.tile_generation)
+				self._preview = (key,) + preview
 		self.ReDraw()
 		
 		
 #-----------------------------------------------------------
 class TraceWindow (wx.Panel):
 	'''Pageable graph with X- and Y-axis legends and plotting area for traces.'''
+	CURSOR_REACH = 6	# pixels within which a click grabs a cursor, or a cursor snaps to an edge
+	MAX_SAMPLE_WIDTH = 64	# pixels per sample at the deepest zoom
 	def __init__ (self, parent, legends=None):
 		wx.Panel.__init__ (self, parent, wx.ID_ANY
 			, style=wx.HSCROLL|wx.VSCROLL|wx.ALWAYS_SHOW_SB
@@ -292,23 +673,41 @@ class TraceWindow (wx.Panel):
 		self.zoom = 1
 		self.timescroll = 0
 		self.tracescroll = 0
+		self.wheel_rotation = 0	# mouse wheel movement not yet used for zooming
 		self.settings = sump.SumpDeviceSettings()
 		self.tool_windows = []
+		self.deferred = None	# (loader, view) for data to be loaded when the page is shown
+		self.hidden = set()		# channels not shown
+		self.cursors = []		# sample numbers of the measurement cursors
+		self.active_cursor = None	# index of the cursor being placed or dragged
+		self.status_report = None	# status_report (text, field) shows cursor readings
+		self.annotations = {}	# analyzer name -> AnnotationIndex of its decoded events
+		self.persistence = None	# PersistenceMap of the captures shown here, while accumulating
 		
 		self.graphs = TraceGraphs (self)
-		self.trace_legend = TraceLegend (self, self.graphs.TRACE_MAX, self.graphs.TRACE_HEIGHT)
+		self.trace_legend = TraceLegend (self, self.graphs.TRACE_HEIGHT)
 		self.time_legend = TimeLegend (self)
+		self.overview = OverviewStrip (self)
 		
-		ts = wx.FlexGridSizer (2, 2)
-		ts.AddGrowableRow (1)
+		ts = wx.FlexGridSizer (3, 2)
+		ts.AddGrowableRow (2)
 		ts.AddGrowableCol (1)
 		ts.Add ((0,0), 0, 0)
+		ts.Add (self.overview, 1, wx.EXPAND)
+		ts.Add ((0,0), 0, 0)
 		ts.Add (self.time_legend, 1, wx.EXPAND)
 		ts.Add (self.trace_legend, 1, wx.EXPAND)
 		ts.Add (self.graphs, 1, wx.EXPAND)
 
 		self.graphs.Bind (wx.EVT_RIGHT_DOWN, self.OnGraphRightClick)
+		self.graphs.Bind (wx.EVT_MOUSEWHEEL, self.OnGraphWheel)
+		self.graphs.Bind (wx.EVT_LEFT_DOWN, self.OnGraphLeftDown)
+		self.graphs.Bind (wx.EVT_LEFT_DCLICK, self.OnGraphLeftDClick)
+		self.graphs.Bind (wx.EVT_LEFT_UP, self.OnGraphLeftUp)
+		self.graphs.Bind (wx.EVT_MOTION, self.OnGraphMotion)
 		self.trace_legend.Bind (wx.EVT_RIGHT_DOWN, self.OnGraphRightClick)
+		self.overview.Bind (wx.EVT_LEFT_DOWN, self.OnOverviewMouse)
+		self.overview.Bind (wx.EVT_MOTION, self.OnOverviewMouse)
 		self.Bind (wx.EVT_SIZE, self.OnSize)
 		self.Bind (wx.EVT_SCROLLWIN, self.OnScroll)
 		
@@ -321,16 +720,83 @@ class TraceWindow (wx.Panel):
 			, thumbSize= 4096
 			, range = 4096
 			, refresh=True)
-		self.SetScrollbar (wx.VERTICAL	# calibrate the vertical scrollbar in traces
-			, position = self.tracescroll
-			, thumbSize= self.graphs.TRACE_MAX
-			, range = self.graphs.TRACE_MAX
-			, refresh=True)
+		self._calibrate_traces()	# calibrate the vertical scrollbar in traces
 			
+	def AddBus (self, name, channels):
+		'''Add a lane showing channels, most significant first, as one value.'''
+		self.graphs.data.add_bus (name, channels)
+		self._update_rows()
+		
+	def AddDerivedTrace (self, name, expression):
+		'''Add a channel computed from the captured ones.'''
+		self.graphs.data.add_derived (name, expression)
+		self._update_rows()
+		
 	def AddToolWindow (self, tool):
 		self.tool_windows.append (tool)
 		tool.Show()
+		
+	def _cursor_at (self, x):
+		'''Return the index of the cursor within a few pixels of x, or None.'''
+		for i, sample in enumerate (self.cursors):
+			if abs (self.graphs.CalcSampleX (sample) - x) <= self.CURSOR_REACH:
+				return i
+		return None
+		
+	def _cursor_readings (self):
+		'''Return the intervals between cursors, and the value of each shown channel at the active cursor.'''
+		data = self.graphs.data
+		intervals = []
+		for i in xrange (1, len (self.cursors)):
+			dt = float (self.cursors[i] - self.cursors[i-1]) / data.frequency
+			text = 'C%d-C%d %s' % (i, i+1, time_with_units (dt))
+			if dt:
+				text += ' (%s)' % (frequency_with_units (1.0 / abs (dt)),)
+			intervals.append (text)
+		values = ''
+		if self.active_cursor is not None:
+			sample = self.cursors[self.active_cursor]
+			readings = []
+			for channel in self.graphs.rows:
+				name = data.channel_name (channel) or str (channel)
+				if channel >= BUS_CHANNELS:
+					value = '%0*X' % ((data.bus_width (channel) + 3) // 4, data.channel_data (channel)[sample])
+				else:
+					value = '%d' % (data.channel_level (channel, sample),)
+				readings.append ('%s=%s' % (name, value))
+			values = 'C%d %d: %s' % (self.active_cursor+1, sample, ' '.join (readings))
+		return '  '.join (intervals), values
+		
+	def _snap_to_edge (self, x, y):
+		'''Return the sample at x, moved to the nearest edge on the channel at y if one is close.'''
+		graphs = self.graphs
+		data = graphs.data
+		sample = int (max (0, min (graphs.CalcXSample (x), data.read_count - 1)))
+		row = y / graphs.TRACE_HEIGHT + self.tracescroll
+		if 0 <= row < len (graphs.rows):
+			edge = data.nearest_edge (graphs.rows[row], sample, self.CURSOR_REACH / (graphs.scale * self.zoom))
+			if edge is not None:
+				sample = edge
+		return sample
+		
+	def _update_cursors (self):
+		self.graphs.SetCursors (self.cursors)
+		if self.status_report is not None:
+			intervals, values = self._cursor_readings()
+			self.status_report (intervals, 1)
+			self.status_report (values, 2)
 			
+	def _calibrate_traces (self):
+		rows = len (self.graphs.rows)
+		shown = max (1, self.graphs.GetClientSizeTuple()[1] // self.graphs.TRACE_HEIGHT)
+		self.tracescroll = max (0, min (self.tracescroll, rows - shown))
+		self.SetScrollbar (wx.VERTICAL
+			, position = self.tracescroll
+			, thumbSize= shown
+			, range = rows
+			, refresh=True)
+		
+
 	def _calibrate_time (self):
 		data = self.graphs.data
 		if data is not None:
@@ -339,7 +805,17 @@ class TraceWindow (wx.Panel):
 				, thumbSize= data.read_count / self.zoom
 				, range = data.read_count
 				, refresh=True)
+			self.overview.SetView (self.timescroll, data.read_count / self.zoom)
 
+	def ClearAnnotations (self):
+		self.annotations.clear()
+		self.graphs.SetAnnotations (())
+		
+	def ClearCursors (self):
+		self.cursors = []
+		self.active_cursor = None
+		self._update_cursors()
+		
 	def Destroy (self):
 		for t in self.tool_windows:
 			t.Destroy()
@@ -347,34 +823,141 @@ class TraceWindow (wx.Panel):
 		
 	def GetData (self):
 		'''Return the sample data set for this trace window.'''
+		self.LoadDeferred()
 		return self.graphs.data
 		
+	def GetView (self):
+		'''Return a dict describing the zoom and scroll positions.'''
+		view = {'zoom': self.zoom, 'timescroll': self.timescroll, 'tracescroll': self.tracescroll}
+		if self.cursors:
+			view['cursors'] = list (self.cursors)
+		if self.hidden:
+			view['hidden'] = sorted (self.hidden)
+		if self.graphs.data is not None and self.graphs.data.derived:
+			view['derived'] = list (self.graphs.data.derived)
+		if self.graphs.data is not None and self.graphs.data.buses:
+			view['buses'] = list (self.graphs.data.buses)
+		return view
+		
+	def HideTrace (self, channel):
+		self.hidden.add (channel)
+		self._update_rows()
+		
+	def LoadDeferred (self):
+		'''Load data put off by SetDeferredData.'''
+		if self.deferred is not None:
+			(loader, view), self.deferred = self.deferred, None
+			data = loader()
+			for name, expression in view.get ('derived', []):
+				try:
+					data.add_derived (name, expression)
+				except ValueError, e:	# not an expression this version will run
+					log_error ('Derived trace %r not restored: %s' % (name, e))
+			for name, channels in view.get ('buses', []):
+				try:
+					data.add_bus (name, channels)
+				except ValueError, e:
+					log_error ('Bus %r not restored: %s' % (name, e))
+			self.hidden = set (view.get ('hidden', []))
+			self.SetData (data)
+			self.SetZoom (view.get ('zoom', 1))
+			self.ScrollToSample (view.get ('timescroll', 0))
+			self.ScrollToTrace (view.get ('tracescroll', 0))
+			self.cursors = list (view.get ('cursors', []))
+			self.graphs.SetCursors (self.cursors)
+				
 	def OnGraphRightClick (self, evt):
-		trace = evt.m_y / self.graphs.TRACE_HEIGHT + self.tracescroll
-		if 0 <= trace < self.graphs.TRACE_MAX:
-			d = TracePropertiesDialog (self, trace, self.trace_legend.legends.get (trace, ''))
+		row = evt.m_y / self.graphs.TRACE_HEIGHT + self.tracescroll
+		if 0 <= row < len (self.graphs.rows) and self.graphs.data is not None:
+			trace = self.graphs.rows[row]
+			data = self.graphs.data
+			d = TracePropertiesDialog (self, trace, data.channel_name (trace))
 			if wx.ID_OK == d.ShowModal():
-				self.trace_legend.SetLegend (trace, d.GetValue())
+				if trace >= BUS_CHANNELS:
+					data.buses[trace - BUS_CHANNELS] = (d.GetValue(), data.buses[trace - BUS_CHANNELS][1])
+					self.trace_legend.ShowLegend (trace, d.GetValue())
+				elif trace >= CAPTURE_CHANNELS:
+					data.derived[trace - CAPTURE_CHANNELS] = (d.GetValue(), data.derived[trace - CAPTURE_CHANNELS][1])
+					self.trace_legend.ShowLegend (trace, d.GetValue())
+				else:
+					self.trace_legend.SetLegend (trace, d.GetValue())
+				if d.IsHidden():
+					self.HideTrace (trace)
 				s = self.GetContainingSizer()
 				if s:
 					s.Fit (self)
+			d.Destroy()
 				
+	def OnGraphLeftDClick (self, evt):
+		'''Remove the cursor under the mouse.'''
+		i = self._cursor_at (evt.m_x)
+		if i is not None:
+			del self.cursors[i]
+			self.active_cursor = None
+			self._update_cursors()
+		
+	def OnGraphLeftDown (self, evt):
+		'''Grab the cursor under the mouse, or place a new one.'''
+		if self.graphs.data is None:
+			return
+		i = self._cursor_at (evt.m_x)
+		if i is None:
+			self.cursors.append (self._snap_to_edge (evt.m_x, evt.m_y))
+			i = len (self.cursors) - 1
+		self.active_cursor = i
+		self.graphs.CaptureMouse()
+		self._update_cursors()
+		
+	def OnGraphLeftUp (self, evt):
+		if self.graphs.HasCapture():
+			self.graphs.ReleaseMouse()
+		evt.Skip()
+		
+	def OnGraphMotion (self, evt):
+		'''Drag the grabbed cursor, snapping it to edges on the channel under the mouse.'''
+		if evt.Dragging() and evt.LeftIsDown() and self.graphs.HasCapture() and self.active_cursor is not None:
+			sample = self._snap_to_edge (evt.m_x, evt.m_y)
+			if sample != self.cursors[self.active_cursor]:
+				self.cursors[self.active_cursor] = sample
+				self._update_cursors()
+		evt.Skip()
+		
+	def OnGraphWheel (self, evt):
+		'''Zoom in or out by 2 for each notch of the mouse wheel, keeping the sample under the mouse in place.
+		
+		High resolution wheels report fractions of a notch; they add up
+		until they make a whole one.'''
+		delta = max (1, evt.GetWheelDelta())
+		self.wheel_rotation += evt.GetWheelRotation()
+		notches = int (float (self.wheel_rotation) / delta)	# rounded toward zero, either way
+		self.wheel_rotation -= notches * delta
+		if notches > 0:
+			self.ZoomAt (self.zoom << notches, evt.m_x)
+		elif notches < 0:
+			self.ZoomAt (self.zoom >> -notches, evt.m_x)
+		
+	def OnOverviewMouse (self, evt):
+		'''Centre the display on the sample clicked in the overview.'''
+		data = self.graphs.data
+		if data is None or not evt.LeftIsDown():
+			return
+		shown = data.read_count / self.zoom
+		sample = self.overview.CalcXSample (evt.m_x)
+		self.ScrollToSample (int (max (0, min (sample - shown / 2, data.read_count - shown))))
+		
 	def OnScroll (self, evt):
 		spos = evt.GetPosition()
 		orientation = evt.GetOrientation()
 		if orientation == wx.HORIZONTAL:
 			# spos is the sample number to show at the left of the display
-			self.graphs.ScrollToSample (spos)
-			self.time_legend.ScrollToSample (spos)
-			self.timescroll = spos
+			self.ScrollToSample (spos)
 		elif orientation == wx.VERTICAL:
-			# spos is the trace number to show at the top of the display
-			self.graphs.ScrollToTrace (spos)
-			self.trace_legend.ScrollToTrace (spos)
-			self.tracescroll = spos
+			# spos is the row number to show at the top of the display
+			self.ScrollToTrace (spos)
 				
 	def OnSize (self, evt):
 		wx.CallAfter (self._calibrate_time)
+		wx.CallAfter (self._calibrate_traces)
 		evt.Skip()
 		
 	def RemoveToolWindow (self, tool):
@@ -384,22 +967,102 @@ class TraceWindow (wx.Panel):
 				keepers.append (t)
 		self.tool_windows[:] = keepers
 		
+	def ScrollToSample (self, sample):
+		'''Show sample number sample at the left of the display.'''
+		self.graphs.ScrollToSample (sample)
+		self.time_legend.ScrollToSample (sample)
+		self.timescroll = sample
+		self.SetScrollPos (wx.HORIZONTAL, sample)
+		if self.graphs.data is not None:
+			self.overview.SetView (sample, self.graphs.data.read_count / self.zoom)
+		
+	def ScrollToTrace (self, trace):
+		'''Show row number trace at the top of the display.'''
+		self.tracescroll = trace
+		self._calibrate_traces()
+		self.graphs.ScrollToTrace (self.tracescroll)
+		self.trace_legend.ScrollToTrace (self.tracescroll)
+		
 	def SetData (self, data):
+		if self.persistence is not None:
+			self.persistence.add (data)
 		self.graphs.SetData (data)
 		self.time_legend.SetData (data)
 		self.trace_legend.SetData (data)
+		self.overview.SetData (data)
+		self._update_rows()
 		self._calibrate_time ()
+		if self.persistence is not None:
+			self._report_persistence()
+		
+	def SetAnnotations (self, source, annotations):
+		'''Show decoded events, as (start, end, label, channel) tuples, in place of any from the same source.'''
+		self.annotations[source] = AnnotationIndex (annotations)
+		self.graphs.SetAnnotations ([self.annotations[k] for k in sorted (self.annotations)])
+		
+	def SetPersistence (self, on):
+		'''Start accumulating the capture shown, and every one after it, into a persistence map; or stop.'''
+		if on and self.graphs.data is not None:
+			self.persistence = logic_sniffer_render.PersistenceMap (self.graphs.data, self.graphs.rows)
+		else:
+			self.persistence = None
+		self.graphs.SetPersistence (self.persistence)
+		self._report_persistence()
+		
+	def _report_persistence (self):
+		if self.status_report is not None:
+			if self.persistence is None:
+				self.status_report ('Persistence off', 0)
+			else:
+				self.status_report ('Persistence: %d captures' % (self.persistence.count,), 0)
+		
+	def SetDeferredData (self, loader, view):
+		'''Arrange for loader() to supply this page's data when it is first shown.'''
+		self.deferred = (loader, view)
 		
 	def SetTitle (self, title):
 		for tw in self.tool_windows:
 			tw.SetTitle (title)
 		
+	def ShowAllTraces (self):
+		self.hidden.clear()
+		self._update_rows()
+		
+	def _update_rows (self):
+		'''Show a row for each enabled, unhidden channel, then the derived channels and buses.'''
+		data = self.graphs.data
+		rows = [c for c in data.channel_set() if c not in self.hidden]
+		rows += [c for c in xrange (CAPTURE_CHANNELS, CAPTURE_CHANNELS + len (data.derived)) if c not in self.hidden]
+		rows += [c for c in xrange (BUS_CHANNELS, BUS_CHANNELS + len (data.buses)) if c not in self.hidden]
+		self.graphs.SetRows (rows)
+		self.trace_legend.SetRows (rows)
+		self.overview.SetRows (rows)
+		self.ScrollToTrace (self.tracescroll)
+		
 	def SetZoom (self, zoom):
 		self.zoom = max (1, zoom)
 		self.graphs.SetZoom (zoom)
 		self.time_legend.SetZoom (zoom)
 		self._calibrate_time ()
 				
+	def ZoomAt (self, zoom, x):
+		'''Zoom to zoom, keeping the sample at pixel x of the display where it is.'''
+		graphs = self.graphs
+		if graphs.data is None:
+			return
+		zoom = max (1, min (zoom, int (self.MAX_SAMPLE_WIDTH / graphs.scale)))
+		if zoom == self.zoom:
+			return
+		sample = graphs.CalcXSample (x)
+		scale = graphs.scale * zoom
+		shown = graphs.GetClientSizeTuple()[0] / scale	# samples across the display
+		left = int (max (0, min (sample - x / scale, graphs.data.read_count - shown)))
+		self.zoom = zoom
+		self.timescroll = left
+		graphs.SetZoom (zoom, left)
+		self.time_legend.SetZoom (zoom, left)
+		self._calibrate_time ()
+		
 	def ZoomIn (self, factor):
 		self.SetZoom (self.zoom * factor)
 		
@@ -410,14 +1073,42 @@ class TraceWindow (wx.Panel):
 			pass
 		
 
+#-----------------------------------------------------------
+class DeferredPage (wx.Panel):
+	'''Notebook page whose contents are created when it is first shown.'''
+	def __init__ (self, parent, factory):
+		wx.Panel.__init__ (self, parent, wx.ID_ANY)
+		self.factory = factory		# factory (parent) returns the page contents
+		self.content = None
+		self.SetSizer (wx.BoxSizer (wx.VERTICAL))
+		
+	def LoadDeferred (self):
+		'''Create the page contents, if that hasn't been done yet.'''
+		if self.factory is not None:
+			factory, self.factory = self.factory, None
+			self.content = factory (self)
+			self.GetSizer().Add (self.content, 1, wx.EXPAND)
+			self.Layout()
+		
+
 #===========================================================
 class MyFrame (wx.Frame):
 	'''Top application frame.'''
-	def __init__ (self, plugin_tools=()):
+	def __init__ (self, plugin_tools=(), catalog_path=None):
 		wx.Frame.__init__ (self, None, wx.ID_ANY, 'Logic Sniffer')
 		self.traces = None
 		self.plugins = []
 		self.capture_serial = 0
+		self.saves = []		# BackgroundSave threads still running
+		try:
+			self.catalog = logic_sniffer_catalog.CaptureCatalog (catalog_path)
+		except sqlite3.Error, e:
+			log_error ('Capture catalog could not be opened: %s' % (e,))
+			self.catalog = None	# carry on without one
+		self.pending_status = {}	# status bar field -> text not shown yet
+		self.status_timer = wx.Timer (self)
+		self.Bind (wx.EVT_TIMER, self.OnStatusTimer, self.status_timer)
+		self.Bind (wx.EVT_CLOSE, self.OnClose)
 		
 		self.timescale_auto = True
 		self.timescale_tick = 1000
@@ -428,6 +1119,7 @@ class MyFrame (wx.Frame):
 			
 		self.SetMenuBar (self._main_menu())
 		self.tracebook.Bind (wx.EVT_RIGHT_DOWN, self.OnBookRClick)
+		self.tracebook.Bind (wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnBookPageChanged)
 		
 		if verbose_flag:	print 'Plugins:', repr (plugin_tools)
 		self._load_plugins (plugin_tools)
@@ -480,10 +1172,18 @@ class MyFrame (wx.Frame):
 		append_bound_item (filemenu, None, itemid=wx.ID_SAVE)
 		append_bound_item (filemenu, self.OnFileSaveAs, itemid=wx.ID_SAVEAS)
 		append_bound_item (filemenu, self.OnFileExportCsv, '&Export to CSV...')
+		append_bound_item (filemenu, self.OnFileExportSigrok, 'Export to si&grok...')
+		append_bound_item (filemenu, self.OnFileExportImage, 'Export Ima&ge...')
+		append_bound_item (filemenu, self.OnFileImportVcd, '&Import VCD...')
+		filemenu.AppendSeparator ()
+		append_bound_item (filemenu, self.OnFileOpenSession, 'Open Sess&ion...')
+		append_bound_item (filemenu, self.OnFileSaveSession, 'Save Sessio&n...')
+		append_bound_item (filemenu, self.OnFileCatalog, 'Capture Cata&log...')
 		filemenu.AppendSeparator ()
 		append_bound_item (filemenu, self.OnFileLoadSumpConfig, '&Load SUMP Config...')
 		append_bound_item (filemenu, self.OnFileSaveSumpConfigAs, 'Sa&ve SUMP Config...')
 		filemenu.AppendSeparator ()
+		append_bound_item (filemenu, self.OnFileCancelSaves, 'Cancel Savin&g')
 		append_bound_item (filemenu, self.OnFileClose, '&Close Tab', wx.ID_CLOSE)
 		filemenu.AppendSeparator()
 		#~ append_bound_item (filemenu, None, itemid=wx.ID_PRINT)
@@ -495,6 +1195,12 @@ class MyFrame (wx.Frame):
 		menubar.Append (viewmenu, '&View')
 		append_bound_item (viewmenu, self.OnViewMetadata, '&Metadata')
 		append_bound_item (viewmenu, self.OnViewLegend, '&Legend')	# edit trace legends
+		append_bound_item (viewmenu, self.OnViewAddDerived, 'Add &Derived Trace...')
+		append_bound_item (viewmenu, self.OnViewAddBus, 'Add &Bus...')
+		append_bound_item (viewmenu, self.OnViewShowAll, 'Show &All Traces')
+		append_bound_item (viewmenu, self.OnViewClearCursors, '&Clear Cursors')
+		append_bound_item (viewmenu, self.OnViewClearAnnotations, 'Clear A&nnotations')
+		append_bound_item (viewmenu, self.OnViewPersistence, '&Persistence')	# accumulate repeated captures
 		append_bound_item (viewmenu, self.OnViewTimeScale, '&Time Scale ...')	# edit time scale units
 		append_bound_item (viewmenu, self.OnViewZoom, '&Zoom ...')
 		append_bound_item (viewmenu, self.OnViewZoomIn, 'Zoom &In')
@@ -519,6 +1225,22 @@ class MyFrame (wx.Frame):
 		append_bound_item (helpmenu, self.OnHelpAbout, itemid=wx.ID_ABOUT)
 		return menubar
 			
+	def _add_deferred_analyzer (self, tab, source_page):
+		'''Add an analyzer page from a session, to be run when it is first shown.'''
+		try:
+			plugin = self._plugin_named (tab.plugin)
+		except ImportError:
+			log_error ('Session plugin %s could not be loaded' % (tab.plugin,))
+			return None
+		def factory (parent, module=plugin.module, settings=tab.plugin_settings):
+			return module.AnalyzerPanel (parent, settings, source_page.GetData())
+		page = DeferredPage (self.tracebook, factory)
+		page.plugin_name = tab.plugin
+		page.settings = tab.plugin_settings
+		page.source_page = source_page
+		self.tracebook.AddPage (page, tab.title, select=False)
+		return page
+		
 	def _captured_sump_data (self, settings, data):
 		return TraceData (settings.get_sample_rate()	# sample frequency in Hz
 				, settings.read_count	# number of samples
@@ -527,16 +1249,142 @@ class MyFrame (wx.Frame):
 				, data			# array of 32-bit readings
 				)
 		
-	def _new_capture_page (self):
+	def _empty_capture_page (self, title=None):
+		'''Return the selected page if it's a capture page with no data yet, or else a new capture page.'''
+		tw = self._selected_page()
+		if isinstance (tw, TraceWindow) and tw.GetData() is None:
+			return tw
+		return self._new_capture_page (title)
+		
+	def _new_capture_page (self, title=None, select=True):
 		new_trace = TraceWindow (self.tracebook)
 		self.capture_serial += 1
-		self.tracebook.AddPage (new_trace, 'Capture %d' % (self.capture_serial,), select=True)
+		if title is None:
+			title = 'Capture %d' % (self.capture_serial,)
+		self.tracebook.AddPage (new_trace, title, select=select)
 		new_trace.graphs.Bind (wx.EVT_MOTION, self.OnGraphMouseMotion)
+		new_trace.status_report = self._set_status
 		return new_trace
 		
+	def _open_session (self, path):
+		'''Add the pages saved in session file path, or report why it can't be read.'''
+		import ConfigParser, zipfile
+		try:
+			tabs, selected = logic_sniffer_save.from_session_file (path)
+		except (IOError, KeyError, SyntaxError, ValueError, zipfile.BadZipfile, ConfigParser.Error), e:
+			wx.MessageBox ('Opening %s\n\n%s: %s' % (path, e.__class__.__name__, e), 'Open Session Error', wx.ICON_ERROR|wx.CANCEL)
+			return
+		first_page = self.tracebook.GetPageCount()
+		pages = {}		# tab index -> page, for the tabs that could be opened
+		capture_pages = {}
+		for i, tab in enumerate (tabs):
+			if tab.kind == 'capture':
+				tw = self._new_capture_page (tab.title, select=False)
+				if tab.settings is not None:
+					tw.settings = tab.settings
+				tw.SetDeferredData (tab.load_data, tab.view)
+				pages[i] = capture_pages[i] = tw
+			elif tab.kind == 'analyzer' and tab.source in capture_pages:
+				page = self._add_deferred_analyzer (tab, capture_pages[tab.source])
+				if page is not None:
+					pages[i] = page
+		if selected in pages:
+			page = pages[selected]
+		elif first_page < self.tracebook.GetPageCount():
+			page = self.tracebook.GetPage (first_page)
+		else:
+			return
+		for x in xrange (first_page, self.tracebook.GetPageCount()):
+			if self.tracebook.GetPage (x) is page:
+				self.tracebook.SetSelection (x)
+		page.LoadDeferred()
+		
+	def _page_title (self, page):
+		book = self.tracebook
+		for i in xrange (book.GetPageCount()):
+			if book.GetPage (i) is page:
+				return book.GetPageText (i)
+		return None
+		
+	def _plugin_named (self, module_name):
+		'''Return the loaded plugin for a module name, loading it if necessary.'''
+		for plugin in self.plugins:
+			if plugin.module.__name__ == module_name:
+				return plugin
+		self._load_a_plugin (module_name)
+		return self.plugins[-1]
+		
+	def _save_done (self, save):
+		'''Report the end of a background save.'''
+		if not self:	# the frame closed while this event was queued
+			return
+		self.saves.remove (save)
+		name = os.path.basename (save.path)
+		if save.error is not None:
+			self.GetStatusBar().SetStatusText ('Failed saving %s' % (name,), 3)
+			wx.MessageBox ('Saving %s\n\n%s' % (save.path, save.error), 'Save Error', wx.ICON_ERROR|wx.CANCEL)
+		elif save.cancelled.is_set():
+			self.GetStatusBar().SetStatusText ('Cancelled saving %s' % (name,), 3)
+		else:
+			self.GetStatusBar().SetStatusText ('Saved %s' % (name,), 3)
+			for tab, data, title in getattr (save, 'catalog_entries', ()):
+				if self.catalog is not None:
+					try:
+						self.catalog.add (save.path, data, title, tab)
+					except sqlite3.Error, e:
+						log_error ('%s not catalogued: %s' % (save.path, e))
+			
+	def _save_progress (self, save, fraction):
+		'''Show the progress of a background save.'''
+		if self and save in self.saves and not save.cancelled.is_set():
+			self.GetStatusBar().SetStatusText ('Saving %s %d%%' % (os.path.basename (save.path), int (fraction*100)), 3)
+		
 	def _selected_page (self):
 		return self.tracebook.GetCurrentPage()
-				
+		
+	def _set_status (self, text, field=0):
+		'''Show text in the status bar, at most once per screen refresh.'''
+		self.pending_status[field] = text
+		if not self.status_timer.IsRunning():
+			self.status_timer.Start (STATUS_INTERVAL, wx.TIMER_ONE_SHOT)
+		
+	def _start_save (self, writer, path, *args, **kwargs):
+		'''Run a writer on a background thread, reporting progress in the status bar.
+		
+		args should be snapshots that the GUI won't change while the writer runs.
+		catalog_entries, a list of (tab, data, title), are the captures to
+		record in the capture catalog once the save succeeds.'''
+		save = logic_sniffer_save.BackgroundSave (writer, path, args
+				, progress=lambda save, fraction: wx.CallAfter (self._save_progress, save, fraction)
+				, done=lambda save: wx.CallAfter (self._save_done, save)
+				)
+		save.catalog_entries = kwargs.get ('catalog_entries', ())
+		self.saves.append (save)
+		save.start()
+		return save
+		
+	def _session_tabs (self):
+		'''Return SessionTab descriptions of the notebook pages, and the index of the selected one.'''
+		book = self.tracebook
+		tabs = []
+		selected = 0
+		capture_index = {}	# id (capture page) -> index into tabs
+		for i in xrange (book.GetPageCount()):
+			page = book.GetPage (i)
+			if isinstance (page, TraceWindow) and page.GetData() is not None:
+				capture_index[id (page)] = len (tabs)
+				tabs.append (logic_sniffer_save.SessionTab ('capture', book.GetPageText (i)
+						, page.GetData().snapshot(), page.settings.clone(), page.GetView()))
+			elif id (getattr (page, 'source_page', None)) in capture_index:
+				tabs.append (logic_sniffer_save.SessionTab ('analyzer', book.GetPageText (i)
+						, plugin=page.plugin_name, plugin_settings=dict (page.settings)
+						, source=capture_index[id (page.source_page)]))
+			else:
+				continue	# nothing on this page can be saved
+			if i == book.GetSelection():
+				selected = len (tabs) - 1
+		return tabs, selected
+		
 	def DoCapture (self):
 		if sniffer is None:
 			wx.MessageBox ('There is no SUMP device connected.', 'SUMP Error',  wx.CANCEL|wx.ICON_ERROR)
@@ -561,6 +1409,18 @@ class MyFrame (wx.Frame):
 		sys.stderr.write ('simulated\n'); sys.stderr.flush()
 		tw.SetData (self._captured_sump_data (tw.settings, d))
 		
+	def OnBookPageChanged (self, evt):
+		'''Finish loading a page from a session when it is first shown.'''
+		page = self.tracebook.GetPage (evt.GetSelection())
+		deferred = getattr (page, 'LoadDeferred', None)
+		if deferred is not None:
+			wx.BeginBusyCursor()
+			try:
+				deferred()
+			finally:
+				wx.EndBusyCursor()
+		evt.Skip()
+		
 	def OnBookRClick (self, evt):
 		'''Handle right-click on one of the notebook's page tabs.'''
 		ctrl = evt.GetEventObject()
@@ -573,6 +1433,14 @@ class MyFrame (wx.Frame):
 				self.tracebook.GetPage (page).SetTitle (title)
 			d.Destroy()
 		
+	def OnClose (self, evt):
+		'''Close the frame, however that was asked for.'''
+		for save in self.saves:	# don't leave partial files behind
+			save.cancel()
+		for save in self.saves:
+			save.join()
+		self.Destroy()
+		
 	def OnDeviceCapture (self, evt):
 		tw = self._selected_page()
 		d = SumpDialog (self, tw.settings)
@@ -609,14 +1477,45 @@ class MyFrame (wx.Frame):
 	def OnDeviceSetup (self, evt):
 		pass
 		
+	def OnFileCatalog (self, evt):
+		'''Find a saved capture in the catalog and open it.'''
+		if self.catalog is None:
+			wx.MessageBox ('The capture catalog could not be opened.', 'Catalog', wx.ICON_ERROR|wx.CANCEL)
+			return
+		d = CatalogDialog (self, self.catalog)
+		if d.ShowModal() == wx.ID_OK and d.GetValue() is not None:
+			import ConfigParser, cPickle, zipfile
+			path, tab = d.GetValue()
+			busy = wx.BusyCursor()
+			try:
+				if logic_sniffer_catalog.capture_kind (path) == 'session':
+					tabs, selected = logic_sniffer_save.from_session_file (path)
+					title, sample = tabs[tab].title, tabs[tab].load_data()
+				else:
+					title, sample = None, logic_sniffer_save.from_file (path)
+			except (EnvironmentError, EOFError, IndexError, KeyError, SyntaxError, ValueError
+					, cPickle.UnpicklingError, zipfile.BadZipfile, ConfigParser.Error), e:
+				del busy
+				wx.MessageBox ('Opening %s\n\n%s: %s' % (path, e.__class__.__name__, e), 'Catalog Error', wx.ICON_ERROR|wx.CANCEL)
+				self.catalog.forget (path)	# changed or gone since it was catalogued
+			else:
+				self._empty_capture_page (title).SetData (sample)
+				del busy
+		d.Destroy()
+		
 	def OnFileClose (self, evt):
 		'''Close the currently selected sample page.'''
 		x = self.tracebook.GetSelection ()
 		if x > -1:
 			self.tracebook.DeletePage (x)
 		
+	def OnFileCancelSaves (self, evt):
+		'''Stop any saves running in the background.'''
+		for save in self.saves:
+			save.cancel()
+		
 	def OnFileExit (self, evt):
-		self.Destroy()
+		self.Close()
 		
 	def OnFileExportCsv (self, evt):
 		'''Save the current SUMP capture to a CSV file.'''
@@ -624,8 +1523,62 @@ class MyFrame (wx.Frame):
 				, wildcard=csv_wildcards
 				, style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
 		page = self._selected_page()
+		if d.ShowModal() == wx.ID_OK and page.graphs.data is not None:
+			self._start_save (logic_sniffer_save.to_csv, d.GetPath(), page.graphs.data.snapshot())
+		d.Destroy()
+		
+	def OnFileExportImage (self, evt):
+		'''Save the traces in view as a PNG or SVG image.'''
+		d = wx.FileDialog (self, 'Export Image...'
+				, wildcard=image_wildcards
+				, style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
+		page = self._selected_page()
+		if d.ShowModal() == wx.ID_OK and page.graphs.data is not None:
+			image_format = logic_sniffer_export.image_formats[d.GetFilterIndex()]
+			path = d.GetPath()
+			if not os.path.splitext (path)[1]:
+				path += '.' + image_format
+			graphs = page.graphs
+			width, height = graphs.GetClientSizeTuple()
+			self._start_save (logic_sniffer_export.to_image, path, graphs.data.snapshot(), list (graphs.rows)
+					, graphs.CalcXSample (0), graphs.CalcXSample (width), width, image_format)
+		d.Destroy()
+		
+	def OnFileExportSigrok (self, evt):
+		'''Save the current SUMP capture to a sigrok session file.'''
+		d = wx.FileDialog (self, 'Export to sigrok...'
+				, wildcard=sigrok_wildcards
+				, style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
+		page = self._selected_page()
+		if d.ShowModal() == wx.ID_OK and page.graphs.data is not None:
+			path = d.GetPath()
+			if not os.path.splitext (path)[1]:
+				path += '.sr'
+			data = page.graphs.data.snapshot()
+			self._start_save (logic_sniffer_save.to_sigrok, path, data, catalog_entries=[(0, data, self._page_title (page))])
+		d.Destroy()
+		
+	def OnFileImportVcd (self, evt):
+		'''Load a simulator Value Change Dump into a SUMP Capture page.'''
+		d = wx.FileDialog (self, 'Import VCD from...'
+				, wildcard=vcd_wildcards
+				, style=wx.FD_OPEN|wx.FD_FILE_MUST_EXIST)
 		if d.ShowModal() == wx.ID_OK:
-			logic_sniffer_save.to_csv (d.GetPath(), page.graphs.data)
+			path = d.GetPath()
+			rd = VcdImportDialog (self)
+			if rd.ShowModal() == wx.ID_OK and rd.Validate():
+				wx.BeginBusyCursor()
+				try:
+					sample = logic_sniffer_vcd.read_vcd (path, rd.GetValue())
+				except (logic_sniffer_vcd.VcdError, ValueError), e:
+					sample = None
+					error = str (e)
+				wx.EndBusyCursor()
+				if sample is None:
+					wx.MessageBox ('Importing %s\n\n%s' % (path, error), 'VCD Error', wx.ICON_ERROR|wx.CANCEL)
+				else:
+					self._empty_capture_page().SetData (sample)
+			rd.Destroy()
 		d.Destroy()
 		
 	def OnFileLoadSumpConfig (self, evt):
@@ -637,9 +1590,14 @@ class MyFrame (wx.Frame):
 		if hasattr (page, 'config_path'):
 			d.SetPath (page.config_path)
 		if d.ShowModal() == wx.ID_OK:
+			import ConfigParser
 			config_path = d.GetPath()
-			page.settings = sump_config_file.load_config (config_path)
-			page.config_path = config_path
+			try:
+				page.settings = sump_config_file.load_config (config_path)
+			except (IOError, ValueError, ConfigParser.Error), e:
+				wx.MessageBox ('Loading %s\n\n%s' % (config_path, e), 'SUMP Settings Error', wx.ICON_ERROR|wx.CANCEL)
+			else:
+				page.config_path = config_path
 		d.Destroy()
 		
 	def OnFileNew (self, evt):
@@ -649,11 +1607,21 @@ class MyFrame (wx.Frame):
 		'''Load previously saved data into a SUMP Capture page.'''
 		d = wx.FileDialog (self, style=wx.FD_OPEN)
 		if d.ShowModal() == wx.ID_OK:
-			tw = self._selected_page()
-			if tw.GetData() is not None:
-				tw = self._new_capture_page()
-			sample = logic_sniffer_save.from_file (d.GetPath())
-			tw.SetData (sample)
+			try:
+				sample = logic_sniffer_save.from_file (d.GetPath())
+			except ValueError, e:
+				wx.MessageBox (str (e), 'Open Error', wx.ICON_ERROR|wx.CANCEL)
+			else:
+				self._empty_capture_page().SetData (sample)
+		d.Destroy()
+		
+	def OnFileOpenSession (self, evt):
+		'''Open the pages saved in a session file.'''
+		d = wx.FileDialog (self, 'Open Session...'
+				, wildcard=session_wildcards
+				, style=wx.FD_OPEN|wx.FD_FILE_MUST_EXIST)
+		if d.ShowModal() == wx.ID_OK:
+			self._open_session (d.GetPath())
 		d.Destroy()
 		
 	def OnFilePageSetup (self, evt):
@@ -674,8 +1642,23 @@ class MyFrame (wx.Frame):
 		'''Save SUMP capture data into a file.'''
 		d = wx.FileDialog (self, style=wx.FD_SAVE)
 		page = self._selected_page()
+		if d.ShowModal() == wx.ID_OK and page.graphs.data is not None:
+			data = page.graphs.data.snapshot()
+			self._start_save (logic_sniffer_save.to_file, d.GetPath(), data, catalog_entries=[(0, data, self._page_title (page))])
+		d.Destroy()
+		
+	def OnFileSaveSession (self, evt):
+		'''Save all the pages into a session file.'''
+		d = wx.FileDialog (self, 'Save Session to...'
+				, wildcard=session_wildcards
+				, style=wx.FD_SAVE|wx.FD_OVERWRITE_PROMPT)
 		if d.ShowModal() == wx.ID_OK:
-			logic_sniffer_save.to_file (d.GetPath(), page.graphs.data)
+			path = d.GetPath()
+			if not os.path.splitext (path)[1]:
+				path += '.lss'
+			tabs, selected = self._session_tabs()
+			self._start_save (logic_sniffer_save.to_session_file, path, tabs, selected
+					, catalog_entries=[(i, t.data, t.title) for i, t in enumerate (tabs) if t.kind == 'capture'])
 		d.Destroy()
 		
 	def OnFileSaveSumpConfigAs (self, evt):
@@ -692,7 +1675,7 @@ class MyFrame (wx.Frame):
 				config_path += '.ini'
 			if not config_path.endswith ('.ini'):
 				config_path += '.sump.ini'
-			sump_config_file.save_config (config_path, page.settings)
+			self._start_save (sump_config_file.save_config, config_path, page.settings.clone())
 			page.config_path = config_path
 		d.Destroy()
 		
@@ -702,12 +1685,18 @@ class MyFrame (wx.Frame):
 			sample = graphs.CalcXSample (evt.m_x)
 			sample_time = graphs.CalcXSampleTime (evt.m_x)
 			if sample_time is not None:
-				wx.CallAfter (self.GetStatusBar().SetStatusText, '%d -- %s' % (sample, time_with_units (sample_time)))
+				self._set_status ('%d -- %s' % (sample, time_with_units (sample_time)))
 		evt.Skip()
 		
 	def OnHelpAbout (self, evt):
 		wx.MessageBox (__doc__, 'About %s' % (os.path.split (__file__)[-1],), style=wx.ICON_INFORMATION|wx.OK)
 		
+	def OnStatusTimer (self, evt):
+		statusbar = self.GetStatusBar()
+		for field, text in self.pending_status.items():
+			statusbar.SetStatusText (text, field)
+		self.pending_status.clear()
+		
 	def OnToolsLoad (self, evt):
 		d = wx.FileDialog (self, 'Python Tool Modules'
 				, wildcard=python_wildcards
@@ -746,12 +1735,57 @@ class MyFrame (wx.Frame):
 					title = self.tracebook.GetPageText (self.tracebook.GetSelection())
 					frame = plugin.module.AnalyzerFrame (tw, plugin.settings, tw.graphs.data, title)
 					tw.AddToolWindow (frame)
+					panel = frame.panel
 				else:
-					page = plugin.module.AnalyzerPanel (self.tracebook, plugin.settings, tw.graphs.data)
+					panel = page = plugin.module.AnalyzerPanel (self.tracebook, plugin.settings, tw.graphs.data)
+					page.plugin_name = plugin.module.__name__
+					page.source_page = tw
 					self.tracebook.AddPage (page, '%s %d' % (plugin.module.tool_title_string, self.tracebook.GetPageCount(),), select=True)
+				if hasattr (panel, 'annotations'):	# the analyzer publishes its decoded events
+					tw.SetAnnotations (plugin.module.__name__, panel.annotations)
 		finally:	# application might hang on shutdown if dlg crashes because of an error
 			dlg.Destroy()
 		
+	def OnViewAddBus (self, evt):
+		'''Add a lane showing a group of channels as one value.'''
+		tw = self._selected_page()
+		if not isinstance (tw, TraceWindow) or tw.GetData() is None:
+			return
+		d = BusDialog (self)
+		while d.ShowModal() == wx.ID_OK:
+			try:
+				name, channels = d.GetValue()
+				tw.AddBus (name, channels)
+				break
+			except ValueError, e:
+				wx.MessageBox (str (e), 'Bad Bus', wx.ICON_ERROR|wx.CANCEL)
+		d.Destroy()
+		
+	def OnViewAddDerived (self, evt):
+		'''Add a trace computed from the captured channels.'''
+		tw = self._selected_page()
+		if not isinstance (tw, TraceWindow) or tw.GetData() is None:
+			return
+		d = DerivedTraceDialog (self)
+		while d.ShowModal() == wx.ID_OK:
+			name, expression = d.GetValue()
+			try:
+				tw.AddDerivedTrace (name, expression)
+				break
+			except Exception, e:
+				wx.MessageBox ('%s\n\n%s' % (expression, e), 'Bad Expression', wx.ICON_ERROR|wx.CANCEL)
+		d.Destroy()
+		
+	def OnViewClearAnnotations (self, evt):
+		tw = self._selected_page()
+		if isinstance (tw, TraceWindow):
+			tw.ClearAnnotations()
+		
+	def OnViewClearCursors (self, evt):
+		tw = self._selected_page()
+		if isinstance (tw, TraceWindow):
+			tw.ClearCursors()
+		
 	def OnViewLegend (self, evt):
 		tw = self._selected_page()
 		d = LabelDialog (self, tw.trace_legend.legends)
@@ -767,6 +1801,16 @@ class MyFrame (wx.Frame):
 			d.ShowModal()
 			d.Destroy()
 		
+	def OnViewPersistence (self, evt):
+		tw = self._selected_page()
+		if isinstance (tw, TraceWindow) and tw.GetData() is not None:
+			tw.SetPersistence (tw.persistence is None)
+		
+	def OnViewShowAll (self, evt):
+		tw = self._selected_page()
+		if isinstance (tw, TraceWindow) and tw.GetData() is not None:
+			tw.ShowAllTraces()
+		
 	def OnViewTimeScale (self, evt):
 		d = TimeScaleDialog (self, self.timescale_auto, self.timescale_tick, self.timescale_unit)
 		if d.ShowModal() == wx.ID_OK:
@@ -791,7 +1835,7 @@ class MyFrame (wx.Frame):
 class MyApp (wx.App):
 	'''Application.'''
 	def OnInit (self):
-		frame = MyFrame (plugin_modules)
+		frame = MyFrame (plugin_modules, catalog_path)
 		frame.Show (True)
 		self.SetTopWindow (frame)
 		return True
@@ -825,6 +1869,7 @@ if __name__ == '__main__':
 	app_options = ConfigParser.ConfigParser ()
 	app_options.add_section ('analyzer')
 	app_options.set ('analyzer', 'baud',  str (sump.SUMP_BAUD))
+	app_options.set ('analyzer', 'catalog', logic_sniffer_catalog.default_catalog_path())
 	# apply options from user and application-level .ini files ..
 	config_paths = []
 	for d in (optional_path (os.environ.get ('HOME', None), '.logicsnifferrc')
@@ -876,6 +1921,7 @@ if __name__ == '__main__':
 	# Open up a sniffer device interface ..
 	sump_port = app_options.get ('analyzer', 'port')
 	sump_baud = int (app_options.get ('analyzer', 'baud'))
+	catalog_path = os.path.expanduser (app_options.get ('analyzer', 'catalog'))
 	try:
 		sniffer = sump.SumpInterface (sump_port, sump_baud)
 	except SerialException:
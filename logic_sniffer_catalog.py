@@ -0,0 +1,182 @@
+# -*- coding: UTF-8 -*-
+'''Searchable index of saved pyLogicSniffer captures.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+# The catalog keeps the header fields and per-channel edge counts of every
+# capture it has seen in an sqlite database, so saved captures can be found
+# without loading their samples.  A session file holds several captures;
+# each is catalogued under the file's path and its tab number.
+
+import os, sqlite3
+import numpy as np
+import logic_sniffer_save
+
+catalog_schema = '''
+CREATE TABLE IF NOT EXISTS captures (
+	path TEXT, tab INTEGER, mtime REAL, size INTEGER, title TEXT,
+	capture_time REAL, frequency INTEGER, read_count INTEGER, delay_count INTEGER,
+	channel_mask INTEGER, legends TEXT,
+	PRIMARY KEY (path, tab));
+CREATE TABLE IF NOT EXISTS edges (
+	path TEXT, tab INTEGER, channel INTEGER, count INTEGER,
+	PRIMARY KEY (path, tab, channel));
+'''
+capture_fields = ('path', 'tab', 'mtime', 'size', 'title', 'capture_time', 'frequency'
+		, 'read_count', 'delay_count', 'channel_mask', 'legends')
+
+def default_catalog_path ():
+	'''Return the path of the user's catalog database.'''
+	return os.path.join (os.path.expanduser ('~'), '.logicsniffer_catalog.db')
+
+def like_pattern (text):
+	'''Escape LIKE wildcards in text, for a pattern used with ESCAPE '\\'.'''
+	return text.replace ('\\', '\\\\').replace ('%', '\\%').replace ('_', '\\_')
+
+def edge_counts (capture):
+	'''Return a dict relating enabled channel numbers to their number of transitions.'''
+	changes = capture.data[1:] ^ capture.data[:-1]
+	return dict ((c, int (np.count_nonzero (changes & (1 << c)))) for c in capture.channel_set())
+
+def capture_kind (path):
+	'''Return 'capture', 'session' or None, judging by the start of a file.'''
+	try:
+		with open (path, 'rb') as f:
+			head = f.read (32)
+	except IOError:
+		return None
+	if head.startswith ('#Sump analyzer'):
+		return 'capture'
+	if head.startswith ('PK'):
+		import zipfile
+		try:
+			with zipfile.ZipFile (path, 'r') as archive:
+				names = archive.namelist()
+		except zipfile.BadZipfile:
+			return None
+		if logic_sniffer_save.session_index_name in names:
+			return 'session'
+		if 'metadata' in names:
+			return 'capture'	# sigrok session
+	return None
+
+
+#===========================================================
+class CaptureCatalog (object):
+	'''sqlite index of saved capture files.'''
+	def __init__ (self, path=None):
+		if path is None:
+			path = default_catalog_path()
+		self.db = sqlite3.connect (path)
+		self.db.executescript (catalog_schema)
+
+	def close (self):
+		self.db.close()
+
+	def add (self, path, capture, title=None, tab=0):
+		'''Record a capture that has been saved at path.'''
+		path = os.path.abspath (path)
+		st = os.stat (path)
+		legends = '\n'.join ('%d=%s' % kv for kv in sorted (capture.legends.items()))
+		with self.db:
+			self.db.execute ('INSERT OR REPLACE INTO captures VALUES (?,?,?,?,?,?,?,?,?,?,?)'
+					, (path, tab, st.st_mtime, st.st_size, title, capture.capture_time, int (capture.frequency)
+					, capture.read_count, capture.delay_count, capture.channel_mask, legends))
+			self.db.execute ('DELETE FROM edges WHERE path=? AND tab=?', (path, tab))
+			self.db.executemany ('INSERT INTO edges VALUES (?,?,?,?)'
+					, [(path, tab, c, n) for c, n in edge_counts (capture).items()])
+
+	def forget (self, path):
+		'''Remove all the captures in the file at path from the catalog.'''
+		path = os.path.abspath (path)
+		with self.db:
+			self.db.execute ('DELETE FROM captures WHERE path=?', (path,))
+			self.db.execute ('DELETE FROM edges WHERE path=?', (path,))
+
+	def index_file (self, path):
+		'''Catalog the captures in a saved file, if it holds any.  Return the number catalogued.'''
+		kind = capture_kind (path)
+		self.forget (path)
+		if kind == 'capture':
+			self.add (path, logic_sniffer_save.from_file (path))
+			return 1
+		elif kind == 'session':
+			tabs, selected = logic_sniffer_save.from_session_file (path)
+			count = 0
+			for i, tab in enumerate (tabs):
+				if tab.kind == 'capture':
+					self.add (path, tab.load_data(), tab.title, i)
+					tab.data = None		# don't hold more than one capture at a time
+					count += 1
+			return count
+		return 0
+
+	def rescan (self, directory, progress=None):
+		'''Bring the catalog up to date with the files in a directory tree.
+
+		Files whose modification time and size haven't changed are not
+		reopened.  progress, if given, is called with each path examined.'''
+		directory = os.path.abspath (directory)
+		known = dict (((path, (mtime, size)) for path, mtime, size
+				in self.db.execute ("SELECT path, mtime, size FROM captures WHERE path LIKE ? ESCAPE '\\'"
+				, (like_pattern (os.path.join (directory, '')) + '%',))))
+		seen = set()
+		for dirpath, dirnames, filenames in os.walk (directory):
+			for name in filenames:
+				path = os.path.join (dirpath, name)
+				seen.add (path)
+				if progress is not None:
+					progress (path)
+				try:
+					st = os.stat (path)
+				except OSError:
+					continue
+				if known.get (path) == (st.st_mtime, st.st_size):
+					continue
+				try:
+					self.index_file (path)
+				except Exception:	# unreadable or not really a capture
+					self.forget (path)
+		for path in set (known) - seen:	# files since deleted
+			self.forget (path)
+
+	def find (self, text='', active_channel=None):
+		'''Return dicts describing the catalogued captures matching a search.
+
+		text is matched against paths, titles and legends; active_channel,
+		if given, selects captures with transitions on that channel.'''
+		query = ("SELECT captures.*, edges.channel, edges.count FROM captures"
+				" LEFT JOIN edges ON edges.path=captures.path AND edges.tab=captures.tab"
+				" WHERE (captures.path LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\' OR legends LIKE ? ESCAPE '\\')")
+		pattern = '%' + like_pattern (text) + '%'
+		args = [pattern, pattern, pattern]
+		if active_channel is not None:
+			query += ' AND EXISTS (SELECT 1 FROM edges AS e WHERE e.path=captures.path AND e.tab=captures.tab AND e.channel=? AND e.count>0)'
+			args.append (active_channel)
+		query += ' ORDER BY capture_time DESC, captures.path, captures.tab'
+		result = []
+		for row in self.db.execute (query, args):	# one row per channel of each capture
+			key = row[:2]
+			if not result or (result[-1]['path'], result[-1]['tab']) != key:
+				r = dict (zip (capture_fields, row))
+				r['legends'] = dict ((int (k), v) for k, v in (l.split ('=', 1) for l in r['legends'].split ('\n') if l))
+				r['edges'] = {}
+				result.append (r)
+			channel, count = row[len (capture_fields):]
+			if channel is not None:
+				result[-1]['edges'][channel] = count
+		return result
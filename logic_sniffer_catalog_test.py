@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for the pyLogicSniffer capture catalog.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os, shutil, tempfile, unittest
+import numpy as np
+import logic_sniffer_catalog as M
+import logic_sniffer_save
+from logic_sniffer_lib import TraceData
+
+def toggling_trace (legends):
+	'''TraceData where channel c changes level every 2**c samples.'''
+	data = np.arange (256, dtype=np.uint32)
+	return TraceData (1000000, 256, 128, 0xE, data, legends)
+
+class TestCatalog (unittest.TestCase):
+	def setUp (self):
+		self.directory = tempfile.mkdtemp()
+		self.catalog = M.CaptureCatalog (':memory:')
+		
+	def tearDown (self):
+		self.catalog.close()
+		shutil.rmtree (self.directory)
+		
+	def _path (self, name):
+		return os.path.join (self.directory, name)
+		
+	def test0 (self):
+		'''Edge counts are taken per enabled channel.'''
+		edges = M.edge_counts (toggling_trace ({}))
+		self.assertEqual (sorted (edges), range (8))
+		self.assertEqual ([edges[c] for c in xrange (8)], [255 >> c for c in xrange (8)])
+		
+	def test1 (self):
+		'''Rescan finds captures and sessions, and ignores other files.'''
+		logic_sniffer_save.to_text_file (self._path ('a.txt'), toggling_trace ({0:'clk'}))
+		logic_sniffer_save.to_sigrok (self._path ('b.sr'), toggling_trace ({1:'mosi'}))
+		tab = logic_sniffer_save.SessionTab ('capture', 'Bus', toggling_trace ({2:'miso'}))
+		logic_sniffer_save.to_session_file (self._path ('c.lss'), [tab])
+		with open (self._path ('notes.txt'), 'w') as f:
+			f.write ('not a capture\n')
+		self.catalog.rescan (self.directory)
+		found = self.catalog.find()
+		self.assertEqual (sorted (os.path.basename (r['path']) for r in found), ['a.txt', 'b.sr', 'c.lss'])
+		self.assertEqual ([r['title'] for r in self.catalog.find ('miso')], ['Bus'])
+		self.assertEqual ([r['legends'] for r in self.catalog.find ('clk')], [{0:'clk'}])
+		self.assertEqual (self.catalog.find ('clk')[0]['edges'][0], 255)
+		self.assertEqual (len (self.catalog.find (active_channel=7)), 3)
+		self.assertEqual (self.catalog.find (active_channel=8), [])
+		
+	def test2 (self):
+		'''Rescan drops deleted files and rereads changed ones.'''
+		logic_sniffer_save.to_text_file (self._path ('a.txt'), toggling_trace ({0:'clk'}))
+		logic_sniffer_save.to_text_file (self._path ('b.txt'), toggling_trace ({0:'strobe'}))
+		self.catalog.rescan (self.directory)
+		os.remove (self._path ('b.txt'))
+		logic_sniffer_save.to_text_file (self._path ('a.txt'), toggling_trace ({0:'sclk', 1:'sda'}))
+		os.utime (self._path ('a.txt'), (0, 0))
+		self.catalog.rescan (self.directory)
+		found = self.catalog.find()
+		self.assertEqual (len (found), 1)
+		self.assertEqual (found[0]['legends'], {0:'sclk', 1:'sda'})
+		
+	def test3 (self):
+		'''Captures saved from the program are added directly.'''
+		capture = toggling_trace ({0:'clk'})
+		logic_sniffer_save.to_file (self._path ('a.sump'), capture)
+		self.catalog.add (self._path ('a.sump'), capture, 'Capture 1')
+		self.assertEqual ([r['title'] for r in self.catalog.find ('Capture')], ['Capture 1'])
+		self.catalog.add (self._path ('a.sump'), capture, 'Capture 2', 1)
+		for r in self.catalog.find ('Capture'):
+			self.assertEqual (r['edges'], M.edge_counts (capture))
+		
+	def test4 (self):
+		'''Wildcard characters in searches and directory names match only themselves.'''
+		os.mkdir (self._path ('a_b'))
+		os.mkdir (self._path ('axb'))
+		logic_sniffer_save.to_text_file (self._path (os.path.join ('a_b', 'one.txt')), toggling_trace ({0:'50%_duty'}))
+		logic_sniffer_save.to_text_file (self._path (os.path.join ('axb', 'two.txt')), toggling_trace ({0:'50 duty'}))
+		self.catalog.rescan (self._path ('axb'))
+		self.catalog.rescan (self._path ('a_b'))
+		self.assertEqual (len (self.catalog.find()), 2)	# rescanning a_b didn't forget axb
+		self.assertEqual ([r['legends'][0] for r in self.catalog.find ('50%_')], ['50%_duty'])
+		self.assertEqual (self.catalog.find ('\\'), [])
+		
+		
+if __name__ == '__main__':
+	unittest.main()
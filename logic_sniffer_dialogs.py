@@ -20,7 +20,7 @@ This file is part of pyLogicSniffer.
 
 import wx
 import time
-from logic_sniffer_lib import frequency_with_units, time_units_text, time_units_values
+from logic_sniffer_lib import frequency_with_units, freq_units_text, time_units_text, time_units_values
 
 
 class SimpleValidator (wx.PyValidator):
@@ -75,6 +75,155 @@ class BookLabelDialog (wx.Dialog):
 	def GetValue (self):
 		return self.label_ctrl.GetValue()
 
+#===========================================================
+class BusDialog (wx.Dialog):
+	'''Dialog to group channels into a bus shown as one value.'''
+	def __init__ (self, parent, name='', channels=''):
+		wx.Dialog.__init__ (self, parent, wx.ID_ANY, 'Bus')
+		self.name_ctrl = wx.TextCtrl (self, -1, name)
+		self.channels_ctrl = wx.TextCtrl (self, -1, channels)
+		self.name_ctrl.SetFocus()
+		
+		gs = wx.FlexGridSizer (2, 2)
+		gs.AddGrowableCol (1)
+		gs.SetHGap (5)
+		gs.SetVGap (5)
+		gs.Add (wx.StaticText (self, wx.ID_ANY, 'Name'), 0, wx.ALIGN_CENTER_VERTICAL)
+		gs.Add (self.name_ctrl, 1, wx.EXPAND)
+		gs.Add (wx.StaticText (self, wx.ID_ANY, 'Channels'), 0, wx.ALIGN_CENTER_VERTICAL)
+		gs.Add (self.channels_ctrl, 1, wx.EXPAND)
+		
+		ts = wx.BoxSizer (wx.VERTICAL)
+		ts.Add (gs, 0, wx.EXPAND|wx.ALL, 10)
+		ts.Add (wx.StaticText (self, wx.ID_ANY, 'Most significant bit first, e.g. 7-0 or 3,1,2,0'), 0, wx.LEFT|wx.RIGHT, 10)
+		ts.Add (self.CreateButtonSizer (wx.OK|wx.CANCEL), 0, wx.EXPAND|wx.TOP, 10)
+		
+		self.SetSizer (ts)
+		self.SetInitialSize()
+		
+	def GetValue (self):
+		'''Return (name, list of channels); a badly written list raises ValueError.'''
+		channels = []
+		for part in self.channels_ctrl.GetValue().split (','):
+			if '-' in part:
+				first, last = [int (c) for c in part.split ('-')]
+				step = -1 if first > last else 1
+				channels.extend (range (first, last + step, step))
+			else:
+				channels.append (int (part))
+		return self.name_ctrl.GetValue(), channels
+
+#===========================================================
+class CatalogDialog (wx.Dialog):
+	'''Dialog to search the catalog of saved captures.'''
+	columns = (('Captured', 140), ('Title', 100), ('Rate', 70), ('Samples', 70), ('Active Channels', 120), ('File', 240))
+	
+	def __init__ (self, parent, catalog):
+		wx.Dialog.__init__ (self, parent, wx.ID_ANY, 'Capture Catalog', style=wx.DEFAULT_DIALOG_STYLE|wx.RESIZE_BORDER)
+		self.catalog = catalog
+		self.found = []
+		
+		self.search_ctrl = wx.TextCtrl (self, wx.ID_ANY, '')
+		self.channel_ctrl = wx.ComboBox (self, wx.ID_ANY, style=wx.CB_READONLY
+				, choices=['Any'] + [str (c) for c in xrange (32)])
+		self.channel_ctrl.SetSelection (0)
+		rescan_button = wx.Button (self, wx.ID_ANY, 'Rescan Folder...')
+		self.list_ctrl = wx.ListCtrl (self, wx.ID_ANY, style=wx.LC_REPORT|wx.LC_SINGLE_SEL)
+		for i, (heading, width) in enumerate (self.columns):
+			self.list_ctrl.InsertColumn (i, heading, width=width)
+		self.list_ctrl.SetMinSize ((sum (w for h, w in self.columns), 250))
+		
+		self.search_ctrl.Bind (wx.EVT_TEXT, self.OnSearch)
+		self.channel_ctrl.Bind (wx.EVT_COMBOBOX, self.OnSearch)
+		rescan_button.Bind (wx.EVT_BUTTON, self.OnRescan)
+		self.list_ctrl.Bind (wx.EVT_LIST_ITEM_ACTIVATED, self.OnActivated)
+		
+		hs = wx.BoxSizer (wx.HORIZONTAL)
+		hs.Add (wx.StaticText (self, wx.ID_ANY, 'Search'), 0, wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+		hs.Add (self.search_ctrl, 1, wx.RIGHT, 10)
+		hs.Add (wx.StaticText (self, wx.ID_ANY, 'Active Channel'), 0, wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+		hs.Add (self.channel_ctrl, 0, wx.RIGHT, 10)
+		hs.Add (rescan_button, 0)
+		
+		ts = wx.BoxSizer (wx.VERTICAL)
+		ts.Add (hs, 0, wx.EXPAND|wx.ALL, 10)
+		ts.Add (self.list_ctrl, 1, wx.EXPAND|wx.LEFT|wx.RIGHT, 10)
+		buttons = self.CreateButtonSizer (wx.OK|wx.CANCEL)
+		self.FindWindowById (wx.ID_OK).SetLabel ('Open')
+		ts.Add (buttons, 0, wx.EXPAND|wx.TOP, 10)
+		
+		self.SetSizer (ts)
+		self.SetInitialSize()
+		self.RefreshList()
+	
+	def RefreshList (self):
+		'''Fill the list with the catalogued captures that match the search.'''
+		channel = self.channel_ctrl.GetSelection()
+		self.found = self.catalog.find (self.search_ctrl.GetValue()
+				, active_channel=(channel - 1 if channel > 0 else None))
+		lc = self.list_ctrl
+		lc.DeleteAllItems()
+		for i, r in enumerate (self.found):
+			active = ' '.join (str (c) for c, n in sorted (r['edges'].items()) if n)
+			for column, text in enumerate ((time.ctime (r['capture_time']), r['title'] or ''
+					, frequency_with_units (r['frequency']), str (r['read_count']), active, r['path'])):
+				if column == 0:
+					lc.InsertStringItem (i, text)
+				else:
+					lc.SetStringItem (i, column, text)
+	
+	def GetValue (self):
+		'''Return (path, tab) of the selected capture, or None.'''
+		i = self.list_ctrl.GetFirstSelected()
+		if i < 0:
+			return None
+		return self.found[i]['path'], self.found[i]['tab']
+	
+	def OnActivated (self, evt):
+		self.EndModal (wx.ID_OK)
+	
+	def OnRescan (self, evt):
+		d = wx.DirDialog (self, 'Catalog Captures in...')
+		if d.ShowModal() == wx.ID_OK:
+			busy = wx.BusyCursor()
+			self.catalog.rescan (d.GetPath(), progress=lambda path: wx.SafeYield (self, True))
+			del busy
+			self.RefreshList()
+		d.Destroy()
+	
+	def OnSearch (self, evt):
+		self.RefreshList()
+
+#===========================================================
+class DerivedTraceDialog (wx.Dialog):
+	'''Dialog to define a trace computed from the captured channels.'''
+	def __init__ (self, parent, name='', expression=''):
+		wx.Dialog.__init__ (self, parent, wx.ID_ANY, 'Derived Trace')
+		self.name_ctrl = wx.TextCtrl (self, -1, name)
+		self.expression_ctrl = wx.TextCtrl (self, -1, expression)
+		self.name_ctrl.SetFocus()
+		
+		gs = wx.FlexGridSizer (2, 2)
+		gs.AddGrowableCol (1)
+		gs.SetHGap (5)
+		gs.SetVGap (5)
+		gs.Add (wx.StaticText (self, wx.ID_ANY, 'Name'), 0, wx.ALIGN_CENTER_VERTICAL)
+		gs.Add (self.name_ctrl, 1, wx.EXPAND)
+		gs.Add (wx.StaticText (self, wx.ID_ANY, 'Expression'), 0, wx.ALIGN_CENTER_VERTICAL)
+		gs.Add (self.expression_ctrl, 1, wx.EXPAND)
+		
+		ts = wx.BoxSizer (wx.VERTICAL)
+		ts.Add (gs, 0, wx.EXPAND|wx.ALL, 10)
+		ts.Add (wx.StaticText (self, wx.ID_ANY, 'Combine channels c0 .. c31 with & | ^ and ~, e.g. c0 & ~c3'), 0, wx.LEFT|wx.RIGHT, 10)
+		ts.Add (self.CreateButtonSizer (wx.OK|wx.CANCEL), 0, wx.EXPAND|wx.TOP, 10)
+		
+		self.SetSizer (ts)
+		self.SetInitialSize()
+		
+	def GetValue (self):
+		'''Return (name, expression).'''
+		return self.name_ctrl.GetValue(), self.expression_ctrl.GetValue()
+
 #===========================================================
 class LabelDialog (wx.Dialog):
 	'''Dialog to enter labels for trace displays.'''
@@ -196,6 +345,8 @@ class TracePropertiesDialog (wx.Dialog):
 		self.label_edit.SetSelection (-1, -1)
 		hs.Add (self.label_edit, 1, 0)
 		vs.Add (hs, 0, wx.EXPAND)
+		self.hide_ctrl = wx.CheckBox (self, -1, 'Hide this trace')
+		vs.Add (self.hide_ctrl, 0, wx.TOP|wx.BOTTOM, 5)
 		
 		vs.Add (self.CreateButtonSizer (wx.OK|wx.CANCEL), 0, wx.EXPAND)
 		
@@ -205,6 +356,74 @@ class TracePropertiesDialog (wx.Dialog):
 	def GetValue (self):
 		return self.label_edit.GetValue ()
 		
+	def IsHidden (self):
+		return self.hide_ctrl.GetValue()
+		
+
+#===========================================================
+class VcdImportDialog (wx.Dialog):
+	'''Dialog to choose the sample clock for a VCD import.'''
+	def __init__ (self, parent, automatic=True, rate=1, unit=1000000):
+		wx.Dialog.__init__ (self, parent, wx.ID_ANY, 'Import VCD')
+		
+		self.automatic_ctrl = wx.CheckBox (self, wx.ID_ANY, 'From timescale')
+		self.rate_ctrl = wx.TextCtrl (self, wx.ID_ANY, '', validator=RateValidator())
+		self.unit_ctrl = wx.ComboBox (self, wx.ID_ANY, style=wx.CB_READONLY)
+		for txt, num in zip (freq_units_text, time_units_values):
+			self.unit_ctrl.Append (txt, clientData=num)
+		self.unit_ctrl.SetMinSize ((60, -1))
+		self.automatic_ctrl.Bind (wx.EVT_CHECKBOX, self.OnAutomatic)
+		
+		self.SetValue (automatic, rate, unit)
+		
+		rate_sizer = wx.BoxSizer (wx.HORIZONTAL)
+		rate_sizer.Add (wx.StaticText (self, wx.ID_ANY, 'Sample Rate'), 0, wx.RIGHT|wx.ALIGN_CENTER_VERTICAL, 5)
+		rate_sizer.Add (self.rate_ctrl, 3, wx.RIGHT, 5)
+		rate_sizer.Add (self.unit_ctrl, 0)
+		
+		ts = wx.BoxSizer (wx.VERTICAL)
+		ts.Add (self.automatic_ctrl, 0, wx.LEFT|wx.TOP, 10)
+		ts.Add (rate_sizer, 1, wx.EXPAND|wx.ALL, 10)
+		ts.Add (self.CreateButtonSizer (wx.OK|wx.CANCEL), 0, wx.EXPAND)
+		
+		self.SetSizer (ts)
+		self.SetInitialSize()
+		
+	def GetValue (self):
+		'''Return the chosen sample rate in Hz, or None to infer it from the timescale.'''
+		if self.automatic_ctrl.GetValue():
+			return None
+		return float (self.rate_ctrl.GetValue()) * self.unit_ctrl.GetClientData (self.unit_ctrl.GetSelection())
+		
+	def OnAutomatic (self, evt):
+		self.rate_ctrl.Enable (not evt.IsChecked())
+		self.unit_ctrl.Enable (not evt.IsChecked())
+		
+	def SetValue (self, automatic, rate, unit):
+		self.automatic_ctrl.SetValue (automatic)
+		self.rate_ctrl.SetValue (str (rate))
+		self.unit_ctrl.SetStringSelection (freq_units_text[time_units_values.index (unit)])
+		self.rate_ctrl.Enable (not automatic)
+		self.unit_ctrl.Enable (not automatic)
+		
+class RateValidator (SimpleValidator):
+	'''Validate a sample rate entry.'''
+	def Validate (self, parent):
+		ctrl = self.GetWindow()
+		if not ctrl.IsEnabled():
+			return True
+		result = True
+		try:
+			v = float (ctrl.GetValue())
+		except ValueError:
+			result = False
+		result = result and (v > 0)
+		if not result:
+			wx.MessageBox ('Sample rate must be a number > 0.', 'Bad Input', wx.ICON_ERROR|wx.CANCEL)
+			ctrl.SetFocus()
+			ctrl.SetSelection (-1, -1)
+		return result
+		
 
 #===========================================================
 class ZoomDialog (wx.Dialog):
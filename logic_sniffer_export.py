@@ -0,0 +1,237 @@
+# -*- coding: UTF-8 -*-
+'''Render pyLogicSniffer captures to PNG or SVG images, without a display.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+# PNG images are the same rasters the trace display is pieced together
+# from, packed with zlib; SVG images draw each channel's transition
+# polyline, so they stay sharp at any size.  Nothing here needs wx, so
+# a directory of captures can be rendered from a script:
+#
+#	python logic_sniffer_export.py [-f png|svg] [-w width] [-c channels]
+#		[-s first] [-e last] [-o directory] [-j jobs] capture-or-directory ...
+
+import os, struct, sys, zlib
+from xml.sax.saxutils import escape
+import numpy as np
+import logic_sniffer_catalog
+import logic_sniffer_render
+import logic_sniffer_save
+from logic_sniffer_lib import BUS_CHANNELS
+
+image_formats = ('png', 'svg')
+DEFAULT_WIDTH = 1024
+BUS_DIGIT_WIDTH = 7	# rough width of a digit in the SVG's bus values
+
+
+def sample_window (capture, first=None, last=None):
+	'''Return (first, last) clipped to the capture, last being one past the final sample shown.'''
+	n = capture.read_count
+	first = 0 if first is None else max (0, min (int (first), n - 1))
+	last = n if last is None else max (first + 1, min (int (last), n))
+	return first, last
+
+def png_bytes (image):
+	'''Return the contents of a PNG file showing an RGBA image array of shape (height, width, 4).'''
+	height, width = image.shape[:2]
+	rows = np.zeros ((height, width*4 + 1), dtype=np.uint8)	# each row starts with filter type 0
+	rows[:, 1:] = image.reshape ((height, width*4))
+	def chunk (tag, body):
+		return struct.pack ('>I', len (body)) + tag + body + struct.pack ('>I', zlib.crc32 (tag + body) & 0xFFFFFFFF)
+	return ('\x89PNG\r\n\x1a\n'
+			+ chunk ('IHDR', struct.pack ('>IIBBBBB', width, height, 8, 6, 0, 0, 0))	# 8-bit RGBA
+			+ chunk ('IDAT', zlib.compress (rows.tostring(), 6))
+			+ chunk ('IEND', ''))
+
+def render_png (capture, channels=None, first=None, last=None, width=DEFAULT_WIDTH):
+	'''Return PNG file contents showing samples first to last of the given channels, width pixels wide.'''
+	if channels is None:
+		channels = list (capture.channel_set())
+	first, last = sample_window (capture, first, last)
+	scale = float (width) / (last - first)
+	image = logic_sniffer_render.rasterize_traces (capture, channels, first * scale, width, scale)
+	return png_bytes (image)
+
+def render_svg (capture, channels=None, first=None, last=None, width=DEFAULT_WIDTH
+		, trace_height=logic_sniffer_render.TRACE_HEIGHT):
+	'''Return SVG file contents showing samples first to last of the given channels, width pixels wide.'''
+	if channels is None:
+		channels = list (capture.channel_set())
+	first, last = sample_window (capture, first, last)
+	scale = float (width) / (last - first)
+	high_y = logic_sniffer_render.HIGH_Y * trace_height // logic_sniffer_render.TRACE_HEIGHT
+	low_y = trace_height - 1
+	height = max (1, len (channels) * trace_height)
+	out = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+		, '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n' % (width, height, width, height)
+		, '<rect width="100%" height="100%" fill="white"/>\n']
+	x_zero = (capture.read_count - capture.delay_count - first) * scale
+	if 0 <= x_zero < width:
+		out.append ('<line x1="%.2f" y1="0" x2="%.2f" y2="%d" stroke="lime"/>\n' % (x_zero, x_zero, height))
+	for row, channel in enumerate (channels):
+		if channel >= BUS_CHANNELS:
+			out.append (_svg_bus_lane (capture, channel, first, last, scale, row * trace_height + high_y, row * trace_height + low_y))
+			continue
+		points = capture.channel_polyline (channel)
+		lo, hi = np.searchsorted (points[:, 0], (first, last - 1), 'right')
+		inside = points[lo:hi]
+		samples = np.concatenate (([first], inside[:, 0], [last - 1]))
+		levels = np.concatenate (([capture.channel_level (channel, first)], inside[:, 1], [capture.channel_level (channel, last - 1)]))
+		xs = (samples - first) * scale
+		ys = row * trace_height + np.where (levels, high_y, low_y)
+		name = capture.channel_name (channel) or str (channel)
+		if isinstance (name, unicode):
+			name = name.encode ('utf-8')
+		out.append ('<polyline fill="none" stroke="black" stroke-width="1" points="%s"><title>%s</title></polyline>\n'
+				% (' '.join ('%.2f,%d' % xy for xy in zip (xs, ys)), escape (name)))
+	out.append ('</svg>\n')
+	return ''.join (out)
+
+def _svg_bus_lane (capture, channel, first, last, scale, top, bottom):
+	'''Return SVG drawing a bus as a lane crossed at each change, with its values where they fit.'''
+	starts, values = capture.bus_changes (channel)
+	lo = max (0, np.searchsorted (starts, first, 'right') - 1)
+	hi = np.searchsorted (starts, last - 1, 'right')
+	x0 = (np.maximum (starts[lo:hi], first) - first) * scale
+	x1 = (np.append (starts[lo+1:hi], last - 1) - first) * scale
+	digits = (capture.bus_width (channel) + 3) // 4
+	path = ['M%.2f,%d H%.2f M%.2f,%d H%.2f' % (x0[0], top, x1[-1], x0[0], bottom, x1[-1])]
+	path.extend ('M%.2f,%d V%d' % (x, top, bottom) for x in x0[1:])
+	out = ['<path fill="none" stroke="black" stroke-width="1" d="%s"/>\n' % (' '.join (path),)]
+	for i in np.flatnonzero (x1 - x0 >= digits * BUS_DIGIT_WIDTH + 4):	# only boxes wide enough to read
+		out.append ('<text x="%.2f" y="%d" font-size="10" text-anchor="middle">%0*X</text>\n'
+				% ((x0[i] + x1[i]) / 2, bottom - 2, digits, values[lo + i]))
+	return ''.join (out)
+
+renderers = {'png': render_png, 'svg': render_svg}
+
+def to_image (path, capture, channels=None, first=None, last=None, width=DEFAULT_WIDTH
+		, image_format='png', progress=logic_sniffer_save.no_progress):
+	'''Write an image of a capture; a writer for logic_sniffer_save.BackgroundSave.'''
+	progress (0.0)
+	_write_image (path, renderers[image_format] (capture, channels, first, last, width))
+	progress (1.0)
+
+
+def file_captures (path):
+	'''Yield (suffix, capture) for each capture saved in a file.'''
+	kind = logic_sniffer_catalog.capture_kind (path)
+	if kind == 'capture':
+		yield '', logic_sniffer_save.from_file (path)
+	elif kind == 'session':
+		tabs, selected = logic_sniffer_save.from_session_file (path)
+		for i, tab in enumerate (tabs):
+			if tab.kind == 'capture':
+				yield '-%d' % (i,), tab.load_data()
+				tab.data = None		# don't hold more than one capture at a time
+
+def render_file (path, directory=None, image_format='png', channels=None, first=None, last=None, width=DEFAULT_WIDTH):
+	'''Render the captures in a saved file to images, returning the paths written.
+
+	Images are written beside the file unless directory is given.'''
+	base = os.path.splitext (os.path.basename (path))[0]
+	if directory is None:
+		directory = os.path.dirname (path)
+	written = []
+	for suffix, capture in file_captures (path):
+		image_path = os.path.join (directory, '%s%s.%s' % (base, suffix, image_format))
+		logic_sniffer_save.write_atomically (to_image, image_path, capture, channels, first, last, width, image_format)
+		written.append (image_path)
+	return written
+
+def _write_image (path, contents):
+	with open (path, 'wb') as f:
+		f.write (contents)
+
+def _render_job (job):
+	'''Run render_file in a worker process, returning (path, images written, error message).'''
+	path, kwargs = job
+	try:
+		return path, render_file (path, **kwargs), None
+	except Exception, e:
+		return path, [], '%s: %s' % (e.__class__.__name__, e)
+
+def render_all (paths, jobs=None, **kwargs):
+	'''Render every capture file named in paths, or found under directories there.
+
+	Files are shared among jobs worker processes (by default, one per CPU).
+	Yields (path, images written, error message) as each file is finished.'''
+	files = []
+	for p in paths:
+		if os.path.isdir (p):
+			for dirpath, dirnames, filenames in os.walk (p):
+				files.extend (os.path.join (dirpath, name) for name in sorted (filenames))
+		else:
+			files.append (p)
+	files = [f for f in files if logic_sniffer_catalog.capture_kind (f) is not None]
+	work = [(f, kwargs) for f in files]
+	if jobs == 1 or len (work) < 2:
+		for result in map (_render_job, work):
+			yield result
+	else:
+		import multiprocessing
+		pool = multiprocessing.Pool (jobs)
+		try:
+			for result in pool.imap_unordered (_render_job, work):
+				yield result
+		finally:
+			pool.close()
+			pool.join()
+
+
+usage = 'usage: logic_sniffer_export.py [-c CHANNELS] [-s START] [-e END] [-f png|svg] [-w WIDTH] [-j JOBS] [-o DIRECTORY] FILE_OR_DIRECTORY...'
+
+def main (argv):
+	import getopt
+	try:
+		opts, args = getopt.getopt (argv, 'c:e:f:j:o:s:w:'
+				, ['channels=', 'end=', 'format=', 'jobs=', 'output=', 'start=', 'width='])
+		kwargs = {}
+		jobs = None
+		for o, v in opts:
+			if o in ('-c', '--channels'):
+				kwargs['channels'] = [int (c) for c in v.split (',')]
+			elif o in ('-e', '--end'):
+				kwargs['last'] = int (v)
+			elif o in ('-f', '--format'):
+				if v not in image_formats:
+					raise getopt.GetoptError ('format must be one of %s' % (', '.join (image_formats),))
+				kwargs['image_format'] = v
+			elif o in ('-j', '--jobs'):
+				jobs = int (v)
+			elif o in ('-o', '--output'):
+				kwargs['directory'] = v
+			elif o in ('-s', '--start'):
+				kwargs['first'] = int (v)
+			elif o in ('-w', '--width'):
+				kwargs['width'] = int (v)
+	except (getopt.GetoptError, ValueError), e:	# ValueError from a number that isn't one
+		print >>sys.stderr, e
+		print >>sys.stderr, usage
+		return 2
+	failures = 0
+	for path, images, error in render_all (args, jobs, **kwargs):
+		if error is not None:
+			failures += 1
+			print >>sys.stderr, '%s: %s' % (path, error)
+		for image in images:
+			print image
+	return 1 if failures else 0
+
+
+if __name__ == '__main__':
+	sys.exit (main (sys.argv[1:]))
@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer image export.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os, shutil, StringIO, struct, sys, tempfile, unittest, zlib
+from xml.dom import minidom
+import numpy as np
+import logic_sniffer_export as M
+import logic_sniffer_render
+import logic_sniffer_save
+from logic_sniffer_lib import TraceData
+
+def pattern_trace ():
+	data = np.zeros ((1000,), dtype=np.uint32)
+	data[::2] |= 1			# toggling every sample
+	data[300:600] |= 2		# one pulse
+	return TraceData (1000000, 1000, 400, 0xE, data, {1:'pulse'})
+	
+def png_image (contents):
+	'''Decode the RGBA image in PNG file contents written by png_bytes.'''
+	assert contents[:8] == '\x89PNG\r\n\x1a\n'
+	offset = 8
+	chunks = {}
+	while offset < len (contents):
+		length, tag = struct.unpack ('>I4s', contents[offset:offset+8])
+		body = contents[offset+8 : offset+8+length]
+		crc, = struct.unpack ('>I', contents[offset+8+length : offset+12+length])
+		assert crc == zlib.crc32 (tag + body) & 0xFFFFFFFF
+		chunks[tag] = body
+		offset += 12 + length
+	width, height = struct.unpack ('>II', chunks['IHDR'][:8])
+	rows = np.frombuffer (zlib.decompress (chunks['IDAT']), np.uint8).reshape ((height, width*4 + 1))
+	assert not rows[:, 0].any()
+	return rows[:, 1:].reshape ((height, width, 4))
+	
+class TestRender (unittest.TestCase):
+	def test0 (self):
+		'''The PNG holds the display's raster of the sample window.'''
+		trace = pattern_trace()
+		image = png_image (M.render_png (trace, [0, 1], 200, 700, 250))
+		expected = logic_sniffer_render.rasterize_traces (trace, [0, 1], 100, 250, 0.5)
+		self.assertEqual (image.shape, (40, 250, 4))
+		self.assert_((image == expected).all())
+		
+	def test1 (self):
+		'''The SVG draws one polyline per channel, through its transitions.'''
+		trace = pattern_trace()
+		svg = minidom.parseString (M.render_svg (trace, [1, 0], 200, 700, 500))
+		lines = svg.getElementsByTagName ('polyline')
+		self.assertEqual (len (lines), 2)
+		points = [tuple (float (v) for v in p.split (',')) for p in lines[0].getAttribute ('points').split()]
+		self.assertEqual (points, [(0, 19), (99, 19), (100, 6), (399, 6), (400, 19), (499, 19)])
+		self.assertEqual (lines[0].getElementsByTagName ('title')[0].firstChild.data, 'pulse')
+		self.assertEqual (len (lines[1].getAttribute ('points').split()), 2 + 2*499)	# both sides of every edge
+		
+	def test2 (self):
+		'''A directory of captures and sessions renders to an image per capture.'''
+		directory = tempfile.mkdtemp()
+		try:
+			logic_sniffer_save.to_file (os.path.join (directory, 'one.sump'), pattern_trace())
+			tabs = [logic_sniffer_save.SessionTab ('capture', u'A', pattern_trace())
+					, logic_sniffer_save.SessionTab ('capture', u'B', pattern_trace())]
+			logic_sniffer_save.to_session_file (os.path.join (directory, 'two.session'), tabs)
+			open (os.path.join (directory, 'notes.txt'), 'w').write ('not a capture\n')
+			results = sorted (M.render_all ([directory], jobs=2, image_format='svg', width=100))
+			self.assertEqual ([(os.path.basename (p), e) for p, i, e in results], [('one.sump', None), ('two.session', None)])
+			self.assertEqual (sorted (os.path.basename (i) for p, images, e in results for i in images)
+					, ['one.svg', 'two-0.svg', 'two-1.svg'])
+			stdout = sys.stdout
+			sys.stdout = StringIO.StringIO()	# main lists the images it writes
+			try:
+				self.assertEqual (M.main (['-f', 'png', '-w', '64', '-j', '1', '-c', '0,1', '-o', directory
+						, os.path.join (directory, 'one.sump')]), 0)
+				self.assertEqual (sys.stdout.getvalue().split(), [os.path.join (directory, 'one.png')])
+			finally:
+				sys.stdout = stdout
+			self.assertEqual (png_image (open (os.path.join (directory, 'one.png'), 'rb').read()).shape, (40, 64, 4))
+		finally:
+			shutil.rmtree (directory)
+		
+	def test3 (self):
+		'''A bus is drawn as a lane, with the values that fit written in it.'''
+		trace = pattern_trace()
+		bus = trace.add_bus ('pair', [1, 0])
+		svg = minidom.parseString (M.render_svg (trace, [bus], 250, 650, 400))
+		self.assertEqual ([t.firstChild.data for t in svg.getElementsByTagName ('text')], [])	# too busy to read
+		svg = minidom.parseString (M.render_svg (trace, [trace.add_bus ('high', [1])], 0, 1000, 400))
+		self.assertEqual ([t.firstChild.data for t in svg.getElementsByTagName ('text')], ['0', '1', '0'])
+		
+	def test4 (self):
+		'''Bad command line options give the usage exit status.'''
+		stderr = sys.stderr
+		sys.stderr = StringIO.StringIO()
+		try:
+			self.assertEqual (M.main (['-x']), 2)
+			self.assertEqual (M.main (['-f', 'gif']), 2)
+			self.assertEqual (M.main (['-w', 'wide']), 2)
+			self.assert_(sys.stderr.getvalue().count ('usage:') == 3)
+		finally:
+			sys.stderr = stderr
+		
+		
+if __name__ == '__main__':
+	unittest.main()
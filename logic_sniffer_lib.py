@@ -18,7 +18,8 @@ This file is part of pyLogicSniffer.
     along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
-import time
+import ast, collections, time
+import numpy as np
 
 freq_units_text = ['GHz', 'MHz', 'KHz', 'Hz']
 time_units_text = ['nS', u'μS', 'mS', 'S']
@@ -43,6 +44,33 @@ def time_with_units (t):
 	return '%g' % (t,)
 
 
+CAPTURE_CHANNELS = 32	# channel numbers from here up are derived channels
+BUS_CHANNELS = 256	# channel numbers from here up are bus groups
+
+_derived_operators = {ast.BitAnd: np.bitwise_and, ast.BitOr: np.bitwise_or, ast.BitXor: np.bitwise_xor}
+
+def _channel_operand (data, name):
+	'''Return the levels of a channel named cN, for a captured or an existing derived channel.'''
+	if name[:1] == 'c' and name[1:].isdigit() and int (name[1:]) < CAPTURE_CHANNELS + len (data.derived):
+		return data.channel_data (int (name[1:]))
+	raise ValueError ('No channel %s' % (name,))
+	
+def _evaluate_node (data, node, levels):
+	'''Evaluate one node of a parsed derived-channel expression.
+	
+	Only channel names and the operators & | ^ ~ are allowed, so a saved
+	expression can't run any other code.'''
+	if isinstance (node, ast.Name):
+		if node.id not in levels:
+			levels[node.id] = _channel_operand (data, node.id)
+		return levels[node.id]
+	if isinstance (node, ast.BinOp) and type (node.op) in _derived_operators:
+		return _derived_operators[type (node.op)] (_evaluate_node (data, node.left, levels), _evaluate_node (data, node.right, levels))
+	if isinstance (node, ast.UnaryOp) and isinstance (node.op, ast.Invert):
+		return np.invert (_evaluate_node (data, node.operand, levels))
+	raise ValueError ('Only channels c0, c1 ... and & | ^ ~ ( ) may be used')
+	
+
 class TraceData (object):
 	'''Hold results of a capture.'''
 	def __init__ (self, frequency, read_count, delay_count, channel_mask, data, legends=None, capture_time=None):
@@ -57,11 +85,161 @@ class TraceData (object):
 			capture_time = time.time()
 		self.capture_time = capture_time
 		self.data = data		# data values from SUMP device
+		self.derived = []		# (name, expression) of derived channels 32, 33, ...
+		self.buses = []			# (name, channels most significant first) of bus groups 256, 257, ...
+		
+	def __getstate__ (self):
+		state = dict (self.__dict__)
+		state.pop ('_edges', None)	# caches are rebuilt on demand
+		state.pop ('_polylines', None)
+		state.pop ('_derived', None)
+		state.pop ('_buses', None)
+		return state
+		
+	def __setstate__ (self, state):
+		self.__dict__.update (state)
+		self.__dict__.setdefault ('derived', [])	# saved before there were derived channels
+		self.__dict__.setdefault ('buses', [])
+		
+	def add_bus (self, name, channels):
+		'''Add a bus group showing channels as one value, and return its channel number.
+		
+		channels lists captured or derived channels, most significant bit first.'''
+		channels = [int (c) for c in channels]
+		if not 0 < len (channels) <= CAPTURE_CHANNELS:
+			raise ValueError ('A bus has from 1 to %d channels' % (CAPTURE_CHANNELS,))
+		for c in channels:
+			if not 0 <= c < CAPTURE_CHANNELS + len (self.derived):
+				raise ValueError ('No channel %d for a bus' % (c,))
+		channel = BUS_CHANNELS + len (self.buses)
+		self.buses.append ((name, channels))
+		return channel
+		
+	def _bus_values (self, channels):
+		'''Return the combined value of channels, most significant first, at each sample.'''
+		n = len (channels)
+		lo = channels[-1]
+		if channels == range (lo + n - 1, lo - 1, -1) and lo + n <= CAPTURE_CHANNELS:	# a run of captured channels
+			return (self.data >> lo) & np.uint32 ((1 << n) - 1)
+		values = np.zeros (self.data.shape, dtype=np.uint32)
+		for bit, c in enumerate (reversed (channels)):
+			values |= self.channel_data (c).astype (np.uint32) << np.uint32 (bit)
+		return values
+		
+	def bus_changes (self, channel):
+		'''Return (starts, values) arrays: the samples where a bus changes value, and its value from each.'''
+		starts = np.concatenate (([0], self.channel_edges (channel)))
+		return starts, self.channel_data (channel)[starts]
+		
+	def bus_width (self, channel):
+		'''Return the number of bits in a bus group.'''
+		return len (self.buses[channel - BUS_CHANNELS][1])
+		
+	def add_derived (self, name, expression):
+		'''Add a channel computed from the captured ones, and return its channel number.
+		
+		expression combines c0 .. c31, and earlier derived channels by
+		number, with the operators & | ^ and ~; a bad expression raises
+		ValueError and adds nothing.'''
+		levels = self._evaluate (expression)
+		channel = CAPTURE_CHANNELS + len (self.derived)
+		if channel >= BUS_CHANNELS:
+			raise ValueError ('No more than %d derived channels' % (BUS_CHANNELS - CAPTURE_CHANNELS,))
+		self.derived.append ((name, expression))
+		self.__dict__.setdefault ('_derived', {})[channel] = levels
+		return channel
+		
+	def _evaluate (self, expression):
+		try:
+			tree = ast.parse (expression.strip(), mode='eval')
+		except SyntaxError, e:
+			raise ValueError ('%r is not an expression: %s' % (expression, e))
+		levels = np.asarray (_evaluate_node (self, tree.body, {}), dtype=bool)
+		if levels.shape != self.data.shape:
+			raise ValueError ('%r does not give a level for each sample' % (expression,))
+		return levels
 		
 	def channel_data (self, channel):
-		'''Return a numpy array of samples for a single channel.'''
+		'''Return a numpy array of samples for a single channel, or of values for a bus group.'''
+		if channel >= BUS_CHANNELS:
+			cache = self.__dict__.setdefault ('_buses', {})
+			if channel not in cache:
+				cache[channel] = self._bus_values (self.buses[channel - BUS_CHANNELS][1])
+			return cache[channel]
+		if channel >= CAPTURE_CHANNELS:
+			cache = self.__dict__.setdefault ('_derived', {})
+			if channel not in cache:
+				cache[channel] = self._evaluate (self.derived[channel - CAPTURE_CHANNELS][1])
+			return cache[channel]
 		return (self.data & (1 << channel)) != 0
 		
+	def channel_level (self, channel, sample):
+		'''Return the level of a single channel at one sample.'''
+		if channel >= CAPTURE_CHANNELS:
+			return bool (self.channel_data (channel)[sample])
+		return bool (self.data[sample] & (1 << channel))
+		
+	def nearest_edge (self, channel, sample, limit=None):
+		'''Return the edge on a channel nearest to sample, or None if there's none within limit samples.'''
+		edges = self.channel_edges (channel)
+		i = np.searchsorted (edges, sample)
+		candidates = edges[max (0, i-1):i+1]
+		if not len (candidates):
+			return None
+		edge = int (candidates[np.argmin (np.abs (candidates - sample))])
+		if limit is not None and abs (edge - sample) > limit:
+			return None
+		return edge
+		
+	def channel_name (self, channel):
+		'''Return the legend, derived-channel or bus name for a channel.'''
+		if channel >= BUS_CHANNELS:
+			return self.buses[channel - BUS_CHANNELS][0]
+		if channel >= CAPTURE_CHANNELS:
+			return self.derived[channel - CAPTURE_CHANNELS][0]
+		return self.legends.get (channel, '')
+		
+	def channel_edges (self, channel):
+		'''Return the sample numbers at which a channel changes level.'''
+		cache = self.__dict__.setdefault ('_edges', {})
+		if channel not in cache:
+			bits = self.channel_data (channel)
+			cache[channel] = np.flatnonzero (bits[1:] != bits[:-1]) + 1
+		return cache[channel]
+		
+	def channel_polyline (self, channel):
+		'''Return the vertices of a channel's waveform as an (n,2) array of (sample, level).
+		
+		Only the ends of the trace and the two samples either side of each
+		edge are included, so an idle channel has very few vertices.'''
+		cache = self.__dict__.setdefault ('_polylines', {})
+		if channel not in cache:
+			bits = self.channel_data (channel)
+			edges = self.channel_edges (channel)
+			n = 2*len (edges) + 2
+			points = np.empty ((n, 2), dtype=np.float64)
+			points[0] = (0, bits[0])
+			points[1:n-1:2, 0] = edges - 1
+			points[1:n-1:2, 1] = bits[edges - 1]
+			points[2:n-1:2, 0] = edges
+			points[2:n-1:2, 1] = bits[edges]
+			points[n-1] = (len (bits) - 1, bits[-1])
+			cache[channel] = points
+		return cache[channel]
+		
+	def snapshot (self):
+		'''Return a copy of this capture with a read-only view of its samples.
+		
+		Background writers work on a snapshot, so the capture page can go
+		on changing legends or data while a save is running.'''
+		data = self.data.view()
+		data.flags.writeable = False
+		snapshot = TraceData (self.frequency, self.read_count, self.delay_count, self.channel_mask
+				, data, dict (self.legends), self.capture_time)
+		snapshot.derived = list (self.derived)
+		snapshot.buses = list (self.buses)
+		return snapshot
+		
 	def channel_set (self):
 		'''Yield the channel numbers allowed by the channel mask.'''
 		channel_mask = self.channel_mask
@@ -69,3 +247,67 @@ class TraceData (object):
 			if not (channel_mask & mask_bit):	# channel_mask bits disable channels
 				for c in xrange (lo, hi):
 					yield c
+
+
+class AnnotationIndex (object):
+	'''Decoded events, as (start, end, label, channel) spans of samples, indexed by time.
+
+	Spans are kept sorted by start, alongside the running maximum of their
+	ends, so the spans overlapping a range of samples are found by binary
+	search without looking at the rest.'''
+	def __init__ (self, annotations=()):
+		annotations = sorted (annotations, key=lambda a: a[0])
+		self.starts = np.array ([a[0] for a in annotations], dtype=np.int64)
+		self.ends = np.array ([a[1] for a in annotations], dtype=np.int64)
+		self.labels = [a[2] for a in annotations]
+		self.channels = np.array ([a[3] for a in annotations], dtype=np.int64)
+		self.reach = np.maximum.accumulate (self.ends) if len (annotations) else self.ends	# latest end of any span so far
+		
+	def __len__ (self):
+		return len (self.labels)
+		
+	def overlapping (self, first, last):
+		'''Return an array of the indices of the spans overlapping samples first to last.'''
+		lo = np.searchsorted (self.reach, first, 'left')	# spans before lo all end before first
+		hi = np.searchsorted (self.starts, last, 'right')	# spans from hi on all start after last
+		if lo >= hi:
+			return np.zeros ((0,), dtype=np.int64)
+		return lo + np.flatnonzero (self.ends[lo:hi] >= first)
+		
+		
+class LruCache (object):
+	'''Hold items up to a total size, dropping the least recently used first.'''
+	def __init__ (self, max_size):
+		self.max_size = max_size
+		self.size = 0
+		self._items = collections.OrderedDict()	# key -> (value, size), oldest first
+		
+	def __contains__ (self, key):
+		return key in self._items
+		
+	def __len__ (self):
+		return len (self._items)
+		
+	def clear (self):
+		self._items.clear()
+		self.size = 0
+		
+	def get (self, key, default=None):
+		'''Return the item for key, marking it as most recently used.'''
+		try:
+			item = self._items.pop (key)
+		except KeyError:
+			return default
+		self._items[key] = item
+		return item[0]
+		
+	def put (self, key, value, size):
+		'''Add an item of the given size, dropping old items to stay within max_size.'''
+		old = self._items.pop (key, None)
+		if old is not None:
+			self.size -= old[1]
+		self._items[key] = (value, size)
+		self.size += size
+		while self.size > self.max_size and len (self._items) > 1:
+			k, (v, old_size) = self._items.popitem (last=False)
+			self.size -= old_size
@@ -0,0 +1,142 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer trace data.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import cPickle, unittest
+import numpy as np
+from logic_sniffer_lib import AnnotationIndex, LruCache, TraceData
+
+class TestChannelPolyline (unittest.TestCase):
+	def setUp (self):
+		data = np.zeros ((1000,), dtype=np.uint32)
+		data[100:101] = 1	# one-sample pulse
+		data[500:] |= 2		# a single rising edge
+		data[::2] |= 4		# toggling every sample
+		self.trace = TraceData (1000000, 1000, 500, 0xE, data)
+		
+	def test0 (self):
+		self.assertEqual (list (self.trace.channel_edges (0)), [100, 101])
+		self.assertEqual (list (self.trace.channel_edges (1)), [500])
+		self.assertEqual (len (self.trace.channel_edges (2)), 999)
+		self.assertEqual (len (self.trace.channel_edges (3)), 0)
+		
+	def test1 (self):
+		'''The polyline passes through every sample of the channel.'''
+		for channel in xrange (4):
+			points = self.trace.channel_polyline (channel)
+			levels = np.interp (np.arange (1000), points[:,0], points[:,1])
+			self.assert_((levels == self.trace.channel_data (channel)).all())
+		self.assertEqual (len (self.trace.channel_polyline (3)), 2)
+		self.assertEqual (len (self.trace.channel_polyline (1)), 4)
+		
+	def test2 (self):
+		'''Cached geometry isn't saved with the trace.'''
+		self.trace.channel_polyline (0)
+		restored = cPickle.loads (cPickle.dumps (self.trace, 0))
+		self.assertFalse (hasattr (restored, '_polylines'))
+		self.assertEqual (list (restored.channel_edges (0)), [100, 101])
+		
+	def test3 (self):
+		'''Derived channels are numbered from 32 and drawn like captured ones.'''
+		channel = self.trace.add_derived ('pulse or high', 'c0 | c1')
+		self.assertEqual (channel, 32)
+		self.assertEqual (self.trace.channel_name (32), 'pulse or high')
+		self.assertEqual (list (self.trace.channel_edges (32)), [100, 101, 500])
+		self.assertEqual ((self.trace.channel_level (32, 99), self.trace.channel_level (32, 100)), (False, True))
+		restored = cPickle.loads (cPickle.dumps (self.trace, 0))
+		self.assert_((restored.channel_data (32) == self.trace.channel_data (32)).all())
+		self.assertEqual (self.trace.snapshot().derived, [('pulse or high', 'c0 | c1')])
+		
+	def test4 (self):
+		for expression in ('c0 +', 'c40', 'open', '1', 'c0 + c1', 'c0.__class__', '[c for c in ()] or c0'
+				, "().__class__.__base__.__subclasses__() or c0"):
+			self.assertRaises (ValueError, self.trace.add_derived, 'bad', expression)
+		self.assertEqual (self.trace.derived, [])
+		channel = self.trace.add_derived ('not pulse', ' ~c0')
+		self.assertEqual (self.trace.add_derived ('both', '(c32 ^ c1) & c0'), channel + 1)
+		
+	def test5 (self):
+		'''Cursors snap to the nearest edge within reach.'''
+		t = self.trace
+		self.assertEqual ([t.nearest_edge (0, s) for s in (0, 100, 101, 102, 999)], [100, 100, 101, 101, 101])
+		self.assertEqual (t.nearest_edge (1, 480, 10), None)
+		self.assertEqual (t.nearest_edge (1, 490, 10), 500)
+		self.assertEqual (t.nearest_edge (3, 10), None)
+		
+	def test6 (self):
+		'''Bus groups combine channels into values, changing where any of them does.'''
+		t = self.trace
+		bus = t.add_bus ('low', [1, 0])
+		self.assertEqual (bus, 256)
+		self.assertEqual (t.channel_name (bus), 'low')
+		self.assertEqual (t.bus_width (bus), 2)
+		starts, values = t.bus_changes (bus)
+		self.assertEqual ((list (starts), list (values)), ([0, 100, 101, 500], [0, 1, 0, 2]))
+		swapped = t.add_bus ('swapped', [0, 1, 2])	# not a run of channels, so bit by bit
+		expected = (t.channel_data (0) * 4) | (t.channel_data (1) * 2) | t.channel_data (2)
+		self.assert_((t.channel_data (swapped) == expected).all())
+		self.assertEqual (t.nearest_edge (bus, 450), 500)
+		self.assertRaises (ValueError, t.add_bus, 'bad', [40])
+		restored = cPickle.loads (cPickle.dumps (t.snapshot(), 0))
+		self.assertEqual (restored.buses, [('low', [1, 0]), ('swapped', [0, 1, 2])])
+		self.assert_((restored.channel_data (bus) == t.channel_data (bus)).all())
+		
+		
+class TestLruCache (unittest.TestCase):
+	def test0 (self):
+		c = LruCache (10)
+		for k in 'abcd':
+			c.put (k, k.upper(), 3)
+		self.assertEqual ((len (c), c.size), (3, 9))
+		self.assertFalse ('a' in c)
+		self.assertEqual (c.get ('b'), 'B')
+		c.put ('e', 'E', 3)		# drops 'c', since 'b' was used more recently
+		self.assertEqual (sorted (c._items), ['b', 'd', 'e'])
+		c.put ('f', 'F', 20)	# an oversized item is kept on its own
+		self.assertEqual ((len (c), c.get ('f')), (1, 'F'))
+		c.clear()
+		self.assertEqual ((len (c), c.size, c.get ('f')), (0, 0, None))
+		
+		
+class TestAnnotationIndex (unittest.TestCase):
+	def test0 (self):
+		spans = [(50, 60, 'b', 1), (0, 1000, 'long', 2), (10, 20, 'a', 1), (70, 70, 'c', 1)]
+		index = AnnotationIndex (spans)
+		self.assertEqual (len (index), 4)
+		def labels (first, last):
+			return sorted (index.labels[i] for i in index.overlapping (first, last))
+		self.assertEqual (labels (21, 49), ['long'])
+		self.assertEqual (labels (15, 55), ['a', 'b', 'long'])
+		self.assertEqual (labels (70, 70), ['c', 'long'])
+		self.assertEqual (labels (1001, 2000), [])
+		self.assertEqual (list (AnnotationIndex().overlapping (0, 100)), [])
+		
+	def test1 (self):
+		'''The index finds the same spans as a search of them all.'''
+		rng = np.random.RandomState (7)
+		starts = rng.randint (0, 100000, 5000)
+		spans = [(s, s + rng.randint (0, 300), str (i), 0) for i, s in enumerate (starts)]
+		index = AnnotationIndex (spans)
+		for first in (0, 1234, 50000, 99990):
+			last = first + 500
+			expected = sorted (l for s, e, l, c in spans if s <= last and e >= first)
+			self.assertEqual (sorted (index.labels[i] for i in index.overlapping (first, last)), expected)
+		
+		
+if __name__ == '__main__':
+	unittest.main()
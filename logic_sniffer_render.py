@@ -0,0 +1,219 @@
+# -*- coding: UTF-8 -*-
+'''Rasterize pyLogicSniffer trace data into numpy image buffers.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+# Waveforms are painted a pixel column at a time: for each column we find,
+# from the channel's edge list, the level at its left side and whether any
+# edge falls within it.  Columns with an edge get a full-height stroke, the
+# rest a dot at the high or low level.  Nothing here touches wx, so images
+# can be made on a worker thread, or without any display at all.
+
+import Queue, threading, traceback
+import numpy as np
+from logic_sniffer_lib import BUS_CHANNELS
+
+TRACE_HEIGHT = 20
+HIGH_Y = 6		# row offsets of the 1 and 0 levels within a trace
+LOW_Y = TRACE_HEIGHT - 1
+
+WHITE = (255, 255, 255, 255)
+BLACK = (0, 0, 0, 255)
+GREEN = (0, 255, 0, 255)
+
+
+def column_levels (data, channel, left, width, scale):
+	'''Return (level, edge, valid) boolean arrays for width pixel columns starting at pixel left.
+
+	level is the channel's level at the left of each column, edge tells
+	whether the channel changes level within the column, and valid is
+	False for columns past the end of the capture.'''
+	n = data.read_count
+	x = left + np.arange (width + 1, dtype=np.float64)
+	bounds = np.clip (np.floor (x / scale), 0, n - 1).astype (np.int64)	# sample at each column boundary
+	edges = data.channel_edges (channel)
+	passed = np.searchsorted (edges, bounds, 'right')		# edges at or before each boundary
+	initial = data.channel_level (channel, 0)
+	level = (passed[:-1] & 1).astype (bool) ^ initial
+	edge = passed[1:] > passed[:-1]
+	valid = x[:-1] <= (n - 1) * scale
+	return level, edge, valid
+
+def rasterize_traces (data, channels, left, width, scale, trace_height=TRACE_HEIGHT
+		, background=WHITE, foreground=BLACK, zero_colour=GREEN):
+	'''Return an RGBA image, as a (height, width, 4) uint8 array, of the given channels' waveforms.
+
+	The image shows pixels left to left+width of the capture drawn scale
+	pixels per sample, one trace_height row per channel.'''
+	height = max (1, len (channels) * trace_height)
+	image = np.empty ((height, width, 4), dtype=np.uint8)
+	image[:,:] = background
+	xz = int ((data.read_count - data.delay_count) * scale - left)	# column of time 0
+	if 0 <= xz < width:
+		image[:, xz] = zero_colour
+	high_y = HIGH_Y * trace_height // TRACE_HEIGHT
+	low_y = trace_height - 1
+	for row, channel in enumerate (channels):
+		level, edge, valid = column_levels (data, channel, left, width, scale)
+		ybase = row * trace_height
+		if channel >= BUS_CHANNELS:	# a lane, closed off where the bus value changes
+			level = np.ones_like (level)
+			image[ybase + low_y, valid & ~edge] = foreground
+		else:
+			image[ybase + low_y, valid & ~level & ~edge] = foreground
+		image[ybase + high_y, valid & level & ~edge] = foreground
+		image[ybase + high_y : ybase + low_y + 1, valid & edge] = foreground
+	return image
+
+def activity_counts (data, channel, bins):
+	'''Return the number of edges on a channel in each of bins equal slices of the capture.'''
+	edges = data.channel_edges (channel)
+	return np.bincount ((edges.astype (np.int64) * bins) // data.read_count, minlength=bins)[:bins]
+
+def density_image (counts, width, height, background=WHITE, foreground=(0, 0, 160, 255)):
+	'''Return an RGBA image, as a (height, width, 4) uint8 array, of an (n, bins) array of activity counts.
+
+	Each of the n rows of counts gets an equal band of the image; the
+	bins are summed into pixel columns, and shaded on a log scale from
+	background (no edges) to foreground (the busiest column).'''
+	n, bins = counts.shape
+	image = np.empty ((height, width, 4), dtype=np.uint8)
+	image[:,:] = background
+	if n == 0 or bins == 0:
+		return image
+	starts = (np.arange (width, dtype=np.int64) * bins) // width	# first bin in each column
+	columns = np.add.reduceat (counts, starts, axis=1).astype (np.float64)	# columns narrower than a bin repeat it
+	density = np.log1p (columns)
+	peak = density.max()
+	if peak > 0:
+		density /= peak
+	rows = density[(np.arange (height) * n) // height]	# (height, width)
+	back = np.array (background, np.float64)
+	fore = np.array (foreground, np.float64)
+	image[:,:] = (back + rows[:,:,np.newaxis] * (fore - back)).astype (np.uint8)
+	return image
+
+
+#===========================================================
+PERSISTENCE_COLUMNS = 4096	# pixel columns across the first capture in a persistence map
+
+class PersistenceMap (object):
+	'''Hit counts of many trigger-aligned captures, per channel and pixel column.
+
+	Each capture added counts, in every column, whether a channel was
+	high, low or changing there; earlier captures are never looked at
+	again.  The columns span the first capture, and later ones are lined
+	up on their trigger points.'''
+	def __init__ (self, capture, channels, columns=PERSISTENCE_COLUMNS):
+		self.channels = list (channels)
+		self.rows = dict ((c, i) for i, c in enumerate (self.channels))
+		self.columns = columns
+		self.trigger = capture.read_count - capture.delay_count	# sample number of the trigger in the first capture
+		self.scale = float (columns) / capture.read_count
+		shape = (len (self.channels), columns)
+		self.high = np.zeros (shape, dtype=np.uint32)
+		self.low = np.zeros (shape, dtype=np.uint32)
+		self.edge = np.zeros (shape, dtype=np.uint32)
+		self.count = 0
+		self.add (capture)
+
+	def add (self, capture):
+		'''Count one more capture into the map.'''
+		left = (capture.read_count - capture.delay_count - self.trigger) * self.scale	# where column 0 falls in this capture
+		inside = left + np.arange (self.columns) >= 0
+		for row, channel in enumerate (self.channels):
+			level, edge, valid = column_levels (capture, channel, left, self.columns, self.scale)
+			valid &= inside
+			self.high[row] += valid & level & ~edge
+			self.low[row] += valid & ~level & ~edge
+			self.edge[row] += valid & edge
+		self.count += 1
+
+	def image (self, channels, columns, trace_height=TRACE_HEIGHT, background=WHITE, foreground=BLACK):
+		'''Return an RGBA image, as a (height, len (columns), 4) uint8 array, of the given map columns.
+
+		Columns outside the map are left blank.  Hits are shaded on a log scale, so a level seen in one capture of
+		thousands still shows.'''
+		height = max (1, len (channels) * trace_height)
+		columns = np.asarray (columns, dtype=np.int64)
+		outside = (columns < 0) | (columns >= self.columns)
+		columns = np.clip (columns, 0, self.columns - 1)
+		shade = np.zeros ((height, len (columns)), dtype=np.float64)
+		high_y = HIGH_Y * trace_height // TRACE_HEIGHT
+		low_y = trace_height - 1
+		norm = np.log1p (max (1, self.count))
+		for row, channel in enumerate (channels):
+			i = self.rows.get (channel)
+			if i is None:
+				continue	# not being accumulated
+			ybase = row * trace_height
+			shade[ybase + high_y] = np.log1p (self.high[i, columns]) / norm
+			shade[ybase + low_y] = np.log1p (self.low[i, columns]) / norm
+			edges = np.log1p (self.edge[i, columns]) / norm
+			band = shade[ybase + high_y : ybase + low_y + 1]
+			np.maximum (band, edges, band)
+		shade[:, outside] = 0
+		back = np.array (background, np.float64)
+		fore = np.array (foreground, np.float64)
+		return (back + shade[:,:,np.newaxis] * (fore - back)).astype (np.uint8)
+
+
+#===========================================================
+class RasterWorker (threading.Thread):
+	'''Thread that runs rendering requests, most recent first.
+
+	Each request is render (*args); its result is passed to
+	done (key, result).  A request is skipped if wanted (key) is false by
+	the time the worker gets to it, or if asking raises an exception
+	(as it will once the display that made the request is destroyed).'''
+	def __init__ (self):
+		threading.Thread.__init__ (self, name='RasterWorker')
+		self.daemon = True
+		self.requests = Queue.LifoQueue()
+
+	def request (self, key, wanted, done, render, *args):
+		self.requests.put ((key, wanted, done, render, args))
+
+	def run (self):
+		while True:
+			key, wanted, done, render, args = self.requests.get()
+			try:
+				if not wanted (key):
+					continue
+			except Exception:
+				continue
+			try:
+				result = render (*args)
+			except Exception:
+				traceback.print_exc()
+				result = None
+			try:
+				done (key, result)
+			except Exception:
+				pass	# nobody left to take the result
+
+_shared_worker = None
+_shared_worker_lock = threading.Lock()
+
+def shared_worker ():
+	'''Return the RasterWorker shared by all displays, starting it if need be.'''
+	global _shared_worker
+	with _shared_worker_lock:
+		if _shared_worker is None:
+			_shared_worker = RasterWorker()
+			_shared_worker.start()
+		return _shared_worker
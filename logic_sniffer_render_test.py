@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer trace rasterizing.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import threading, unittest
+import numpy as np
+import logic_sniffer_render as M
+from logic_sniffer_lib import TraceData
+
+def pattern_trace ():
+	data = np.zeros ((1000,), dtype=np.uint32)
+	data[::2] |= 1			# toggling every sample
+	data[300:600] |= 2		# one pulse
+	return TraceData (1000000, 1000, 400, 0xE, data)
+	
+class TestRasterize (unittest.TestCase):
+	def test0 (self):
+		'''At one pixel per sample, each column shows its own sample.'''
+		trace = pattern_trace()
+		for channel in (0, 1):
+			level, edge, valid = M.column_levels (trace, channel, 100, 800, 1.0)
+			bits = trace.channel_data (channel)
+			self.assert_((level == bits[100:900]).all())
+			self.assert_((edge == (bits[101:901] != bits[100:900])).all())
+			self.assert_(valid.all())
+			
+	def test1 (self):
+		'''Zoomed out, a busy channel is solid and a quiet one is a line.'''
+		trace = pattern_trace()
+		image = M.rasterize_traces (trace, [0, 1], 0, 120, 0.1)
+		self.assertEqual (image.shape, (40, 120, 4))
+		black = (image == M.BLACK).all (axis=2)
+		self.assert_(black[6:20, :99].all())			# channel 0 toggles in every column
+		self.assertFalse (black[:, 101:].any())			# past the end of the capture
+		self.assertEqual (list (np.flatnonzero (black[20+6, :100])), range (29, 60))	# channel 1 high, with its edges
+		self.assertEqual (list (np.flatnonzero (black[20+6:20+19, :100].all (axis=0))), [29, 59])
+		self.assert_((image[20:26, 60] == M.GREEN).all())	# time 0 is at sample 600
+		
+	def test2 (self):
+		trace = pattern_trace()
+		worker = M.RasterWorker()
+		worker.start()
+		finished = threading.Event()
+		results = {}
+		def done (key, image):
+			results[key] = image
+			if len (results) == 2:
+				finished.set()
+		worker.request ('skipped', lambda key: False, done, M.rasterize_traces, trace, [0], 0, 10, 1.0)
+		worker.request ('a', lambda key: True, done, M.rasterize_traces, trace, [0], 0, 10, 1.0)
+		worker.request ('b', lambda key: True, done, M.rasterize_traces, trace, [1], 0, 10, 1.0)
+		finished.wait (5)
+		self.assertEqual (sorted (results), ['a', 'b'])
+		self.assertEqual (results['a'].shape, (20, 10, 4))
+		
+	def test3 (self):
+		'''The overview shades each channel's band by its edges per column.'''
+		trace = pattern_trace()
+		counts = np.array ([M.activity_counts (trace, c, 10) for c in (0, 1)])
+		self.assertEqual (list (counts[1]), [0, 0, 0, 1, 0, 0, 1, 0, 0, 0])
+		self.assertEqual (counts[0].sum(), 999)
+		image = M.density_image (counts, 5, 4)
+		self.assertEqual (image.shape, (4, 5, 4))
+		self.assert_((image[0] == image[1]).all() and (image[2] == image[3]).all())
+		self.assert_((image[:2] == (0, 0, 160, 255)).all())	# channel 0 is busiest everywhere
+		self.assert_((image[2, [0, 2, 4]] == M.WHITE).all())	# channel 1 is quiet but for its pulse
+		self.assert_((image[2, [1, 3], 2] < 255).all())
+		wide = M.density_image (counts, 40, 2)
+		self.assertEqual (list (np.flatnonzero (wide[1, :, 0] < 255)), [12, 13, 14, 15, 24, 25, 26, 27])	# a bin spreads over 4 columns
+		
+	def test4 (self):
+		'''A bus is drawn as a lane, crossed where its value changes.'''
+		trace = pattern_trace()
+		bus = trace.add_bus ('bus', [1, 0])
+		image = M.rasterize_traces (trace, [bus], 0, 100, 0.1)
+		black = (image == M.BLACK).all (axis=2)
+		self.assertEqual (list (np.flatnonzero (black[6:20].all (axis=0))), range (0, 100))	# channel 0 changes it in every column
+		image = M.rasterize_traces (trace, [trace.add_bus ('slow', [1])], 0, 100, 0.1)
+		black = (image == M.BLACK).all (axis=2)
+		self.assertEqual (list (np.flatnonzero (black[6:20].all (axis=0))), [29, 59])
+		self.assert_(black[6, :100].all() and black[19, :100].all())
+		
+	def test5 (self):
+		'''Persistence counts each capture once, lined up on the trigger.'''
+		trace = pattern_trace()
+		persistence = M.PersistenceMap (trace, [1], 100)
+		late = TraceData (1000000, 1000, 400, 0xE, np.roll (trace.data, 10))	# pulse 10 samples later
+		early = TraceData (1000000, 1000, 390, 0xE, trace.data.copy())		# trigger 10 samples later
+		persistence.add (late)
+		persistence.add (early)
+		self.assertEqual (persistence.count, 3)
+		self.assertEqual ((persistence.high[0, 45], persistence.low[0, 10]), (3, 3))
+		self.assertEqual (list (persistence.edge[0, 27:32]), [0, 1, 1, 1, 0])	# the pulse rose at 290, 300 and 310
+		self.assertEqual (persistence.low[0, 99], 2)	# the early capture doesn't reach the last column
+		image = persistence.image ([1, 0], range (100))
+		self.assertEqual (image.shape, (40, 100, 4))
+		self.assert_((image[6, 45] == M.BLACK).all())
+		self.assert_((M.BLACK[0] < image[6, 30, 0] < 255))	# high here in only two captures of three
+		self.assert_((image[20:] == M.WHITE).all())	# channel 0 wasn't accumulated
+		self.assert_((persistence.image ([1], [-1, 100]) == M.WHITE).all())
+		
+		
+if __name__ == '__main__':
+	unittest.main()
@@ -20,27 +20,131 @@ This file is part of pyLogicSniffer.
 
 from logic_sniffer_lib import TraceData
 import cPickle
-import time
+import os, sys, tempfile, threading, time
 
 # possible alternative to cPickle is numpy.savetxt, ..loadtxt
 
-def to_file (path, sample):
+# Every to_... writer takes an optional progress callback, which it calls
+# from time to time with the fraction of the work done.  The callback may
+# raise SaveCancelled to abandon the save.
+
+SAVE_BLOCK = 1 << 20	# bytes written by to_file between progress reports
+
+class SaveCancelled (Exception): '''A save was cancelled before it finished.'''
+
+def no_progress (fraction):
+	'''Default progress callback for writers.'''
+	pass
+	
+def _file_mode (path):
+	'''Return the permission bits a save to path should end up with.'''
+	if os.path.exists (path):
+		return os.stat (path).st_mode & 0777
+	umask = os.umask (0)
+	os.umask (umask)
+	return 0666 & ~umask
+	
+def write_atomically (writer, path, *args, **kwargs):
+	'''Call writer (temp_path, *args, **kwargs), then rename the result to path.
+	
+	If the writer fails or is cancelled, the partial file is removed and
+	any existing file at path is left as it was.'''
+	directory, name = os.path.split (os.path.abspath (path))
+	fd, temp_path = tempfile.mkstemp (prefix='.'+name+'.', suffix='.tmp', dir=directory)
+	os.close (fd)
+	try:
+		writer (temp_path, *args, **kwargs)
+		os.chmod (temp_path, _file_mode (path))	# mkstemp makes the file private
+		if sys.platform == 'win32' and os.path.exists (path):
+			os.remove (path)	# Windows can't rename over an existing file
+		os.rename (temp_path, path)
+	except:
+		if os.path.exists (temp_path):
+			os.remove (temp_path)
+		raise
+		
+		
+class BackgroundSave (threading.Thread):
+	'''Run a writer on a worker thread, saving atomically to path.
+	
+	progress (save, fraction) and done (save) are called on the worker
+	thread; GUI code should pass them on with wx.CallAfter.  When done is
+	called, save.error holds a traceback string if the writer failed, and
+	save.cancelled is set if cancel was called.'''
+	def __init__ (self, writer, path, args=(), progress=None, done=None):
+		threading.Thread.__init__ (self, name='save '+path)
+		self.daemon = True
+		self.writer = writer
+		self.path = path
+		self.args = args
+		self.progress = progress
+		self.done = done
+		self.cancelled = threading.Event()
+		self.error = None
+		
+	def cancel (self):
+		'''Ask the writer to stop at its next progress report.'''
+		self.cancelled.set()
+		
+	def report (self, fraction):
+		'''Progress callback for the writer.'''
+		if self.cancelled.is_set():
+			raise SaveCancelled
+		if self.progress is not None:
+			self.progress (self, fraction)
+			
+	def run (self):
+		import traceback
+		try:
+			write_atomically (self.writer, self.path, *self.args, progress=self.report)
+		except SaveCancelled:
+			pass
+		except Exception:
+			self.error = traceback.format_exc()
+		if self.done is not None:
+			self.done (self)
+			
+			
+def to_file (path, sample, progress=no_progress):
+	'''Save SUMP capture data to a file that from_file can load.'''
+	progress (0.0)
+	pickled = cPickle.dumps (sample, 0)
 	with open (path, 'wb') as savefile:
 		savefile.write ('#Sump analyzer sample\n')
 		savefile.write ('#Saved on %s\n' % (time.asctime(),))
-		cPickle.dump (sample, savefile, 0)
+		for start in xrange (0, len (pickled), SAVE_BLOCK):
+			progress (float (start) / len (pickled))
+			savefile.write (pickled[start:start+SAVE_BLOCK])
+	progress (1.0)
 	
 def from_file (path):
 	with open (path, 'rb') as savefile:
 		line = savefile.readline()
-		print line,
+		if line.startswith ('PK'):
+			return _from_zip (path)
+		if line.startswith ('#Sump analyzer text sample'):
+			return from_text_file (path)
 		line = savefile.readline()
-		print line,
 		o = cPickle.load (savefile)
 		return o
 		
 		
-def to_csv (path, capture):
+def _from_zip (path):
+	'''Load capture data from a zip file, which should be a sigrok session.'''
+	import zipfile
+	try:
+		with zipfile.ZipFile (path, 'r') as archive:
+			names = archive.namelist()
+	except zipfile.BadZipfile, e:
+		raise ValueError ('%s: %s' % (path, e))
+	if session_index_name in names:
+		raise ValueError ('%s is a session file; use Open Session to load it' % (path,))
+	if 'metadata' not in names:
+		raise ValueError ('%s is a zip file, but not a sigrok session' % (path,))
+	return from_sigrok (path)
+	
+	
+def to_csv (path, capture, progress=no_progress):
 	'''Save SUMP capture data to a CSV file.'''
 	import csv
 	with open (path, 'wt') as savefile:
@@ -52,15 +156,19 @@ def to_csv (path, capture):
 		writer.writerow (['delay_count', capture.delay_count])
 		writer.writerow (['channel_mask', capture.channel_mask])
 
-		channel_set = capture.channel_set
+		channels = list (capture.channel_set())
 		legends = capture.legends
-		writer.writerow (['Legends'] + [legends.get (x, '') for x in channel_set()])
-		writer.writerow (['Channels'] + list (channel_set()))
+		writer.writerow (['Legends'] + [legends.get (x, u'').encode ('utf-8') for x in channels])
+		writer.writerow (['Channels'] + channels)
 		data = capture.data
-		for i in xrange (capture.read_count):
+		read_count = capture.read_count
+		for i in xrange (read_count):
+			if not i % 4096:
+				progress (float (i) / read_count)
 			def cbit (channel, di=data[i]):
 				return (di >> channel) & 1
-			writer.writerow ([i] + [cbit (c) for c in channel_set()])
+			writer.writerow ([i] + [cbit (c) for c in channels])
+	progress (1.0)
 	
 def from_csv (path):
 	raise NotImplementedError
@@ -71,22 +179,296 @@ def from_csv (path):
 		#~ raise ValueError
 	
 
-def to_text_file (path, sample):
-	import numpy as np
+text_header_fields = ('frequency', 'read_count', 'delay_count', 'channel_mask', 'capture_time')
+text_block_size = 1 << 22	# bytes of sample text parsed at a time
+
+def to_text_file (path, sample, progress=no_progress):
+	'''Save SUMP capture data to a text file, one decimal sample per line.'''
 	with open (path, 'wb') as savefile:
 		savefile.write ('#Sump analyzer text sample\n')
 		savefile.write ('#Saved on %s\n' % (time.asctime(),))
+		for field in text_header_fields[:-1]:
+			savefile.write ('%s=%d\n' % (field, getattr (sample, field)))
+		savefile.write ('capture_time=%r\n' % (sample.capture_time,))
+		for channel, legend in sorted (sample.legends.items()):
+			savefile.write ('legend%d=%s\n' % (channel, legend.encode ('utf-8')))
 		savefile.write ('data\n')
-		np.savetxt (savefile, sample.data)
+		data = sample.data
+		for i in xrange (0, len (data), 65536):
+			progress (float (i) / len (data))
+			savefile.write ('\n'.join (map (str, data[i:i+65536].tolist())))
+			savefile.write ('\n')
+	progress (1.0)
 	
-def from_text_file (savefile):
+def from_text_file (path):
+	'''Load SUMP capture data from a file written by to_text_file.'''
 	import numpy as np
 	values = {}
-	for line in savefile:
-		h, t = line.strip().split ('=', 1)
-		if h in ('frequency', 'read_count', 'delay_count', 'channel_mask'):
-			values[h] = int (t, 0)
-		elif h == 'data':
-			values[h] = np.loadtxt (savefile, np.uint32)
-			break
-	return TraceData (**values)
+	legends = {}
+	with open (path, 'rb') as savefile:
+		for line in iter (savefile.readline, ''):	# a for loop's read-ahead would upset read() below
+			line = line.strip()
+			if not line or line.startswith ('#'):
+				continue
+			if line == 'data':
+				break
+			h, t = line.split ('=', 1)
+			if h == 'capture_time':
+				values[h] = float (t)
+			elif h in text_header_fields:
+				values[h] = int (t, 0)
+			elif h.startswith ('legend'):
+				legends[int (h[6:])] = t.decode ('utf-8')
+		read_count = values['read_count']
+		data = np.empty ((read_count,), dtype=np.uint32)
+		filled = 0
+		tail = ''
+		while True:
+			block = savefile.read (text_block_size)
+			if block:
+				block = tail + block
+				cut = block.rfind ('\n') + 1	# parse whole lines only
+				block, tail = block[:cut], block[cut:]
+				if not block:
+					continue
+			elif tail:
+				block, tail = tail, ''
+			else:
+				break
+			samples = np.fromstring (block, dtype=np.uint32, sep=' ')
+			if filled + len (samples) > read_count:
+				raise ValueError, '%s has more than %d samples' % (path, read_count)
+			data[filled:filled+len (samples)] = samples
+			filled += len (samples)
+	if filled != read_count:
+		raise ValueError, '%s has %d samples, expected %d' % (path, filled, read_count)
+	return TraceData (data=data, legends=legends, **values)
+	
+	
+#===========================================================
+# sigrok session files (.sr) are zip archives holding a version file, an
+# INI-style metadata file, and the samples as a series of raw little-endian
+# "logic" chunks, unitsize bytes per sample.
+
+sigrok_chunk_samples = 1 << 20	# samples per logic chunk written
+sigrok_rate_units = (('GHz', 1000000000), ('MHz', 1000000), ('kHz', 1000), ('Hz', 1))
+
+def sigrok_samplerate_string (frequency):
+	'''Format a sample rate the way sigrok does.'''
+	frequency = int (frequency)
+	for unit, size in sigrok_rate_units:
+		if frequency >= size and frequency % size == 0:
+			return '%d %s' % (frequency // size, unit)
+	return '%d Hz' % (frequency,)
+	
+def sigrok_samplerate_value (text):
+	'''Return the sample rate in Hz from a sigrok samplerate string.'''
+	text = text.strip()
+	for unit, size in sigrok_rate_units:
+		if text.lower().endswith (unit.lower()):
+			return int (round (float (text[:-len (unit)]) * size))
+	return int (text)
+	
+def to_sigrok (path, capture, progress=no_progress):
+	'''Save SUMP capture data to a sigrok session file.'''
+	import zipfile
+	import numpy as np
+	channels = list (capture.channel_set())
+	top_group = max (channels) // 8 if channels else 0
+	unitsize = (1, 2, 4, 4)[top_group]
+	metadata = [
+		'[global]',
+		'sigrok version=0.2.0',
+		'',
+		'[device 1]',
+		'capturefile=logic-1',
+		'total probes=%d' % (unitsize*8,),
+		'samplerate=%s' % (sigrok_samplerate_string (capture.frequency),),
+		'total analog=0',
+		]
+	for channel in xrange (unitsize*8):
+		legend = capture.legends.get (channel, '') or str (channel)
+		metadata.append ('probe%d=%s' % (channel+1, legend.encode ('utf-8')))
+	metadata.append ('unitsize=%d' % (unitsize,))
+	data = capture.data
+	sample_type = '<u%d' % (unitsize,)
+	with zipfile.ZipFile (path, 'w', zipfile.ZIP_DEFLATED) as archive:
+		archive.writestr ('version', '2')
+		archive.writestr ('metadata', '\n'.join (metadata) + '\n')
+		for chunk, start in enumerate (xrange (0, len (data), sigrok_chunk_samples)):
+			progress (float (start) / len (data))
+			samples = data[start:start+sigrok_chunk_samples].astype (sample_type)
+			archive.writestr ('logic-1-%d' % (chunk+1,), samples.tostring())
+	progress (1.0)
+	
+def from_sigrok (path):
+	'''Load capture data from the first device in a sigrok session file.'''
+	import ConfigParser as configparser
+	import StringIO
+	import zipfile
+	import numpy as np
+	with zipfile.ZipFile (path, 'r') as archive:
+		p = configparser.RawConfigParser()
+		p.readfp (StringIO.StringIO (archive.read ('metadata')))
+		device = 'device 1'
+		capturefile = p.get (device, 'capturefile')
+		unitsize = p.getint (device, 'unitsize')
+		probes = p.getint (device, 'total probes')
+		frequency = sigrok_samplerate_value (p.get (device, 'samplerate'))
+		legends = {}
+		for probe in xrange (1, min (probes, 32) + 1):
+			option = 'probe%d' % (probe,)
+			if p.has_option (device, option):
+				name = p.get (device, option).decode ('utf-8')
+				if name not in (str (probe-1), 'D%d' % (probe-1,)):	# keep only real names
+					legends[probe-1] = name
+					
+		def chunk_number (info):
+			suffix = info.filename[len (capturefile):]
+			return int (suffix[1:]) if suffix else 0
+		chunks = [info for info in archive.infolist() 
+				if info.filename == capturefile or info.filename.startswith (capturefile + '-')]
+		chunks.sort (key=chunk_number)
+		read_count = sum (info.file_size for info in chunks) // unitsize
+		data = np.empty ((read_count,), dtype=np.uint32)
+		filled = 0
+		for info in chunks:
+			raw = np.frombuffer (archive.read (info), np.uint8)
+			raw = raw[:len (raw) - len (raw) % unitsize].reshape ((-1, unitsize))[:, :4]
+			samples = np.zeros ((len (raw),), dtype=np.uint32)
+			for byte in xrange (raw.shape[1]):
+				samples |= raw[:, byte].astype (np.uint32) << (8*byte)
+			data[filled:filled+len (samples)] = samples
+			filled += len (samples)
+		capture_time = time.mktime (archive.getinfo ('metadata').date_time + (0, 0, -1))
+	channel_mask = 0
+	for group in xrange (4):	# disable channel groups the device didn't have
+		if group*8 >= probes:
+			channel_mask |= 1 << group
+	return TraceData (frequency, filled, filled, channel_mask, data[:filled], legends, capture_time)
+	
+	
+#===========================================================
+# Session files bundle several capture pages, with their display state and
+# any analyzer pages, into one zip file.  The session index is read
+# eagerly; each capture's samples are only decoded when they're asked for.
+
+session_index_name = 'session.ini'
+session_version = 1
+trace_header_fields = ('frequency', 'read_count', 'delay_count', 'channel_mask')
+
+class SessionTab (object):
+	'''Description of one notebook page in a saved session.'''
+	def __init__ (self, kind, title, data=None, settings=None, view=None, plugin=None, plugin_settings=None, source=None):
+		self.kind = kind			# 'capture' or 'analyzer'
+		self.title = title			# notebook tab text
+		self.data = data			# TraceData, or None until it's loaded
+		self.settings = settings	# SumpDeviceSettings for a capture page
+		if view is None:
+			view = {}
+		self.view = view			# zoom and scroll positions for a capture page
+		self.plugin = plugin		# analyzer plugin module name
+		self.plugin_settings = plugin_settings	# analyzer plugin settings dict
+		self.source = source		# index of the capture tab an analyzer works on
+		self.header = None			# TraceData fields read from the session index
+		self._archive = None		# (session path, member name) of the capture samples
+		
+	def load_data (self):
+		'''Return this tab's TraceData, decoding the samples on first use.'''
+		if self.data is None and self._archive is not None:
+			import numpy as np
+			import zipfile
+			path, member = self._archive
+			with zipfile.ZipFile (path, 'r') as archive:
+				data = np.frombuffer (archive.read (member), '<u4').astype (np.uint32)
+			self.data = TraceData (data=data, **self.header)
+		return self.data
+		
+		
+def to_session_file (path, tabs, selected=0, progress=no_progress):
+	'''Save a list of SessionTab descriptions in a session file.'''
+	import ConfigParser as configparser
+	import StringIO
+	import zipfile
+	import numpy as np
+	import sump_config_file
+	p = configparser.RawConfigParser()
+	p.optionxform = str	# keep plugin settings keys as they are
+	p.add_section ('session')
+	p.set ('session', 'version', session_version)
+	p.set ('session', 'saved', time.asctime())
+	p.set ('session', 'tabs', len (tabs))
+	p.set ('session', 'selected', selected)
+	with zipfile.ZipFile (path, 'w', zipfile.ZIP_DEFLATED) as archive:
+		for i, tab in enumerate (tabs):
+			progress (float (i) / len (tabs))
+			section = 'tab %d' % (i,)
+			p.add_section (section)
+			p.set (section, 'kind', tab.kind)
+			p.set (section, 'title', tab.title.encode ('utf-8'))
+			if tab.kind == 'capture':
+				data = tab.load_data()
+				for field in trace_header_fields + ('capture_time',):
+					p.set (section, field, repr (getattr (data, field)))
+				for k, v in tab.view.items():
+					p.set (section, k, repr (v))
+				legend_section = section + ' legends'
+				p.add_section (legend_section)
+				for channel, legend in data.legends.items():
+					p.set (legend_section, str (channel), legend.encode ('utf-8'))
+				archive.writestr ('tab%d.samples' % (i,), np.asarray (data.data, '<u4').tostring())
+				if tab.settings is not None:
+					fp = StringIO.StringIO()
+					sump_config_file.write_config (fp, tab.settings)
+					archive.writestr ('tab%d.sump.ini' % (i,), fp.getvalue())
+			elif tab.kind == 'analyzer':
+				p.set (section, 'plugin', tab.plugin)
+				p.set (section, 'source', tab.source)
+				settings_section = section + ' settings'
+				p.add_section (settings_section)
+				for k, v in tab.plugin_settings.items():
+					p.set (settings_section, k, repr (v))
+		fp = StringIO.StringIO()
+		p.write (fp)
+		archive.writestr (session_index_name, fp.getvalue())
+	progress (1.0)
+		
+def from_session_file (path):
+	'''Return (list of SessionTab, selected tab index) from a session file.
+	
+	Only the session index and SUMP settings are read here; each capture
+	tab's samples are decoded by its load_data method.'''
+	import ConfigParser as configparser
+	import StringIO
+	import ast
+	import zipfile
+	import sump_config_file
+	p = configparser.RawConfigParser()
+	p.optionxform = str	# keep plugin settings keys as they were
+	with zipfile.ZipFile (path, 'r') as archive:
+		p.readfp (StringIO.StringIO (archive.read (session_index_name)))
+		if p.getint ('session', 'version') > session_version:
+			raise ValueError, '%s was saved by a newer version of pyLogicSniffer' % (path,)
+		names = set (archive.namelist())
+		tabs = []
+		for i in xrange (p.getint ('session', 'tabs')):
+			section = 'tab %d' % (i,)
+			kind = p.get (section, 'kind')
+			tab = SessionTab (kind, p.get (section, 'title').decode ('utf-8'))
+			if kind == 'capture':
+				header = dict ((field, ast.literal_eval (p.get (section, field))) for field in trace_header_fields + ('capture_time',))
+				header['legends'] = dict ((int (k), v.decode ('utf-8')) for k, v in p.items (section + ' legends'))
+				tab.header = header
+				tab.view = dict ((k, ast.literal_eval (v)) for k, v in p.items (section) 
+						if k not in trace_header_fields + ('capture_time', 'kind', 'title'))
+				tab._archive = (path, 'tab%d.samples' % (i,))
+				settings_name = 'tab%d.sump.ini' % (i,)
+				if settings_name in names:
+					tab.settings = sump_config_file.read_config (StringIO.StringIO (archive.read (settings_name)))
+			elif kind == 'analyzer':
+				tab.plugin = p.get (section, 'plugin')
+				tab.source = p.getint (section, 'source')
+				tab.plugin_settings = dict ((k, ast.literal_eval (v)) for k, v in p.items (section + ' settings'))
+			tabs.append (tab)
+		selected = p.getint ('session', 'selected')
+	return tabs, selected
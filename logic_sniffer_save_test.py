@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer save and restore functions.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os, shutil, tempfile, unittest
+import numpy as np
+import sump
+import logic_sniffer_save as M
+from logic_sniffer_lib import TraceData
+
+def sample_trace (read_count=1000):
+	'''TraceData with a recognizable pattern of samples.'''
+	data = (np.arange (read_count, dtype=np.uint32) * 2654435761) & 0xFFFFFFFF
+	return TraceData (1000000, read_count, read_count/2, 0xC, data.astype (np.uint32), {0:'clk', 3:u'dé'})
+
+class SaveTestCase (unittest.TestCase):
+	def setUp (self):
+		fd, self.path = tempfile.mkstemp()
+		os.close (fd)
+			
+	def tearDown (self):
+		os.remove (self.path)
+		
+	def assertSameTrace (self, expected, actual):
+		for field in ('frequency', 'read_count', 'delay_count', 'channel_mask', 'legends'):
+			self.assertEqual (getattr (expected, field), getattr (actual, field))
+		self.assertEqual (actual.data.dtype, np.uint32)
+		self.assert_((expected.data == actual.data).all())
+
+
+class TestTextFile (SaveTestCase):
+	'''Test the text sample format.'''
+	def test0 (self):
+		'''Round trip through a text file.'''
+		trace = sample_trace()
+		M.to_text_file (self.path, trace)
+		actual = M.from_text_file (self.path)
+		self.assertSameTrace (trace, actual)
+		self.assertEqual (trace.capture_time, actual.capture_time)
+		self.assertSameTrace (trace, M.from_file (self.path))
+		
+	def test1 (self):
+		'''Samples split across many small read blocks.'''
+		trace = sample_trace (100)
+		M.to_text_file (self.path, trace)
+		block_size = M.text_block_size
+		M.text_block_size = 7
+		try:
+			actual = M.from_text_file (self.path)
+		finally:
+			M.text_block_size = block_size
+		self.assertSameTrace (trace, actual)
+		
+	def test2 (self):
+		'''Truncated sample data.'''
+		trace = sample_trace (100)
+		M.to_text_file (self.path, trace)
+		with open (self.path, 'rb') as f:
+			text = f.read()
+		with open (self.path, 'wb') as f:
+			f.write (text[:-20])
+		self.assertRaises (ValueError, M.from_text_file, self.path)
+		
+		
+class TestSigrokFile (SaveTestCase):
+	'''Test sigrok session export and import.'''
+	def test0 (self):
+		'''Round trip through a sigrok file, in several chunks.'''
+		trace = sample_trace (2500)
+		chunk_samples = M.sigrok_chunk_samples
+		M.sigrok_chunk_samples = 1000
+		try:
+			M.to_sigrok (self.path, trace)
+		finally:
+			M.sigrok_chunk_samples = chunk_samples
+		actual = M.from_file (self.path)
+		self.assertEqual (actual.frequency, trace.frequency)
+		self.assertEqual (actual.read_count, trace.read_count)
+		self.assertEqual (actual.channel_mask, 0xC)		# 16 probes
+		self.assertEqual (actual.legends, trace.legends)
+		self.assert_((actual.data == trace.data & 0xFFFF).all())
+		
+	def test1 (self):
+		'''Sample rate strings.'''
+		self.assertEqual (M.sigrok_samplerate_string (200000000), '200 MHz')
+		self.assertEqual (M.sigrok_samplerate_string (1500000), '1500 kHz')
+		self.assertEqual (M.sigrok_samplerate_value ('1.5 MHz'), 1500000)
+		self.assertEqual (M.sigrok_samplerate_value ('10 Hz'), 10)
+		
+	def test2 (self):
+		'''Zip files that aren't sigrok sessions.'''
+		import zipfile
+		with zipfile.ZipFile (self.path, 'w') as archive:
+			archive.writestr ('readme.txt', 'not a capture')
+		self.assertRaises (ValueError, M.from_file, self.path)
+		M.to_session_file (self.path, [])
+		self.assertRaises (ValueError, M.from_file, self.path)
+		with open (self.path, 'wb') as f:
+			f.write ('PK and nothing more')
+		self.assertRaises (ValueError, M.from_file, self.path)
+		
+		
+class TestSessionFile (SaveTestCase):
+	'''Test saving several pages in one session file.'''
+	def test0 (self):
+		trace = sample_trace()
+		settings = sump.SumpDeviceSettings()
+		settings.divider = 7
+		settings.trigger_mask[2] = 5
+		tabs = [
+			M.SessionTab ('capture', u'Capture A', trace, settings, {'zoom':4, 'timescroll':10, 'tracescroll':0}),
+			M.SessionTab ('analyzer', u'SPI 2', plugin='analyzer_tool_spi'
+					, plugin_settings={'sck':1, 'leading':'MSB', 'master':True}, source=0),
+			]
+		M.to_session_file (self.path, tabs, 1)
+		
+		actual, selected = M.from_session_file (self.path)
+		self.assertEqual (selected, 1)
+		self.assertEqual ([t.kind for t in actual], ['capture', 'analyzer'])
+		capture, analyzer = actual
+		self.assertEqual (capture.title, u'Capture A')
+		self.assertEqual (capture.view, {'zoom':4, 'timescroll':10, 'tracescroll':0})
+		self.assertEqual ((capture.settings.divider, capture.settings.trigger_mask), (7, [0, 0, 5, 0]))
+		self.assert_(capture.data is None)	# samples aren't read until they're asked for
+		self.assertSameTrace (trace, capture.load_data())
+		self.assertEqual (analyzer.plugin, 'analyzer_tool_spi')
+		self.assertEqual (analyzer.source, 0)
+		self.assertEqual (analyzer.plugin_settings, {'sck':1, 'leading':'MSB', 'master':True})
+		
+		
+class TestBackgroundSave (unittest.TestCase):
+	'''Test atomic saving on a worker thread.'''
+	def setUp (self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join (self.directory, 'capture.csv')
+		
+	def tearDown (self):
+		shutil.rmtree (self.directory)
+		
+	def run_save (self, progress=None):
+		trace = sample_trace (10000).snapshot()
+		save = M.BackgroundSave (M.to_csv, self.path, (trace,), progress=progress)
+		save.start()
+		save.join()
+		return save
+		
+	def test0 (self):
+		'''A completed save.'''
+		fractions = []
+		save = self.run_save (lambda save, fraction: fractions.append (fraction))
+		self.assert_(save.error is None)
+		self.assertEqual (os.listdir (self.directory), ['capture.csv'])
+		self.assertEqual (fractions[0], 0.0)
+		self.assertEqual (fractions[-1], 1.0)
+		
+	def test1 (self):
+		'''A cancelled save leaves an existing file alone, and no partial file.'''
+		with open (self.path, 'wt') as f:
+			f.write ('old')
+		save = self.run_save (lambda save, fraction: save.cancel())
+		self.assert_(save.error is None)
+		self.assertEqual (os.listdir (self.directory), ['capture.csv'])
+		with open (self.path, 'rt') as f:
+			self.assertEqual (f.read(), 'old')
+			
+	def test2 (self):
+		'''A failed save reports its error.'''
+		save = M.BackgroundSave (M.to_csv, self.path, (None,))
+		save.start()
+		save.join()
+		self.assert_('AttributeError' in save.error)
+		self.assertEqual (os.listdir (self.directory), [])
+		
+	def test3 (self):
+		'''A save gets the umask's permissions, or keeps those of the file it replaces.'''
+		umask = os.umask (022)
+		try:
+			self.run_save()
+			self.assertEqual (os.stat (self.path).st_mode & 0777, 0644)
+			os.chmod (self.path, 0600)
+			self.run_save()
+			self.assertEqual (os.stat (self.path).st_mode & 0777, 0600)
+		finally:
+			os.umask (umask)
+			
+	def test4 (self):
+		'''A native save can be cancelled part way through.'''
+		fractions = []
+		def cancel_later (save, fraction):
+			fractions.append (fraction)
+			if fraction > 0:
+				save.cancel()
+		save = M.BackgroundSave (M.to_file, self.path, (sample_trace (200000).snapshot(),), progress=cancel_later)
+		save.start()
+		save.join()
+		self.assert_(save.error is None)
+		self.assert_(0 < fractions[-1] < 1)
+		self.assertEqual (os.listdir (self.directory), [])
+		
+		
+unittest.main()
@@ -0,0 +1,246 @@
+# -*- coding: UTF-8 -*-
+'''Import Value Change Dump (VCD) files as pyLogicSniffer trace data.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+# A VCD file is read in two streaming passes: the first collects the
+# declarations and the time span of the dump, the second resamples the
+# value changes onto a uniform sample clock.  Only the sample array itself
+# is held in memory, so simulator dumps much larger than RAM can be read.
+
+import numpy as np
+from fractions import gcd
+from logic_sniffer_lib import TraceData
+
+MAX_CHANNELS = 32
+MAX_SAMPLES = 1 << 24	# largest sample array we'll build (64MB of uint32)
+CHUNK_SIZE = 1 << 16	# value changes collected before they're filled into the samples
+
+timescale_units = {'s':1, 'ms':1e3, 'us':1e6, 'ns':1e9, 'ps':1e12, 'fs':1e15}	# time units per second
+
+class VcdError (StandardError): '''Errors raised while reading a VCD file.'''
+
+
+def _tokens (vcdfile):
+	'''Yield the whitespace-separated tokens of a VCD file.'''
+	for line in vcdfile:
+		for token in line.split():
+			yield token
+
+def _skip_to_end (tokens):
+	'''Return the tokens of a declaration, up to its $end.'''
+	result = []
+	for token in tokens:
+		if token == '$end':
+			return result
+		result.append (token)
+	raise VcdError, 'Unterminated declaration at end of file'
+
+def parse_timescale (words):
+	'''Return the length in seconds of one VCD time unit.'''
+	text = ''.join (words)
+	number = text.rstrip ('fpnumsFPNUMS')
+	unit = text[len (number):].lower()
+	if number not in ('1', '10', '100') or unit not in timescale_units:
+		raise VcdError, 'Bad $timescale: %r' % (text,)
+	return int (number) / float (timescale_units[unit])
+
+
+#===========================================================
+class VcdSignal (object):
+	'''A single-bit VCD variable mapped onto a trace channel.'''
+	def __init__ (self, ident, name, scope, channel=None):
+		self.ident = ident		# VCD short identifier code
+		self.name = name		# reference name, for the legend
+		self.scope = scope		# enclosing scope names
+		self.channel = channel	# trace channel, if the signal is selected
+
+	def full_name (self):
+		return '.'.join (self.scope + [self.name])
+
+
+class VcdHeader (object):
+	'''Declarations and time span of a VCD file.'''
+	def __init__ (self):
+		self.timescale = 1e-9	# seconds per VCD time unit
+		self.signals = []		# single-bit variables, in declaration order
+		self.start_time = None	# first timestamp in the dump
+		self.end_time = None	# last timestamp in the dump
+		self.tick_gcd = 0		# GCD of all timestamps relative to start_time
+
+	def natural_frequency (self):
+		'''Return the coarsest sample rate that still resolves every timestamp.'''
+		ticks = self.tick_gcd or 1
+		return 1.0 / (self.timescale * ticks)
+
+	def select (self, names=None):
+		'''Map signals onto channels, in order, returning the selected signals.
+
+		names is a list of signal names (short or hierarchical) to map onto
+		channels 0, 1, 2, ...; by default the first 32 single-bit signals
+		are used.'''
+		for s in self.signals:
+			s.channel = None
+		if names is None:
+			selected = self.signals[:MAX_CHANNELS]
+		else:
+			if len (names) > MAX_CHANNELS:
+				raise VcdError, 'At most %d signals can be imported' % (MAX_CHANNELS,)
+			selected = []
+			for name in names:
+				for s in self.signals:
+					if name in (s.name, s.full_name()):
+						selected.append (s)
+						break
+				else:
+					raise VcdError, 'No single-bit signal named %r' % (name,)
+		for channel, s in enumerate (selected):
+			s.channel = channel
+		return selected
+
+
+def _read_declarations (tokens):
+	'''Parse the VCD header up to $enddefinitions.'''
+	header = VcdHeader()
+	scope = []
+	for token in tokens:
+		if token == '$enddefinitions':
+			_skip_to_end (tokens)
+			return header
+		elif token == '$timescale':
+			header.timescale = parse_timescale (_skip_to_end (tokens))
+		elif token == '$scope':
+			words = _skip_to_end (tokens)
+			scope.append (words[-1])
+		elif token == '$upscope':
+			_skip_to_end (tokens)
+			if scope:
+				scope.pop()
+		elif token == '$var':
+			words = _skip_to_end (tokens)	# type size ident reference [bit-select]
+			if len (words) >= 4 and words[1] == '1':
+				header.signals.append (VcdSignal (words[2], ''.join (words[3:]), list (scope)))
+		elif token.startswith ('$'):
+			_skip_to_end (tokens)	# $date, $version, $comment, ...
+	raise VcdError, 'No $enddefinitions in VCD file'
+
+def scan_vcd (path):
+	'''First pass: return the VcdHeader of a VCD file, with its time span.'''
+	with open (path, 'rt') as vcdfile:
+		tokens = _tokens (vcdfile)
+		header = _read_declarations (tokens)
+		start = end = None
+		ticks = 0
+		for token in tokens:
+			c = token[0]
+			if c == '#':
+				t = int (token[1:])
+				if start is None:
+					start = t
+				else:
+					ticks = gcd (ticks, t - start)
+				end = t
+			elif c in 'bBrR':
+				tokens.next()	# skip the identifier of a vector or real value
+			elif token == '$comment':
+				_skip_to_end (tokens)
+	if start is None:
+		raise VcdError, 'No timestamps in VCD file'
+	header.start_time, header.end_time, header.tick_gcd = start, end, ticks
+	return header
+
+
+#===========================================================
+def _fill_runs (data, starts, values):
+	'''Fill data[starts[i]:starts[i+1]] with values[i] for all but the last run.'''
+	starts = np.array (starts, np.int64)
+	runs = np.diff (starts)
+	data[starts[0]:starts[-1]] = np.repeat (np.array (values[:-1], np.uint32), runs)
+
+def read_vcd (path, frequency=None, signals=None, max_samples=MAX_SAMPLES):
+	'''Read a VCD file into a TraceData sampled at frequency Hz.
+
+	If frequency is None, the sample rate is inferred from the timescale and
+	the timestamps actually present in the dump.  signals optionally names
+	the signals to put on channels 0, 1, 2, ...'''
+	header = scan_vcd (path)
+	selected = header.select (signals)
+	if not selected:
+		raise VcdError, 'No single-bit signals in VCD file'
+	if frequency is None:
+		frequency = header.natural_frequency()
+		ticks_per_sample = float (header.tick_gcd or 1)
+	else:
+		ticks_per_sample = 1.0 / (frequency * header.timescale)
+	frequency = int (round (frequency))	# analyzers count whole samples per bit
+	start_time = header.start_time
+	def sample_index (t):
+		'''First sample taken at or after VCD time t.'''
+		return int (np.ceil ((t - start_time) / ticks_per_sample - 1e-9))
+	read_count = sample_index (header.end_time) + 1
+	if read_count > max_samples:
+		raise VcdError, '%d samples at %g Hz is more than the limit of %d; use a lower sample rate' % (read_count, frequency, max_samples)
+
+	bits = {}	# VCD ident -> channel bits it drives
+	for s in selected:
+		bits[s.ident] = bits.get (s.ident, 0) | (1 << s.channel)
+	data = np.zeros ((read_count,), dtype=np.uint32)
+	value = 0
+	starts, values = [0], [0]	# pending runs: value[i] holds from sample starts[i]
+	with open (path, 'rt') as vcdfile:
+		tokens = _tokens (vcdfile)
+		_read_declarations (tokens)
+		for token in tokens:
+			c = token[0]
+			if c == '#':
+				values[-1] = value	# value settled at the previous timestamp
+				i = sample_index (int (token[1:]))
+				if i != starts[-1]:
+					starts.append (i)
+					values.append (value)
+					if len (starts) >= CHUNK_SIZE:
+						_fill_runs (data, starts, values)
+						starts, values = starts[-1:], values[-1:]
+				continue
+			elif c in '01xXzZ':
+				level, ident = c == '1', token[1:]
+			elif c in 'bB':
+				level, ident = token[-1] == '1', tokens.next()
+			elif c in 'rR':
+				tokens.next()	# real values can't be shown as a logic channel
+				continue
+			elif token == '$comment':
+				_skip_to_end (tokens)
+				continue
+			else:	# $dumpvars, $dumpoff, $end and the like
+				continue
+			b = bits.get (ident, 0)
+			if level:
+				value |= b
+			else:
+				value &= ~b
+	values[-1] = value
+	starts.append (read_count)
+	values.append (value)
+	_fill_runs (data, starts, values)
+
+	channel_mask = 0
+	for group in xrange (4):	# disable channel groups with no signals in them
+		if not [s for s in selected if s.channel // 8 == group]:
+			channel_mask |= 1 << group
+	legends = dict ((s.channel, s.name) for s in selected)
+	return TraceData (frequency, read_count, read_count, channel_mask, data, legends)
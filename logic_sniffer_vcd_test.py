@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+'''Unit tests for pyLogicSniffer VCD import.
+Copyright © 2011, Mel Wilson mwilson@melwilsonsoftware.ca
+
+This file is part of pyLogicSniffer.
+
+    pyLogicSniffer is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pyLogicSniffer is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with pyLogicSniffer.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os, tempfile, unittest
+import numpy as np
+import logic_sniffer_vcd as M
+
+sample_vcd = '''$date today $end
+$timescale 1 ns $end
+$scope module top $end
+$var wire 1 ! clk $end
+$var wire 1 " data $end
+$var wire 8 # bus [7:0] $end
+$scope module sub $end
+$var reg 1 $ en $end
+$upscope $end
+$upscope $end
+$enddefinitions $end
+$dumpvars
+0!
+1"
+b00000000 #
+x$
+$end
+#0
+#10
+1!
+b1 $
+#20
+0!
+0"
+#25
+b00001111 #
+#30
+1!
+#40
+'''
+
+class VcdTestCase (unittest.TestCase):
+	def setUp (self):
+		fd, self.path = tempfile.mkstemp ('.vcd')
+		with os.fdopen (fd, 'wt') as f:
+			f.write (sample_vcd)
+			
+	def tearDown (self):
+		os.remove (self.path)
+
+
+class TestScanVcd (VcdTestCase):
+	'''Test the declaration and time-span pass.'''
+	def test0 (self):
+		header = M.scan_vcd (self.path)
+		self.assertEqual (header.timescale, 1e-9)
+		self.assertEqual ((header.start_time, header.end_time, header.tick_gcd), (0, 40, 5))
+		self.assertEqual ([s.full_name() for s in header.signals], ['top.clk', 'top.data', 'top.sub.en'])
+		
+	def test1 (self):
+		'''Test the timescale parser.'''
+		self.assertEqual (M.parse_timescale (['10ps']), 10e-12)
+		self.assertEqual (M.parse_timescale (['100', 'us']), 100e-6)
+		self.assertRaises (M.VcdError, M.parse_timescale, ['3', 'ns'])
+
+
+class TestReadVcd (VcdTestCase):
+	'''Test resampling value changes onto a sample clock.'''
+	def test0 (self):
+		'''Sample rate inferred from the timestamps.'''
+		d = M.read_vcd (self.path)
+		self.assertEqual (d.frequency, 200000000)
+		self.assertEqual (d.read_count, 9)
+		self.assertEqual (d.channel_mask, 0xE)
+		self.assertEqual (d.legends, {0:'clk', 1:'data', 2:'en'})
+		self.assert_((d.data == [2, 2, 7, 7, 4, 4, 5, 5, 5]).all())
+		
+	def test1 (self):
+		'''Explicit sample rate, filled over several chunks.'''
+		chunk_size = M.CHUNK_SIZE
+		M.CHUNK_SIZE = 2
+		try:
+			d = M.read_vcd (self.path, 1e9)
+		finally:
+			M.CHUNK_SIZE = chunk_size
+		self.assertEqual (d.read_count, 41)
+		expected = np.repeat ([2, 7, 4, 5, 5], [10, 10, 10, 10, 1])
+		self.assert_((d.data == expected).all())
+		
+	def test2 (self):
+		'''Selected signals, by short and hierarchical names.'''
+		d = M.read_vcd (self.path, signals=['en', 'top.clk'])
+		self.assertEqual (d.legends, {0:'en', 1:'clk'})
+		self.assert_((d.data == [0, 0, 3, 3, 1, 1, 3, 3, 3]).all())
+		self.assertRaises (M.VcdError, M.read_vcd, self.path, signals=['bus'])
+		
+	def test3 (self):
+		'''Sample count limit.'''
+		self.assertRaises (M.VcdError, M.read_vcd, self.path, 1e12, max_samples=1000)
+		
+		
+unittest.main()
@@ -19,6 +19,7 @@ This file is part of pyLogicSniffer.
 '''
 import ConfigParser as configparser
 import sump
+from logic_sniffer_save import no_progress
 
 sump_int_parms = ['divider', 'read_count', 'delay_count', 'inverted',
 		'external', 'filter', 'demux', 'channel_groups', 
@@ -29,8 +30,8 @@ trigger_int_parms = ['trigger_mask', 'trigger_values',
 		'trigger_serial', 'trigger_start'
 		]
 	
-def save_config (path, config):
-	'''Save SUMP device settings to a config file.'''
+def write_config (fp, config):
+	'''Write SUMP device settings to an open file.'''
 	p = configparser.RawConfigParser()
 	p.add_section ('sump')
 	for parm in sump_int_parms:
@@ -42,13 +43,12 @@ def save_config (path, config):
 		p.add_section (section)
 		for parm in trigger_int_parms:
 			p.set (section, parm, int (getattr (config, parm)[stage]))
-	with open (path, 'wt') as fp:
-		p.write (fp)
-			
-def load_config (path):
-	'''Load SUMP device settings from a config file.'''
+	p.write (fp)
+	
+def read_config (fp):
+	'''Read SUMP device settings from an open file.'''
 	p = configparser.RawConfigParser()
-	p.read ([path])
+	p.readfp (fp)
 	c = sump.SumpDeviceSettings()
 	for parm in sump_int_parms:
 		setattr (c, parm, p.getint ('sump', parm))
@@ -60,3 +60,15 @@ def load_config (path):
 			attr = getattr (c, parm)
 			attr[stage] = p.getint (section, parm)
 	return c
+	
+def save_config (path, config, progress=no_progress):
+	'''Save SUMP device settings to a config file.'''
+	progress (0.0)
+	with open (path, 'wt') as fp:
+		write_config (fp, config)
+	progress (1.0)
+			
+def load_config (path):
+	'''Load SUMP device settings from a config file.'''
+	with open (path, 'rt') as fp:
+		return read_config (fp)